@@ -4,6 +4,31 @@ import _ from 'lodash'
 
 const _path = process.cwd().replace(/\\/g, '/')
 
+// 预设面板源目录与数据目录
+const fileSources = [
+  {
+    source: `${_path}/resources/presetPanelData/gs`,
+    target: `${_path}/data/PlayerData/gs`,
+    type: '.json',
+    game: 'gs',
+    downloads: ['100000000.json', '100000001.json']
+  }, {
+    source: `${_path}/resources/presetPanelData/sr`,
+    target: `${_path}/data/PlayerData/sr`,
+    type: '.json',
+    game: 'sr',
+    downloads: ['100000000.json']
+  }
+]
+
+// 源目录监听器与各文件的防抖定时器，插件重载时先关闭旧的监听器
+let watchers = []
+const reloadTimers = new Map()
+
+// panel-tools.py 紧凑格式的标识与版本
+const PACK_FORMAT = 'presetPanel-pack'
+const PACK_VERSION = 1
+
 const replace_list = [
   '极限',
   '核爆'
@@ -31,9 +56,35 @@ export class presetPanel extends plugin {
    */
   async init () {
     await this.setupPanelData()
+    this.watchPanelData()
     logger.mark('预设面板数据已自动加载完成')
   }
 
+  /**
+   * 监听源目录，面板文件被脚本 (如 panel-tools.py watch) 更新后自动刷新
+   */
+  watchPanelData () {
+    watchers.forEach(w => w.close())
+    reloadTimers.forEach(timer => clearTimeout(timer))
+    reloadTimers.clear()
+    watchers = fileSources.filter(v => fs.existsSync(v.source)).map(v => fs.watch(v.source, (event, file) => {
+      // 脚本先写入临时文件再重命名，只关心 .json 文件；同一文件短时间内的多次变化合并为一次，只刷新变化的文件
+      if (!file?.endsWith(v.type)) return
+      const key = `${v.game}/${file}`
+      clearTimeout(reloadTimers.get(key))
+      reloadTimers.set(key, setTimeout(() => {
+        reloadTimers.delete(key)
+        if (!fs.existsSync(`${v.source}/${file}`)) return
+        try {
+          if (!fs.existsSync(v.target)) fs.mkdirSync(v.target, { recursive: true })
+          if (this._installFile(v, file)) logger.mark(`预设面板文件 ${file} 已更新，数据已自动刷新`)
+        } catch (error) {
+          logger.error(`刷新预设面板文件 ${file} 时出错:`, error)
+        }
+      }, 1000))
+    }))
+  }
+
   /**
    * 接受消息，进行关键词替换
    */
@@ -80,23 +131,46 @@ export class presetPanel extends plugin {
     return true
   }
 
-  async setupPanelData () {
-    const fileSources = [
-      {
-        source: `${_path}/resources/presetPanelData/gs`,
-        target: `${_path}/data/PlayerData/gs`,
-        type: '.json',
-        game: 'gs',
-        downloads: ['100000000.json', '100000001.json']
-      }, {
-        source: `${_path}/resources/presetPanelData/sr`,
-        target: `${_path}/data/PlayerData/sr`,
-        type: '.json',
-        game: 'sr',
-        downloads: ['100000000.json']
-      }
-    ]
+  /**
+   * 将 panel-tools.py 生成的紧凑格式展开为原面板格式，格式、版本不符或引用了不存在的部位模板时抛出错误
+   */
+  _unpack (pack) {
+    if (pack?.format !== PACK_FORMAT) throw new Error('不是紧凑格式的面板文件')
+    if (pack.version !== PACK_VERSION) throw new Error(`不支持的紧凑格式版本 ${pack.version}`)
+    if (!_.isPlainObject(pack.templates) || !_.isPlainObject(pack.avatars)) throw new Error('缺少 templates 或 avatars')
+    const expand = (piece, avatarId) => {
+      if (typeof piece !== 'string') return piece
+      const template = pack.templates[piece]
+      if (!_.isPlainObject(template)) throw new Error(`角色 ${avatarId} 引用的模板 ${piece} 不存在`)
+      return _.mapValues(template, (value, key) => key === 'attrIds' ? value.flatMap(([id, count]) => Array(count).fill(id)) : value)
+    }
+    const avatars = _.mapValues(pack.avatars, (avatar, avatarId) => _.isPlainObject(avatar.artis) ? { ...avatar, artis: _.mapValues(avatar.artis, piece => expand(piece, avatarId)) } : avatar)
+    return { ...pack.header, avatars }
+  }
+
+  /**
+   * 将源目录中的一个面板文件写入数据目录，紧凑格式文件 (*.pack.json) 展开为原格式，同名的普通文件优先；返回是否写入
+   */
+  _installFile (v, f) {
+    if (!f.endsWith('.pack.json')) {
+      fs.copyFileSync(`${v.source}/${f}`, `${v.target}/${f}`)
+      return true
+    }
+    const name = f.replace(/\.pack\.json$/, '.json')
+    if (fs.existsSync(`${v.source}/${name}`)) return false
+    // 损坏的紧凑格式文件跳过，不写入缺少圣遗物数据的角色
+    let data
+    try {
+      data = this._unpack(JSON.parse(fs.readFileSync(`${v.source}/${f}`, 'utf8')))
+    } catch (err) {
+      logger.error(`紧凑格式面板文件 ${f} 无法展开，已跳过: ${err.message}`)
+      return false
+    }
+    fs.writeFileSync(`${v.target}/${name}`, JSON.stringify(data, null, 2))
+    return true
+  }
 
+  async setupPanelData () {
     const baseUrl = 'https://raw.xn--6rtu33f.top/kvcfdd/yunzai-js/refs/heads/main/json/'
 
     try {
@@ -140,9 +214,7 @@ export class presetPanel extends plugin {
           continue
         }
 
-        for (const f of filesToCopy) {
-          fs.copyFileSync(`${v.source}/${f}`, `${v.target}/${f}`)
-        }
+        for (const f of filesToCopy) this._installFile(v, f)
         logger.mark(`${v.game === 'gs' ? '原神' : '星铁'} 预设数据已复制 ${filesToCopy.length} 个文件。`)
       }
       return true
@@ -1,8 +1,18 @@
+import argparse
+import concurrent.futures
+import contextlib
+import difflib
 import json
 import math
 import os
+import sys
+import time
 from collections import defaultdict
 
+from panel_common import (CPROFILE_ENV, PROFILE_ENV, DataFileError, PanelDataParser, PanelService, add_name, allocate_rolls, build_name_index, canonical_panel,
+                          check_spec, count, dump_json, expand_grid, format_grid_value, load_spec, match_name, parse_json, priority_weights, read_spec_file,
+                          roll_states, start_profiling, timed, timer, write_text_atomic)
+
 # 使用前请先修改以下路径
 # 星铁极限面板文件
 HSR_TARGET_JSON_FILE = 'Yunzai/resources/presetPanelData/sr/100000000.json'
@@ -12,15 +22,53 @@ HSR_CHAR_DATA_FILE = 'miao-plugin/resources/meta-sr/character/data.json'
 HSR_RELIC_DATA_FILE = 'miao-plugin/resources/meta-sr/artifact/data.json'
 # 光锥数据文件
 HSR_WEAPON_DATA_FILE = 'miao-plugin/resources/meta-sr/weapon/data.json'
+# miao-plugin 元数据的快照缓存目录 (位于用户缓存目录下)，源文件未变化时跳过 JSON 解析，设为 None 可关闭
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'presetPanel')
+# 名称别名文件，格式与 name.js 管理的 char_alias.json 相同: {正式名称: [别名, ...]}，角色、套装与光锥的名称均可，不存在时忽略，设为 None 可关闭
+ALIAS_FILE = 'panel-alias.json'
+# 快照格式版本，索引结构变化时递增以使旧快照失效
+SNAPSHOT_VERSION = 2
+# 面板文件写为紧凑格式 (无缩进，体积约为一半)，也可使用 --compact 参数；插件读取两种格式均可
+COMPACT_OUTPUT = False
 CRIT_RATE_PER_ROLL = 3.24
 
-class StarRailDataParser:
+MODE_NAMES = {'extreme': '极限双暴', 'single_stat': '极限单属性'}
+PIECE_NAMES = {'1': '头部', '2': '手部', '3': '躯干', '4': '脚部', '5': '位面球', '6': '连结绳'}
+FALLBACK_SUBS = ['atk', 'hp', 'def', 'speed', 'effPct', 'stance', 'cdmg', 'cpct']
+# 遗器方案缓存的最大条目数，超出后淘汰最早加入的方案
+PLAN_CACHE_SIZE = 4096
+# 满级5星遗器的主词条数值与单次满值副词条数值，用于审计已有面板 (属性伤害加成统一记为 dmg)
+MAIN_STAT_VALUES = {
+    'hpPlus': 705.6, 'atkPlus': 352.8, 'hp': 43.2, 'atk': 43.2, 'def': 54, 'cpct': 32.4, 'cdmg': 64.8,
+    'heal': 34.56, 'effPct': 43.2, 'speed': 25.03, 'dmg': 38.88, 'stance': 64.8, 'recharge': 19.44
+}
+SUB_STAT_VALUES = {
+    'hpPlus': 42.34, 'atkPlus': 21.17, 'defPlus': 21.17, 'hp': 4.32, 'atk': 4.32, 'def': 5.4,
+    'speed': 2.6, 'cpct': 3.24, 'cdmg': 6.48, 'effPct': 4.32, 'effDef': 4.32, 'stance': 6.48
+}
+# 面板文件中角色与遗器部位的必需字段及类型
+AVATAR_FIELDS = {'name': str, 'id': int, 'elem': str, 'level': int, 'cons': int, 'talent': dict, 'trees': list, 'weapon': dict, 'artis': dict}
+# 写入面板文件时角色与部位字段的固定顺序 (与新生成的面板一致)，未列出的字段按原有顺序排在其后，使输出与写入路径无关
+AVATAR_KEY_ORDER = ['name', 'id', 'elem', 'level', 'promote', 'cons', 'talent', 'trees', 'weapon', 'artis', '_source', '_time', '_update', '_talent']
+PIECE_KEY_ORDER = ['level', 'star', 'id', 'mainId', 'attrIds']
+PIECE_FIELDS = {'level': int, 'id': int, 'mainId': int, 'attrIds': list}
+# 开拓者各命途的角色名为 "穹·毁灭"/"星·毁灭" 等，名称索引中额外加入 "开拓者·毁灭" 与 "开拓者" 作为别名
+TRAILBLAZER_PREFIXES, TRAILBLAZER_ALIAS = ('穹·', '星·'), '开拓者'
+class StarRailDataParser(PanelDataParser):
+    # 数据文件或目标文件不存在时视为空对象
+    missing_ok = True
+
     def __init__(self, char_file, relic_file, weapon_file, target_file):
         self._initialize_maps()
-        self.char_data = self._load_json(char_file)
-        self.relic_data = self._load_json(relic_file)
-        self.weapon_data = self._load_json(weapon_file)
-        self.target_data = self._load_json(target_file)
+        super().__init__({'char': char_file, 'relic': relic_file, 'weapon': weapon_file, 'target': target_file},
+                         {'char': self._index_char_data, 'relic': self._index_relic_data, 'weapon': self._index_weapon_data}, {
+            'char_names': 'char', 'weapon_names': 'weapon', 'piece_ids': 'relic', 'relic_sets': 'relic',
+            'ornament_sets': 'relic', 'relic_by_id': 'relic', 'ornament_by_id': 'relic', 'set_names': 'relic'
+        }, CACHE_DIR, ALIAS_FILE, SNAPSHOT_VERSION)
+
+    char_data = property(lambda self: self._source('char'))
+    relic_data = property(lambda self: self._source('relic'))
+    weapon_data = property(lambda self: self._source('weapon'))
         
     def _initialize_maps(self):
         self.main_stat_map_by_piece = {
@@ -33,45 +81,57 @@ class StarRailDataParser:
             'hpPlus': 1, 'atkPlus': 2, 'defPlus': 3, 'hp': 4, 'atk': 5, 'def': 6, 'speed': 7,
             'cpct': 8, 'cdmg': 9, 'effPct': 10, 'effDef': 11, 'stance': 12
         }
+        # 副词条强化次数 -> attrIds 中的编码 (满值)
+        self.roll_count_to_code = {
+            1: (1, 2), 2: (2, 4), 3: (3, 6),
+            4: (5, 0), 5: (6, 2), 6: (7, 4)
+        }
         self.elem_cn_to_en = { '物理': 'phy', '火': 'fire', '冰': 'ice', '雷': 'elec', '风': 'wind', '量子': 'quantum', '虚数': 'imaginary' }
 
-    def _load_json(self, filepath):
-        if not os.path.exists(filepath): return {}
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f: return json.load(f)
-        except Exception as e:
-            print(f"错误: 加载文件 '{filepath}' 时出错: {e}"); exit()
+    # 名称 -> ID、套装 -> 部位 -> 5星遗器ID 等反查表随数据文件构建一次，避免生成时逐项扫描
+    def _index_char_data(self, char_data):
+        char_names = build_name_index((cinfo.get('name'), cid) for cid, cinfo in char_data.items())
+        for cid, cinfo in char_data.items():
+            name = str(cinfo.get('name') or '')
+            if name.startswith(TRAILBLAZER_PREFIXES):
+                add_name(char_names, TRAILBLAZER_ALIAS + '·' + name.split('·', 1)[1], cid); add_name(char_names, TRAILBLAZER_ALIAS, cid)
+        return {'char_names': char_names}
+
+    def _index_weapon_data(self, weapon_data):
+        return {'weapon_names': build_name_index((winfo.get('name'), wid) for wid, winfo in weapon_data.items())}
+
+    def _index_relic_data(self, relic_data):
+        piece_ids, relic_sets, ornament_sets = {}, [], []
+        for s in sorted(relic_data.values(), key=lambda x: int(x.get('id', 0))):
+            piece_ids[s['id']] = {idx: int(next((item_id for item_id, rarity in piece.get('ids', {}).items() if rarity == 5), 0)) for idx, piece in (s.get('idxs') or {}).items()}
+            if not any(piece_ids[s['id']].values()): continue
+            (relic_sets if int(s['id']) < 200 else ornament_sets).append(s)
+        set_names = build_name_index((s['name'], s['id']) for s in relic_sets + ornament_sets)
+        return {'piece_ids': piece_ids, 'relic_sets': relic_sets, 'ornament_sets': ornament_sets, 'set_names': set_names,
+                'relic_by_id': {s['id']: s for s in relic_sets}, 'ornament_by_id': {s['id']: s for s in ornament_sets}}
 
 class PanelGenerator:
     def __init__(self, data_parser, target_file_path):
         self.parser = data_parser
         self.target_file_path = target_file_path
-        self.relic_sets, self.ornament_sets = self._get_5star_sets()
         self.sub_stat_options = { "攻击": ["atk", "atkPlus"], "生命": ["hp", "hpPlus"], "防御": ["def", "defPlus"], "速度": ["speed"], "暴击率": ["cpct"], "暴击伤害": ["cdmg"], "效果命中": ["effPct"], "效果抵抗": ["effDef"], "击破特攻": ["stance"] }
+        self.sub_stat_groups = {key: keys for keys in self.sub_stat_options.values() for key in keys}
+        self.pending_writes = None
+        self.plan_cache, self.plan_stats = {}, {'hit': 0, 'miss': 0}
 
-    def _get_5star_sets(self):
-        all_sets = sorted(list(self.parser.relic_data.values()), key=lambda x: int(x.get('id', 0)))
-        relics, ornaments = [], []
-        for s in all_sets:
-            is_5star = False
-            if 'idxs' in s and s['idxs']:
-                first_piece_ids = next(iter(s['idxs'].values())).get('ids', {})
-                if any(str(k).startswith('6') for k in first_piece_ids): is_5star = True
-            if not is_5star: continue
-            if int(s['id']) < 200: relics.append(s)
-            else: ornaments.append(s)
-        return relics, ornaments
-
-    def _select_from_list(self, item_dict, prompt, filter_func=None):
+    def _select_from_list(self, item_dict, prompt, filter_func=None, names=None):
         print(f"\n--- {prompt} ---")
         filtered_items = {k: v for k, v in item_dict.items() if (filter_func(v) if filter_func else True)}
         if not filtered_items: print("错误：列表中没有可选项。"); return None, None
         for key, value in sorted(filtered_items.items(), key=lambda item: int(item[0])):
             print(f"ID: {key:<6} 名称: {value['name']}")
         while True:
-            choice = input("请输入ID: ").strip()
+            choice = input("请输入ID或名称: " if names else "请输入ID: ").strip()
             if choice in filtered_items: return choice, filtered_items[choice]
-            else: print("ID无效，请重新输入。")
+            if not names: print("ID无效，请重新输入。"); continue
+            try: item_id = match_name(names, choice, prompt.replace("请选择", ""), accept=lambda item_id: item_id in filtered_items)
+            except ValueError as e: print(f"{e} 请重新输入。"); continue
+            return item_id, filtered_items[item_id]
 
     def _select_sub_stats(self, prompt, exclude=None, min_select=1, max_select=4):
         if exclude is None: exclude = []
@@ -102,156 +162,223 @@ class PanelGenerator:
             print("输入无效，请重新输入。")
 
     def _get_relic_piece_id(self, relic_set_data, piece_index):
-        try:
-            piece_data = relic_set_data['idxs'][str(piece_index)]
-            for item_id, rarity in piece_data['ids'].items():
-                if rarity == 5: return int(item_id)
-            print(f"警告: 在套装 {relic_set_data['name']} 中找不到部位 {piece_index} 的5星遗器ID。"); return 0
-        except KeyError:
+        set_piece_ids = self.parser.index['piece_ids'].get(relic_set_data['id'], {})
+        if str(piece_index) not in set_piece_ids:
             print(f"错误: 无法在套装 {relic_set_data['name']} 中找到部位 {piece_index} 的数据。"); return 0
+        if not set_piece_ids[str(piece_index)]:
+            print(f"警告: 在套装 {relic_set_data['name']} 中找不到部位 {piece_index} 的5星遗器ID。")
+        return set_piece_ids[str(piece_index)]
             
+    def missing_characters(self, target_data=None):
+        # 未传入面板数据时只读取目标文件中的角色ID
+        existing_chars_id = set(target_data.get('avatars', {}).keys() if target_data is not None else self.parser.target_avatar_ids())
+        return sorted((cid for cid in self.parser.char_data if cid not in existing_chars_id), key=int)
+
     def list_missing_characters(self):
-        all_chars = self.parser.char_data
-        existing_chars_id = set(self.parser.target_data.get('avatars', {}).keys())
-        missing_chars = {cid: cinfo for cid, cinfo in all_chars.items() if cid not in existing_chars_id}
-        if not missing_chars: print(f"\n所有角色数据均已存在于 {os.path.basename(self.target_file_path)} 中。")
+        missing_chars_id = self.missing_characters()
+        if not missing_chars_id: print(f"\n所有角色数据均已存在于 {os.path.basename(self.target_file_path)} 中。")
         else:
             print(f"\n--- 以下角色数据尚未写入 {os.path.basename(self.target_file_path)} ---")
-            for char_id, char_info in sorted(missing_chars.items(), key=lambda item: int(item[0])):
-                print(f"ID: {char_id:<6} 名称: {char_info['name']}")
+            for char_id in missing_chars_id:
+                print(f"ID: {char_id:<6} 名称: {self.parser.char_data[char_id]['name']}")
             print("-" * 40)
 
-    def generate(self, mode='extreme'):
-        selected_relic_set = self._select_from_list({s['id']: s for s in self.relic_sets}, "请选择4件套隧洞遗器")[1]
-        selected_ornament_set = self._select_from_list({s['id']: s for s in self.ornament_sets}, "请选择2件套位面饰品")[1]
-        target_char_id, target_char_info = self._select_from_list(self.parser.char_data, "请选择角色")
-        weapon_id, _ = self._select_from_list(self.parser.weapon_data, "请选择5星光锥", filter_func=lambda w: w.get('star') == 5)
-        
-        main_stats = {'1': ('hpPlus', 1), '2': ('atkPlus', 1)}
-        
-        target_cr_upgrades = 0
-        assigned_cr_upgrades = 0
-        user_priority_subs = []
-        
-        if mode == 'single_stat':
-            user_priority_subs = self._select_sub_stats("请选择副词条优先级列表 (至少4个)", min_select=4, max_select=9)
-            if not user_priority_subs: return
+    def spec_avatar_id(self, spec):
+        check_spec(spec)
+        return self._find_item(self.parser.char_data, spec.get('id', spec.get('name')), "角色", self.parser.index['char_names'])[0]
 
-            print("\n--- 请为 极限单属性 模式选择主词条 ---")
-            body_stat = self._get_main_stat_input("躯干", self.parser.main_stat_map_by_piece['3'].keys())
-            main_stats['3'] = (body_stat, self.parser.main_stat_map_by_piece['3'][body_stat])
-            
-            feet_stat = self._get_main_stat_input("脚部", self.parser.main_stat_map_by_piece['4'].keys())
-            main_stats['4'] = (feet_stat, self.parser.main_stat_map_by_piece['4'][feet_stat])
-            
-            sphere_stat = self._get_main_stat_input("位面球", self.parser.main_stat_map_by_piece['5'].keys())
-            main_stats['5'] = (sphere_stat, self.parser.main_stat_map_by_piece['5'][sphere_stat])
+    def _find_item(self, item_dict, key, kind, names, filter_func=None):
+        # 批量配置中可以写 ID、正式名称、别名或名称的一部分 (唯一匹配时)，候选只在 item_dict 中符合 filter_func 的条目中选取
+        key = str(key if key is not None else '').strip()
+        accept = lambda item_id: item_id in item_dict and (not filter_func or filter_func(item_dict[item_id]))
+        if key in item_dict:
+            if not accept(key): raise ValueError(f"找不到{kind} '{key}'。")
+            return key, item_dict[key]
+        item_id = match_name(names, key, kind, accept=accept)
+        return item_id, item_dict[item_id]
+
+    def _expand_sub_stats(self, names, exclude=None, min_select=1, max_select=4):
+        # 副词条可以写选项名 (攻击) 或词条键 (atk)，统一展开为与交互模式相同的词条组
+        if exclude is None: exclude = []
+        if isinstance(names, str): names = [names]
+        groups = []
+        for name in names:
+            keys = self.sub_stat_options.get(name) or self.sub_stat_groups.get(name)
+            if not keys: raise ValueError(f"未知的副词条 '{name}'。")
+            if any(k in exclude for k in keys): raise ValueError(f"副词条 '{name}' 在当前模式下不可选。")
+            if keys not in groups: groups.append(keys)
+        if not (min_select <= len(groups) <= max_select): raise ValueError(f"请选择 {min_select} 到 {max_select} 个副词条。")
+        return [key for group in groups for key in group]
 
-            rope_stat = self._get_main_stat_input("连结绳", self.parser.main_stat_map_by_piece['6'].keys())
-            main_stats['6'] = (rope_stat, self.parser.main_stat_map_by_piece['6'][rope_stat])
+    def _resolve_main_stat(self, spec, field, piece_idx):
+        valid_options = self.parser.main_stat_map_by_piece[piece_idx]
+        stat = next((opt for opt in valid_options if opt.lower() == str(spec.get(field, '')).strip().lower()), None)
+        if stat is None: raise ValueError(f"无效的{PIECE_NAMES[piece_idx]}主词条 '{spec.get(field, '')}' ({'/'.join(valid_options)})。")
+        return stat, valid_options[stat]
 
+    def default_spec(self, char_id, target_data):
+        # 由元数据与同命途 (近似同定位) 角色的已有面板推导默认配置，同属性、最近更新者优先
+        char_info = self.parser.char_data[char_id]
+        candidates = [(info.get('elem') == char_info.get('elem'), avatar.get('_update', 0), avatar_id)
+                      for avatar_id, avatar in target_data.get('avatars', {}).items()
+                      for info in [self.parser.char_data.get(avatar_id)] if info and info.get('weapon') == char_info.get('weapon')]
+        if not candidates: raise ValueError(f"{os.path.basename(self.target_file_path)} 中没有与【{char_info['name']}】命途相同的角色可供参考。")
+        reference = target_data['avatars'][max(candidates)[2]]
+        report = PanelAuditor(self.parser).audit({'avatars': {char_id: reference}})[0]
+        artis = reference.get('artis', {})
+        main_stats = {idx: next((stat for stat, main_id in stat_map.items() if main_id == artis.get(idx, {}).get('mainId')), None) for idx, stat_map in self.parser.main_stat_map_by_piece.items()}
+        set_by_piece_id = {piece_id: set_id for set_id, pieces in self.parser.index['piece_ids'].items() for piece_id in pieces.values() if piece_id}
+        relic, ornament = (set_by_piece_id.get(artis.get(idx, {}).get('id')) for idx in ('1', '5'))
+        if relic is None or ornament is None: raise ValueError(f"参考角色【{reference.get('name')}】的遗器不在遗器数据中。")
+        five_star = lambda w: w.get('star') == 5
+        weapon_id = str(reference.get('weapon', {}).get('id'))
+        if not five_star(self.parser.weapon_data.get(weapon_id, {})):
+            weapon_id = next((wid for wid, w in sorted(self.parser.weapon_data.items()) if five_star(w) and w.get('type') == char_info.get('weapon')), None)
+        if weapon_id is None: raise ValueError(f"光锥数据中没有【{char_info.get('weapon')}】命途的5星光锥。")
+
+        # 躯干为双暴或双暴强化次数过半的参考面板按极限双暴生成，副词条取强化次数最多的词条组
+        mode = 'extreme' if main_stats['3'] in ('cpct', 'cdmg') or report['rolls'].get('cpct', 0) + report['rolls'].get('cdmg', 0) >= 15 else 'single_stat'
+        exclude = {'cpct', 'cdmg'} if mode == 'extreme' else set()
+        group_rolls = defaultdict(float)
+        for stat, n in report['rolls'].items():
+            if stat not in exclude: group_rolls[next(name for name, keys in self.sub_stat_options.items() if stat in keys)] += n
+        subs = [name for name, _ in sorted(group_rolls.items(), key=lambda item: -item[1])]
+        for name in ['攻击', '速度', '生命', '防御']:
+            if name not in subs: subs.append(name)
+
+        spec = {'id': char_id, 'relic': relic, 'ornament': ornament, 'weapon': weapon_id, 'mode': mode,
+                'feet': main_stats['4'] or 'speed', 'rope': main_stats['6'] or 'atk'}
+        if mode == 'extreme':
+            spec['subs'] = subs[:2]
+            # 参考面板遗器提供的暴击率以外的部分视为角色与光锥自带的暴击率 (含基础5%)
+            spec['crit_rate'] = min(100.0, max(0.0, round(105 - report['crit_rate'], 1)))
         else:
-            print("\n[自动配置] 极限双暴模式，自动选择最优主词条：")
-            main_stats['3'] = ('cdmg', self.parser.main_stat_map_by_piece['3']['cdmg'])
-            print("  - 躯干: 暴击伤害")
+            spec.update(subs=subs[:4], body=main_stats['3'] or 'atk', sphere=main_stats['5'] or 'atk')
+        return spec, reference.get('name')
 
-            char_elem_en = self.parser.elem_cn_to_en.get(target_char_info['elem'], 'phy')
-            main_stats['5'] = (char_elem_en, self.parser.main_stat_map_by_piece['5'][char_elem_en])
-            print(f"  - 位面球: {target_char_info['elem']}属性伤害")
+    def fill_missing(self, avatars):
+        # 为 avatars 中缺少的角色按默认配置生成面板并直接加入 avatars，参考角色只从原有面板中选取；返回失败的角色名
+        reference_data, failed = {'avatars': dict(avatars)}, []
+        for char_id in self.missing_characters(reference_data):
+            name = self.parser.char_data[char_id]['name']
+            try:
+                spec, reference_name = self.default_spec(char_id, reference_data)
+                target_char_id, new_char_data, summary = self.build_avatar(spec)
+            except ValueError as e: print(f"跳过【{name}】: {e}"); failed.append(name); continue
+            avatars[target_char_id] = new_char_data
+            cr_info = f" | 暴击率补足 {summary['target_cr_upgrades']} 次强化" if spec['mode'] == 'extreme' else ""
+            print(f"新增 {target_char_id} 【{name}】参考【{reference_name}】{summary['mode_name']} | {summary['relic_name']} + {summary['ornament_name']} | 光锥 {spec['weapon']}{cr_info}")
+        return failed
 
-            feet_stat = self._get_main_stat_input("脚部", self.parser.main_stat_map_by_piece['4'].keys())
-            main_stats['4'] = (feet_stat, self.parser.main_stat_map_by_piece['4'][feet_stat])
-            rope_stat = self._get_main_stat_input("连结绳", self.parser.main_stat_map_by_piece['6'].keys())
-            main_stats['6'] = (rope_stat, self.parser.main_stat_map_by_piece['6'][rope_stat])
-            
-            user_priority_subs = self._select_sub_stats("请选择 2 个填充副词条 (双暴词条用尽后生效)", min_select=2, max_select=2, exclude=['cpct', 'cdmg'])
-            
-            try: total_existing_cr = float(input("请输入角色已有的暴击率 (包括自身天赋/行迹/遗器/光锥提供的总和): ").strip())
-            except ValueError: print("输入无效。"); return
-            
+    def sync_missing(self, dry_run=False):
+        # 为目标文件中缺少的角色按默认配置一次性生成面板，只写入一次；dry_run 时只输出差异
+        target_data = self.parser.target_data
+        avatars = dict(target_data.get('avatars', {}))
+        failed = self.fill_missing(avatars)
+        added = len(avatars) - len(target_data.get('avatars', {}))
+        if not added: print("没有需要补全的角色。")
+        else:
+            new_data = {**target_data, 'avatars': avatars}
+            if dry_run:
+                old_lines, new_lines = (render_panel(data, compact=False).splitlines() for data in (target_data, new_data))
+                print('\n'.join(difflib.unified_diff(old_lines, new_lines, f"a/{self.target_file_path}", f"b/{self.target_file_path}", lineterm='')))
+                print(f"\n预览完成: 将补全 {added} 个角色，失败 {len(failed)} 个 (未写入任何文件)。")
+            else:
+                changed = self._save_target(self.target_file_path, new_data)
+                print(f"\n补全完成: 成功 {added} 个，失败 {len(failed)} 个" + ("。" if changed else "，内容没有变化，跳过写入。"))
+        print(f"遗器方案缓存: 命中 {self.plan_stats['hit']} 次，计算 {self.plan_stats['miss']} 次。")
+        if failed: print(f"失败角色: {', '.join(failed)}")
+        return not failed
+
+    def _piece_subs(self, mode, main_stat_name, user_priority_subs):
+        final_subs = []
+        if mode != 'single_stat':
+            if 'cpct' != main_stat_name: final_subs.append('cpct')
+            if 'cdmg' != main_stat_name: final_subs.append('cdmg')
+        for sub in user_priority_subs + FALLBACK_SUBS:
+            if len(final_subs) >= 4: break
+            if sub not in final_subs and sub != main_stat_name: final_subs.append(sub)
+        return final_subs
+
+    def _plan_rolls(self, mode, main_stats, user_priority_subs, weights, crit_needed=None):
+        piece_subs = [self._piece_subs(mode, main_stats[str(i)][0], user_priority_subs) for i in range(1, 7)]
+        return allocate_rolls(piece_subs, weights, crit_needed=crit_needed, crit_per_roll=CRIT_RATE_PER_ROLL)
+
+    def _build_relics(self, mode, relic_set, ornament_set, main_stats, user_priority_subs, total_existing_cr):
+        # 套装、主词条、副词条优先级、模式与暴击需求相同的角色共用同一份遗器方案，命中时返回各部位的副本
+        key = (mode, relic_set['id'], ornament_set['id'], tuple(sorted(main_stats.items())), tuple(user_priority_subs), total_existing_cr)
+        cached = self.plan_cache.get(key)
+        if cached is None:
+            self.plan_stats['miss'] += 1; count('plan_cache_miss')
+            if len(self.plan_cache) >= PLAN_CACHE_SIZE: self.plan_cache.pop(next(iter(self.plan_cache)))
+            cached = self.plan_cache[key] = self._plan_relics(mode, relic_set, ornament_set, main_stats, user_priority_subs, total_existing_cr)
+        else: self.plan_stats['hit'] += 1; count('plan_cache_hit')
+        artifacts, target_cr_upgrades, notes = cached
+        return {idx: {**piece, 'attrIds': list(piece['attrIds'])} for idx, piece in artifacts.items()}, target_cr_upgrades, list(notes)
+
+    def _plan_relics(self, mode, relic_set, ornament_set, main_stats, user_priority_subs, total_existing_cr):
+        target_cr_upgrades, notes = 0, []
+        if mode == 'single_stat':
+            plan = self._plan_rolls(mode, main_stats, user_priority_subs, priority_weights(user_priority_subs + FALLBACK_SUBS))
+        else:
             cr_needed_from_substats = max(0, 100.0 - total_existing_cr)
-            
-            initial_cr_stats = 6
-            for i in range(3, 7):
-                if main_stats.get(str(i), ('',0))[0] == 'cpct':
-                    initial_cr_stats -= 1
-            
-            cr_from_initial = initial_cr_stats * CRIT_RATE_PER_ROLL
-            cr_needed_from_upgrades = max(0, cr_needed_from_substats - cr_from_initial)
-            
-            target_cr_upgrades = math.floor(cr_needed_from_upgrades / CRIT_RATE_PER_ROLL)
+            # 暴击率达标所需的最少暴击词条，其余强化按 爆伤 > 填充副词条 的顺序分配
+            plan = self._plan_rolls(mode, main_stats, user_priority_subs, priority_weights(['cdmg'] + user_priority_subs + FALLBACK_SUBS), cr_needed_from_substats)
+            initial_cr_stats = sum(1 for rolls in plan['rolls'] if 'cpct' in rolls)
+            target_cr_upgrades = plan['crit_rolls'] - initial_cr_stats
+            cdmg_upgrades = sum(rolls.get('cdmg', 0) - 1 for rolls in plan['rolls'] if 'cdmg' in rolls)
 
-            print(f"\n--- 计算结果 --- \n需要通过副词条补足 {cr_needed_from_substats:.2f}% 暴击率")
-            print(f"将分配 {target_cr_upgrades} 次升级给暴击率，{30 - target_cr_upgrades} 次给暴击伤害")
+            notes.append(f"\n--- 计算结果 --- \n需要通过副词条补足 {cr_needed_from_substats:.2f}% 暴击率")
+            notes.append(f"将分配 {target_cr_upgrades} 次升级给暴击率，{cdmg_upgrades} 次给暴击伤害，副词条暴击率 {plan['crit_rolls'] * CRIT_RATE_PER_ROLL:.2f}%")
+            if not plan['feasible']: notes.append("注意: 副词条已尽可能分配给暴击率，仍无法达到 100% 暴击率。")
 
         artifacts = {}
-        for i in range(1, 7):
+        for i, piece_rolls in enumerate(plan['rolls'], 1):
             piece_idx = str(i)
-            main_stat_name, main_id = main_stats[piece_idx]
-            current_set = selected_relic_set if i <= 4 else selected_ornament_set
+            main_id = main_stats[piece_idx][1]
+            current_set = relic_set if i <= 4 else ornament_set
             piece_id = self._get_relic_piece_id(current_set, i)
             
-            final_subs = []
-            if mode == 'single_stat':
-                priority_order = user_priority_subs
-                for sub in user_priority_subs:
-                    if len(final_subs) >= 4: break
-                    if sub not in final_subs and sub != main_stat_name: final_subs.append(sub)
-            else:
-                priority_order = ['cpct', 'cdmg'] + user_priority_subs
-                if 'cpct' != main_stat_name:
-                    final_subs.append('cpct')
-                if 'cdmg' != main_stat_name:
-                    final_subs.append('cdmg')
-                for sub in user_priority_subs:
-                    if len(final_subs) >= 4: break
-                    if sub not in final_subs and sub != main_stat_name: final_subs.append(sub)
-
-            fallback_subs = ['atk', 'hp', 'def', 'speed', 'effPct', 'stance', 'cdmg', 'cpct']
-            for sub in fallback_subs:
-                if len(final_subs) >= 4: break
-                if sub not in final_subs and sub != main_stat_name: final_subs.append(sub)
-            
-            piece_rolls = {sub: 1 for sub in final_subs}
-            
-            if mode == 'extreme':
-                for _ in range(5):
-                    if assigned_cr_upgrades < target_cr_upgrades and 'cpct' in piece_rolls:
-                        piece_rolls['cpct'] += 1
-                        assigned_cr_upgrades += 1
-                    elif 'cdmg' in piece_rolls:
-                        piece_rolls['cdmg'] += 1
-                    else:
-                        for stat in user_priority_subs:
-                            if stat in piece_rolls:
-                                piece_rolls[stat] += 1
-                                break
-            else:
-                stat_to_upgrade = None
-                for stat in priority_order:
-                    if stat in piece_rolls: 
-                        stat_to_upgrade = stat
-                        break
-                
-                if stat_to_upgrade:
-                    piece_rolls[stat_to_upgrade] += 5
-                else:
-                    print(f"警告：在部位 {piece_idx} 上找不到任何可升级的优先副词条，该部位未升级。")
-            
-            roll_count_to_code = {
-                1: (1, 2), 2: (2, 4), 3: (3, 6),
-                4: (5, 0), 5: (6, 2), 6: (7, 4)
-            }
-            
             attr_ids = []
-            for stat in final_subs:
-                stat_id = self.parser.sub_stat_to_id[stat]
-                count = piece_rolls.get(stat, 1)
-                
-                code1, code2 = roll_count_to_code.get(count, (1, 2))
-                attr_ids.append(f"{stat_id},{code1},{code2}")
+            for stat, count in piece_rolls.items():
+                code1, code2 = self.parser.roll_count_to_code[count]
+                attr_ids.append(f"{self.parser.sub_stat_to_id[stat]},{code1},{code2}")
             
             artifacts[piece_idx] = {"level": 15, "star": 5, "id": piece_id, "mainId": main_id, "attrIds": attr_ids}
+        return artifacts, target_cr_upgrades, notes
+
+    @timed('build_avatar')
+    def build_avatar(self, spec):
+        check_spec(spec)
+        mode = spec.get('mode', 'extreme')
+        if mode not in MODE_NAMES: raise ValueError(f"未知的面板类型 '{mode}'。")
+        index = self.parser.index
+        selected_relic_set = self._find_item(self.parser.index['relic_by_id'], spec.get('relic'), "4件套隧洞遗器", index['set_names'])[1]
+        selected_ornament_set = self._find_item(self.parser.index['ornament_by_id'], spec.get('ornament'), "2件套位面饰品", index['set_names'])[1]
+        target_char_id, target_char_info = self._find_item(self.parser.char_data, spec.get('id', spec.get('name')), "角色", index['char_names'])
+        weapon_id, _ = self._find_item(self.parser.weapon_data, spec.get('weapon'), "5星光锥", index['weapon_names'], filter_func=lambda w: w.get('star') == 5)
+
+        main_stats = {'1': ('hpPlus', 1), '2': ('atkPlus', 1)}
+        total_existing_cr = None
+        
+        if mode == 'single_stat':
+            user_priority_subs = self._expand_sub_stats(spec.get('subs', []), min_select=4, max_select=9)
+            for field, piece_idx in [('body', '3'), ('feet', '4'), ('sphere', '5'), ('rope', '6')]:
+                main_stats[piece_idx] = self._resolve_main_stat(spec, field, piece_idx)
+
+        else:
+            main_stats['3'] = ('cdmg', self.parser.main_stat_map_by_piece['3']['cdmg'])
+            char_elem_en = self.parser.elem_cn_to_en.get(target_char_info['elem'], 'phy')
+            main_stats['5'] = (char_elem_en, self.parser.main_stat_map_by_piece['5'][char_elem_en])
+
+            main_stats['4'] = self._resolve_main_stat(spec, 'feet', '4')
+            main_stats['6'] = self._resolve_main_stat(spec, 'rope', '6')
+            
+            user_priority_subs = self._expand_sub_stats(spec.get('subs', []), min_select=2, max_select=2, exclude=['cpct', 'cdmg'])
+            
+            try: total_existing_cr = float(spec.get('crit_rate'))
+            except (TypeError, ValueError): raise ValueError(f"角色【{target_char_info['name']}】的已有暴击率无效。")
+        artifacts, target_cr_upgrades, notes = self._build_relics(mode, selected_relic_set, selected_ornament_set, main_stats, user_priority_subs, total_existing_cr)
         
         talent_levels = {"a": 6, "e": 10, "q": 10, "t": 10}
         if target_char_info.get('weapon') == "记忆": talent_levels.update({"me": 6, "mt": 6})
@@ -259,20 +386,394 @@ class PanelGenerator:
         trees = [f"{target_char_id}101", f"{target_char_id}102", f"{target_char_id}103"] + [f"{target_char_id}2{i:02d}" for i in range(1, 11)]
 
         new_char_data = { "name": target_char_info["name"], "id": int(target_char_id), "elem": target_char_info["elem"], "level": 80, "promote": 6, "cons": 6, "talent": talent_levels, "trees": trees, "weapon": {"id": int(weapon_id), "level": 80, "promote": 6, "affix": 5}, "artis": artifacts, "_source": "hsr-panel-generator", "_time": 1700000000, "_update": 1700000000, "_talent": 1700000000 }
+        summary = {"mode_name": MODE_NAMES[mode], "relic_name": selected_relic_set['name'], "ornament_name": selected_ornament_set['name'], "target_cr_upgrades": target_cr_upgrades, "notes": notes}
+        return str(target_char_id), new_char_data, summary
+
+    def _save_target(self, target_file, target_data):
+        # 延迟写入期间只记录待写文件，由 flush() 统一写入
+        if self.pending_writes is not None: self.pending_writes[target_file] = target_data; return None
+        written = write_json_atomic(target_file, target_data)
+        self.parser.track_write(target_file, target_data)
+        return written
+
+    def defer_writes(self):
+        if self.pending_writes is None: self.pending_writes = {}
+
+    def flush(self):
+        pending, self.pending_writes = self.pending_writes or {}, None
+        return {target_file: self._save_target(target_file, target_data) for target_file, target_data in pending.items()}
+
+    @contextlib.contextmanager
+    def deferred_writes(self):
+        # 批量生成时每个目标文件只写入一次，退出时返回 {文件: 是否实际写入}
+        written = {}
+        self.defer_writes()
+        try: yield written
+        finally: written.update(self.flush())
+
+    def generate(self, mode='extreme'):
+        index = self.parser.index
+        relic_id = self._select_from_list(index['relic_by_id'], "请选择4件套隧洞遗器", names=index['set_names'])[0]
+        ornament_id = self._select_from_list(index['ornament_by_id'], "请选择2件套位面饰品", names=index['set_names'])[0]
+        target_char_id, target_char_info = self._select_from_list(self.parser.char_data, "请选择角色", names=index['char_names'])
+        weapon_id, _ = self._select_from_list(self.parser.weapon_data, "请选择5星光锥", filter_func=lambda w: w.get('star') == 5, names=index['weapon_names'])
+        spec = {'relic': relic_id, 'ornament': ornament_id, 'id': target_char_id, 'weapon': weapon_id, 'mode': mode}
         
-        avatars_dict = self.parser.target_data.setdefault("avatars", {})
-        avatars_dict[str(target_char_id)] = new_char_data
-        self.parser.target_data["avatars"] = {k: v for k, v in sorted(avatars_dict.items(), key=lambda item: int(item[0]))}
-        with open(self.target_file_path, 'w', encoding='utf-8') as f: json.dump(self.parser.target_data, f, ensure_ascii=False, indent=2)
+        if mode == 'single_stat':
+            spec['subs'] = self._select_sub_stats("请选择副词条优先级列表 (至少4个)", min_select=4, max_select=9)
+            if not spec['subs']: return
+
+            print("\n--- 请为 极限单属性 模式选择主词条 ---")
+            for field, piece_idx in [('body', '3'), ('feet', '4'), ('sphere', '5'), ('rope', '6')]:
+                spec[field] = self._get_main_stat_input(PIECE_NAMES[piece_idx], self.parser.main_stat_map_by_piece[piece_idx].keys())
+
+        else:
+            print("\n[自动配置] 极限双暴模式，自动选择最优主词条：")
+            print("  - 躯干: 暴击伤害")
+            print(f"  - 位面球: {target_char_info['elem']}属性伤害")
+
+            spec['feet'] = self._get_main_stat_input("脚部", self.parser.main_stat_map_by_piece['4'].keys())
+            spec['rope'] = self._get_main_stat_input("连结绳", self.parser.main_stat_map_by_piece['6'].keys())
+            
+            spec['subs'] = self._select_sub_stats("请选择 2 个填充副词条 (双暴词条用尽后生效)", min_select=2, max_select=2, exclude=['cpct', 'cdmg'])
+            
+            try: spec['crit_rate'] = float(input("请输入角色已有的暴击率 (包括自身天赋/行迹/遗器/光锥提供的总和): ").strip())
+            except ValueError: print("输入无效。"); return
+
+        try: target_char_id, new_char_data, summary = self.build_avatar(spec)
+        except ValueError as e: print(f"错误: {e}"); return
+        for note in summary['notes']: print(note)
+        
+        self.parser.target_data.setdefault("avatars", {})[target_char_id] = new_char_data
+        if self._save_target(self.target_file_path, self.parser.target_data) is False: print(f"\n角色【{target_char_info['name']}】的面板数据没有变化，{os.path.basename(self.target_file_path)} 未改动。"); return
         print(f"\n成功！角色【{target_char_info['name']}】的面板数据已有序地写入/更新至 {os.path.basename(self.target_file_path)}")
 
-def main_loop():
-    if not os.path.exists(HSR_TARGET_JSON_FILE):
-        uid = os.path.basename(HSR_TARGET_JSON_FILE).split('.')[0]
+    def run_batch(self, entries):
+        # 所有角色共用同一份已加载的元数据，目标文件在全部生成后只写入一次
+        generated, failed = [], []
+        avatars_dict = self.parser.target_data.setdefault("avatars", {})
+        with self.deferred_writes() as written:
+            for n, spec in enumerate(entries, 1):
+                label = spec.get('name') or spec.get('id') or f"#{n}"
+                try: target_char_id, new_char_data, summary = self.build_avatar(spec)
+                except (KeyError, ValueError) as e:
+                    print(f"[{n}/{len(entries)}] 跳过【{label}】: {e}"); failed.append(label); continue
+                avatars_dict[target_char_id] = new_char_data
+                self._save_target(self.target_file_path, self.parser.target_data)
+                generated.append(label)
+                print(f"[{n}/{len(entries)}] 【{new_char_data['name']}】{summary['mode_name']} | {summary['relic_name']} + {summary['ornament_name']}")
+        if generated:
+            if written.get(self.target_file_path): print(f"已写入 {len(generated)} 个角色至 {os.path.basename(self.target_file_path)}")
+            else: print(f"{os.path.basename(self.target_file_path)} 内容没有变化，跳过写入。")
+        print(f"\n批量生成完成: 成功 {len(generated)} 个，失败 {len(failed)} 个。")
+        print(f"遗器方案缓存: 命中 {self.plan_stats['hit']} 次，计算 {self.plan_stats['miss']} 次。")
+        if failed: print(f"失败角色: {', '.join(map(str, failed))}")
+        return not failed
+
+    def sweep(self, base, grid):
+        # 角色、遗器与饰品只解析一次，各组取值共用遗器方案缓存与词条分配结果，生成后由审计器一次性统计各组的词条
+        index = self.parser.index
+        char_id = self._find_item(self.parser.char_data, base.get('id', base.get('name')), "角色", index['char_names'])[0]
+        relic_id = self._find_item(index['relic_by_id'], base.get('relic'), "4件套隧洞遗器", index['set_names'])[0]
+        ornament_id = self._find_item(index['ornament_by_id'], base.get('ornament'), "2件套位面饰品", index['set_names'])[0]
+        base = {**base, 'id': char_id, 'relic': relic_id, 'ornament': ornament_id}
+        main_by_id = {piece_idx: {main_id: stat for stat, main_id in stat_map.items()} for piece_idx, stat_map in self.parser.main_stat_map_by_piece.items()}
+        rows, avatars = [], {}
+        for point in expand_grid(grid):
+            spec = {**base, **point}
+            try: _, avatar, _ = self.build_avatar(spec)
+            except (KeyError, ValueError) as e: rows.append({'point': point, 'error': str(e)}); continue
+            main_stats = {PIECE_NAMES[idx]: main_by_id[idx].get(avatar['artis'][idx]['mainId']) for idx in ('3', '4', '5', '6')}
+            existing_cr = float(spec.get('crit_rate') or 0) if spec.get('mode', 'extreme') == 'extreme' else 0.0
+            avatars[str(len(avatars))] = avatar
+            rows.append({'point': point, 'mode': spec.get('mode', 'extreme'), 'main_stats': main_stats, 'existing_cr': existing_cr})
+        reports = iter(PanelAuditor(self.parser).audit({'avatars': avatars}))
+        for row in rows:
+            if 'error' in row: continue
+            report = next(reports)
+            row.update(rolls=report['rolls'], crit_rate=round(row.pop('existing_cr') + report['totals'].get('cpct', 0), 2), crit_dmg=report['crit_dmg'])
+        return rows
+
+class PanelAuditor:
+    # 一次遍历将整个面板文件的 attrIds 解码为 角色 × 词条 的强化次数矩阵，再按列乘以单次数值得到各项总值
+    # 矩阵为普通的 Python 列表，不依赖 numpy (没有向量化运算)，三个面板文件均在 10 ms 以内
+    def __init__(self, data_parser):
+        self.stats = list(data_parser.sub_stat_to_id)
+        self.col_by_stat_id = {str(stat_id): col for col, stat_id in enumerate(data_parser.sub_stat_to_id.values())}
+        self.roll_values = [SUB_STAT_VALUES[stat] for stat in self.stats]
+        self.canonical_codes = set(data_parser.roll_count_to_code.values())
+        self.main_by_id = {'1': {1: 'hpPlus'}, '2': {1: 'atkPlus'}}
+        for piece_idx, stat_map in data_parser.main_stat_map_by_piece.items():
+            self.main_by_id[piece_idx] = {main_id: stat if stat in MAIN_STAT_VALUES else 'dmg' for stat, main_id in stat_map.items()}
+
+    def decode(self, avatars):
+        # 编码 (code1, code2) 折算为 (code1 * 8 + code2) / 10 次满值强化
+        matrix, pieces = [], []
+        for avatar in avatars.values():
+            row, avatar_pieces = [0] * len(self.stats), []
+            for piece_idx, piece in sorted(avatar.get('artis', {}).items()):
+                decoded = []
+                for attr_id in piece.get('attrIds', []):
+                    try: stat_id, code1, code2 = str(attr_id).split(',')
+                    except ValueError: decoded.append((attr_id, None, 0, False)); continue
+                    col = self.col_by_stat_id.get(stat_id)
+                    try: code = (int(code1), int(code2))
+                    except ValueError: decoded.append((attr_id, None, 0, False)); continue
+                    rolls = (code[0] * 8 + code[1]) / 10
+                    if col is not None: row[col] += rolls
+                    decoded.append((attr_id, col, rolls, code in self.canonical_codes))
+                avatar_pieces.append((piece_idx, piece, decoded))
+            matrix.append(row); pieces.append(avatar_pieces)
+        return matrix, pieces
+
+    def _piece_anomalies(self, label, piece, decoded, main_stat):
+        anomalies = []
+        if main_stat is None: anomalies.append(f"{label}: 未知的主词条ID {piece.get('mainId')}")
+        unknown = [attr_id for attr_id, col, _, _ in decoded if col is None]
+        if unknown: anomalies.append(f"{label}: 无法识别的副词条 {', '.join(map(str, unknown))}")
+        odd_codes = [attr_id for attr_id, col, _, canonical in decoded if col is not None and not canonical]
+        if odd_codes: anomalies.append(f"{label}: 非标准强化编码 {', '.join(odd_codes)}")
+        if len(decoded) != 4: anomalies.append(f"{label}: 副词条为 {len(decoded)} 条 (应为 4 条)")
+        subs = [self.stats[col] for _, col, _, _ in decoded if col is not None]
+        if len(set(subs)) != len(subs): anomalies.append(f"{label}: 副词条重复")
+        if main_stat in subs: anomalies.append(f"{label}: 副词条与主词条相同 ({main_stat})")
+        total_rolls = sum(rolls for _, _, rolls, _ in decoded)
+        if abs(total_rolls - 9) > 1e-9: anomalies.append(f"{label}: 副词条共 {total_rolls:g} 次 (应为 9 次)")
+        for attr_id, col, rolls, _ in decoded:
+            if rolls > 6: anomalies.append(f"{label}: {attr_id} 强化 {rolls:g} 次 (最多 6 次)")
+        return anomalies
+
+    def audit(self, target_data, min_crit=None):
+        avatars = target_data.get('avatars', {})
+        matrix, pieces = self.decode(avatars)
+        reports = []
+        for (avatar_id, avatar), row, avatar_pieces in zip(avatars.items(), matrix, pieces):
+            totals = {stat: n * value for stat, n, value in zip(self.stats, row, self.roll_values) if n}
+            anomalies = []
+            for piece_idx, piece, decoded in avatar_pieces:
+                main_stat = self.main_by_id.get(piece_idx, {}).get(piece.get('mainId'))
+                if main_stat is not None: totals[main_stat] = totals.get(main_stat, 0) + MAIN_STAT_VALUES[main_stat]
+                anomalies += self._piece_anomalies(PIECE_NAMES.get(piece_idx, piece_idx), piece, decoded, main_stat)
+            missing = [name for piece_idx, name in PIECE_NAMES.items() if piece_idx not in avatar.get('artis', {})]
+            if missing: anomalies.append(f"缺少部位: {', '.join(missing)}")
+            crit_rate, crit_dmg = 5 + totals.get('cpct', 0), 50 + totals.get('cdmg', 0)
+            if min_crit is not None and crit_rate < min_crit: anomalies.append(f"暴击率 {crit_rate:.1f}% 低于 {min_crit:g}%")
+            reports.append({
+                'id': avatar_id, 'name': avatar.get('name'), 'crit_rate': round(crit_rate, 2), 'crit_dmg': round(crit_dmg, 2),
+                'rolls': {stat: round(n, 2) for stat, n in zip(self.stats, row) if n},
+                'totals': {stat: round(value, 2) for stat, value in totals.items()}, 'anomalies': anomalies
+            })
+        return reports
+
+class PanelValidator:
+    # 根据生成器的映射表与元数据预先计算各字段的合法取值集合，逐个角色检查面板文件，错误附带 JSON 路径
+    def __init__(self, data_parser):
+        self.main_stat_by_piece = {'1': {1: 'hpPlus'}, '2': {1: 'atkPlus'}}
+        self.main_stat_by_piece.update({idx: {main_id: stat for stat, main_id in stat_map.items()} for idx, stat_map in data_parser.main_stat_map_by_piece.items()})
+        self.sub_stat_by_id = {str(stat_id): stat for stat, stat_id in data_parser.sub_stat_to_id.items()}
+        self.rolls_by_code = {code: count for count, code in data_parser.roll_count_to_code.items()}
+        self.piece_ids = {idx: set() for idx in PIECE_NAMES}
+        for pieces in data_parser.index['piece_ids'].values():
+            for idx, piece_id in pieces.items():
+                if piece_id: self.piece_ids.setdefault(idx, set()).add(piece_id)
+        self.char_ids = set(map(str, data_parser.char_data))
+        self.weapon_ids = set(map(str, data_parser.weapon_data))
+
+    def validate(self, target_data):
+        errors = []
+        error = lambda path, code, message: errors.append({'path': path, 'code': code, 'message': message})
+        if not isinstance(target_data, dict) or not isinstance(target_data.get('avatars'), dict):
+            error('$.avatars', 'schema', "缺少 avatars 对象"); return errors
+        for key in ('uid', 'name'):
+            if not isinstance(target_data.get(key), str): error(f"$.{key}", 'schema', f"缺少字符串字段 {key}")
+        for avatar_id, avatar in target_data['avatars'].items(): self._validate_avatar(f"$.avatars['{avatar_id}']", avatar_id, avatar, error)
+        return errors
+
+    def _validate_fields(self, path, value, fields, error):
+        if not isinstance(value, dict): error(path, 'schema', "应为对象"); return False
+        for key, field_type in fields.items():
+            if not isinstance(value.get(key), field_type): error(f"{path}.{key}", 'schema', f"缺少字段或类型不是 {field_type.__name__}")
+        return True
+
+    def _validate_avatar(self, path, avatar_id, avatar, error):
+        if not self._validate_fields(path, avatar, AVATAR_FIELDS, error): return
+        if str(avatar.get('id')) != avatar_id: error(f"{path}.id", 'id-mismatch', f"角色ID {avatar.get('id')} 与键 {avatar_id} 不一致")
+        if avatar_id not in self.char_ids: error(path, 'unknown-character', f"角色数据中没有ID {avatar_id}")
+        weapon = avatar.get('weapon')
+        if isinstance(weapon, dict) and str(weapon.get('id')) not in self.weapon_ids: error(f"{path}.weapon.id", 'unknown-weapon', f"光锥数据中没有ID {weapon.get('id')}")
+        artis = avatar.get('artis')
+        if not isinstance(artis, dict): return
+        for idx, name in PIECE_NAMES.items():
+            if idx not in artis: error(f"{path}.artis", 'missing-piece', f"缺少部位 {idx} ({name})")
+        for idx, piece in artis.items():
+            piece_path = f"{path}.artis['{idx}']"
+            if idx not in PIECE_NAMES: error(piece_path, 'unknown-piece', f"未知的部位 {idx}"); continue
+            if self._validate_fields(piece_path, piece, PIECE_FIELDS, error): self._validate_piece(piece_path, idx, piece, error)
+
+    def _validate_piece(self, path, idx, piece, error):
+        if piece.get('star', 5) != 5 or piece['level'] != 15: error(path, 'not-max-level', f"应为 5 星 15 级 (当前 {piece.get('star', 5)} 星 {piece['level']} 级)")
+        if piece['id'] not in self.piece_ids[idx]: error(f"{path}.id", 'unknown-relic', f"遗器数据中没有部位 {idx} ({PIECE_NAMES[idx]}) 的5星遗器 {piece['id']}")
+        main_stat = self.main_stat_by_piece[idx].get(piece['mainId'])
+        if main_stat is None: error(f"{path}.mainId", 'invalid-main-id', f"主词条ID {piece['mainId']} 不能用于部位 {idx} ({PIECE_NAMES[idx]})")
+        attr_ids = piece['attrIds']
+        if len(attr_ids) != 4: error(f"{path}.attrIds", 'sub-count', f"副词条为 {len(attr_ids)} 条 (应为 4 条)")
+        subs, total_rolls = [], 0
+        for i, attr_id in enumerate(attr_ids):
+            try: stat_id, code1, code2 = str(attr_id).split(','); code = (int(code1), int(code2))
+            except ValueError: error(f"{path}.attrIds[{i}]", 'schema', f"副词条格式应为 \"词条ID,编码1,编码2\" (当前 {attr_id!r})"); total_rolls = None; continue
+            stat = self.sub_stat_by_id.get(stat_id)
+            if stat is None: error(f"{path}.attrIds[{i}]", 'unknown-sub-id', f"未知的副词条ID {stat_id}")
+            else: subs.append(stat)
+            if code not in self.rolls_by_code: error(f"{path}.attrIds[{i}]", 'invalid-roll-code', f"强化编码 {code1},{code2} 不在 roll_count_to_code 中"); total_rolls = None
+            elif total_rolls is not None: total_rolls += self.rolls_by_code[code]
+        if len(set(subs)) != len(subs): error(f"{path}.attrIds", 'duplicate-sub', "副词条重复")
+        if main_stat in subs: error(f"{path}.attrIds", 'sub-equals-main', f"副词条与主词条相同 ({main_stat})")
+        if len(attr_ids) == 4 and total_rolls is not None and total_rolls != 9: error(f"{path}.attrIds", 'roll-count', f"副词条共 {total_rolls} 次 (应为 9 次)")
+
+def validate_panel_file(validator, target_file):
+    try:
+        with open(target_file, 'rb') as f: target_data = parse_json(f.read())
+    except (OSError, ValueError) as e: return [{'path': '$', 'code': 'unreadable', 'message': str(e)}]
+    return validator.validate(target_data)
+
+class StarRailPanelService(PanelService):
+    # 只有一个目标文件，resolve 还可查询光锥名称
+    RESOLVE_KINDS = {'character': 'char_names', 'set': 'set_names', 'weapon': 'weapon_names'}
+
+    def op_generate(self, request):
+        target_char_id, new_char_data, summary = self.generator.build_avatar(self._spec(request))
+        result = {'avatar_id': target_char_id, 'avatar': new_char_data, 'summary': summary}
+        if request.get('write'):
+            # defer 为 true 时只记录待写文件，直到收到 flush 请求才写入
+            if request.get('defer'): self.generator.defer_writes()
+            target_file = self.generator.target_file_path
+            target_data = self.generator.pending_writes.get(target_file) if self.generator.pending_writes else None
+            if target_data is None: target_data = self.generator.parser.target_data
+            target_data.setdefault("avatars", {})[target_char_id] = new_char_data
+            result['written'] = self.generator._save_target(target_file, target_data)
+        return result
+
+    def op_validate(self, request):
+        # 带 spec 时校验生成配置，否则校验面板文件 (target 指定文件，默认目标文件)
+        if 'spec' in request:
+            self.generator.build_avatar(self._spec(request))
+            return {}
+        target_file = request.get('target') or self.generator.target_file_path
+        return {'errors': [{'file': target_file, **error} for error in validate_panel_file(PanelValidator(self.generator.parser), target_file)]}
+
+    def op_list_missing(self, request):
+        missing = self.generator.missing_characters(self.generator.pending_writes.get(self.generator.target_file_path) if self.generator.pending_writes else None)
+        return {'missing': [{'id': cid, 'name': self.generator.parser.char_data[cid]['name']} for cid in missing]}
+
+def render_panel(data, compact=None):
+    # 面板文件只在这里排序: 角色按ID、部位按序号、字段按固定顺序，写入与预览差异使用同样的输出
+    with timer('canonical_order'): data = canonical_panel(data, AVATAR_KEY_ORDER, PIECE_KEY_ORDER)
+    with timer('json_dumps'): return dump_json(data, COMPACT_OUTPUT if compact is None else compact)
+
+@timed('write_json')
+def write_json_atomic(filepath, data):
+    content = render_panel(data)
+    if not write_text_atomic(filepath, content): return False
+    count('files_written'); count('bytes_written', len(content.encode('utf-8')))
+    return True
+
+def all_target_files():
+    return [HSR_TARGET_JSON_FILE]
+
+def ensure_target_file(target_file):
+    if os.path.exists(target_file): return True
+    uid = os.path.basename(target_file).split('.')[0]
+    try: write_json_atomic(target_file, {"uid": uid, "name": "预设面板", "avatars": {}})
+    except IOError as e: print(f"错误: 无法创建文件 '{target_file}': {e}"); return False
+    return True
+
+def run_audit(files, min_crit=None, as_json=False):
+    auditor = PanelAuditor(StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, files[0]))
+    results, ok = {}, True
+    for target_file in files:
+        start = time.perf_counter()
+        try:
+            with open(target_file, 'rb') as f: target_data = parse_json(f.read())
+        except (OSError, ValueError) as e: print(f"错误: 无法读取面板文件 '{target_file}': {e}", file=sys.stderr); ok = False; continue
+        reports = auditor.audit(target_data, min_crit)
+        results[target_file] = reports
+        flagged = sum(1 for report in reports if report['anomalies'])
+        ok = ok and not flagged
+        if as_json: continue
+        print(f"\n===== {target_file}: {len(reports)} 个角色，{flagged} 个存在异常 (用时 {(time.perf_counter() - start) * 1000:.1f} ms) =====")
+        for report in reports:
+            rolls = ' '.join(f"{stat}×{n:g}" for stat, n in sorted(report['rolls'].items(), key=lambda item: -item[1]))
+            print(f"{report['id']} {report['name']}: 暴击率 {report['crit_rate']:.1f}% | 爆伤 {report['crit_dmg']:.1f}% | {rolls}")
+            for anomaly in report['anomalies']: print(f"  ! {anomaly}")
+    if as_json: print(json.dumps(results, ensure_ascii=False, indent=2))
+    return ok
+
+def run_validate(files, jobs=None):
+    validator = PanelValidator(StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, files[0]))
+    # 校验器只包含预先计算好的集合，可直接传给子进程，多个文件时并行校验
+    if len(files) > 1 and jobs != 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or min(len(files), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(validate_panel_file, [validator] * len(files), files))
+    else: results = [validate_panel_file(validator, target_file) for target_file in files]
+    count = 0
+    for target_file, errors in zip(files, results):
+        for error in errors: print(json.dumps({'file': target_file, **error}, ensure_ascii=False)); count += 1
+    print(f"已校验 {len(files)} 个文件，发现 {count} 个错误。", file=sys.stderr)
+    return count == 0
+
+def run_sync(dry_run=False):
+    if not ensure_target_file(HSR_TARGET_JSON_FILE): return False
+    data_parser = StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE)
+    return PanelGenerator(data_parser, HSR_TARGET_JSON_FILE).sync_missing(dry_run)
+
+def regenerate(target_file=HSR_TARGET_JSON_FILE, spec_file=None, dry_run=False, only=None):
+    # 供 panel-tools.py regen 在子进程中调用: 按批量配置重新生成角色，再补全缺少的角色，最后只写入一次；only 为角色ID集合时只重新生成配置中的这些角色
+    for path, name in [(HSR_CHAR_DATA_FILE, "角色数据"), (HSR_RELIC_DATA_FILE, "遗器数据"), (HSR_WEAPON_DATA_FILE, "光锥数据")]:
+        if not os.path.exists(path): raise ValueError(f"{name}文件未找到，请检查顶部的配置路径: {path}")
+    if not ensure_target_file(target_file): raise ValueError(f"无法创建目标文件 '{target_file}'。")
+    generator = PanelGenerator(StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, target_file), target_file)
+    target_data = generator.parser.target_data
+    avatars, generated, failed = dict(target_data.get('avatars', {})), 0, []
+    for n, spec in enumerate(load_spec(spec_file) if spec_file else [], 1):
+        label = spec.get('name') or spec.get('id') or f"#{n}"
         try:
-            with open(HSR_TARGET_JSON_FILE, 'w', encoding='utf-8') as f:
-                json.dump({"uid": uid, "name": "预设面板", "avatars": {}}, f, indent=2)
-        except IOError as e: print(f"错误: 无法创建文件 '{HSR_TARGET_JSON_FILE}': {e}"); return
+            if only is not None and generator.spec_avatar_id(spec) not in only: continue
+            target_char_id, new_char_data, summary = generator.build_avatar(spec)
+        except (KeyError, ValueError) as e: print(f"跳过【{label}】: {e}"); failed.append(label); continue
+        avatars[target_char_id] = new_char_data; generated += 1
+        print(f"【{new_char_data['name']}】{summary['mode_name']} | {summary['relic_name']} + {summary['ornament_name']}")
+    count = len(avatars)
+    failed += generator.fill_missing(avatars)
+    new_data = {**target_data, 'avatars': avatars}
+    return {'file': target_file, 'generated': generated, 'added': len(avatars) - count, 'failed': failed, 'changed': new_data != target_data,
+            'written': False if dry_run else write_json_atomic(target_file, new_data), 'plan_cache': dict(generator.plan_stats)}
+
+def metadata_files():
+    return [HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE]
+
+def metadata_index():
+    # 供 panel-tools.py watch 比较元数据变化: 角色 ID -> (名称, 属性, 命途)，套装 ID -> (名称, 各部位5星遗器ID)
+    data_parser = StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE)
+    piece_ids = data_parser.index['piece_ids']
+    return {'characters': {str(cid): (info.get('name'), info.get('elem'), info.get('weapon')) for cid, info in data_parser.char_data.items()},
+            'sets': {str(s['id']): (s['name'], tuple(piece_id for _, piece_id in sorted(piece_ids[s['id']].items()))) for s in data_parser.index['relic_sets'] + data_parser.index['ornament_sets']}}
+
+def affected_avatars(target_data, previous, current):
+    # 对比前后两次 metadata_index()，找出角色信息变化/被移除、或所用遗器套装变化/被移除的已有角色，返回 ID -> 原因
+    set_by_piece = {piece_id: info[0] for sid, info in previous['sets'].items() if current['sets'].get(sid) != info for piece_id in info[1] if piece_id}
+    affected = {}
+    for avatar_id, avatar in target_data.get('avatars', {}).items():
+        reasons = []
+        if avatar_id in previous['characters'] and current['characters'].get(avatar_id) != previous['characters'][avatar_id]:
+            reasons.append("角色数据已变化" if avatar_id in current['characters'] else "角色已从元数据中移除")
+        artis = avatar.get('artis') if isinstance(avatar.get('artis'), dict) else {}
+        sets = sorted({set_by_piece[piece['id']] for piece in artis.values() if isinstance(piece, dict) and piece.get('id') in set_by_piece})
+        if sets: reasons.append(f"遗器套装【{'、'.join(sets)}】已变化或被移除")
+        if reasons: affected[avatar_id] = f"{avatar.get('name')}: {'；'.join(reasons)}"
+    return affected
+
+def main_loop():
+    if not ensure_target_file(HSR_TARGET_JSON_FILE): return
 
     data_parser = StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE)
     generator = PanelGenerator(data_parser, HSR_TARGET_JSON_FILE)
@@ -291,9 +792,92 @@ def main_loop():
         elif mode_choice == '4': print("程序已退出。"); break
         else: print("无效输入，请重新选择。")
 
+def run_batch(spec_file):
+    try: entries = load_spec(spec_file)
+    except (OSError, ValueError) as e: print(f"错误: 无法读取批量配置 '{spec_file}': {e}"); return False
+    if not entries: print(f"错误: 批量配置 '{spec_file}' 中没有角色。"); return False
+    if not ensure_target_file(HSR_TARGET_JSON_FILE): return False
+    data_parser = StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE)
+    return PanelGenerator(data_parser, HSR_TARGET_JSON_FILE).run_batch(entries)
+
+def run_sweep(spec_file, as_json=False):
+    # 配置文件中 base 为基础配置 (同批量配置中的单个角色)，grid 为要扫描的参数，如 crit_rate/feet/rope/subs/mode
+    try:
+        spec = read_spec_file(spec_file) or {}
+        base, grid = {**spec.get('defaults', {}), **spec.get('base', {})}, spec.get('grid') or {}
+        if not isinstance(grid, dict) or not grid: raise ValueError("缺少 grid 参数。")
+    except (OSError, ValueError, AttributeError) as e: print(f"错误: 无法读取扫描配置 '{spec_file}': {e}"); return False
+    start = time.perf_counter()
+    generator = PanelGenerator(StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE), HSR_TARGET_JSON_FILE)
+    try: rows = generator.sweep(base, grid)
+    except ValueError as e: print(f"错误: {e}"); return False
+    elapsed, states = (time.perf_counter() - start) * 1000, roll_states.cache_info()
+    for row in rows:
+        if as_json: print(json.dumps(row, ensure_ascii=False)); continue
+        point = ' '.join(f"{key}={format_grid_value(value)}" for key, value in row['point'].items())
+        if 'error' in row: print(f"{point} | 错误: {row['error']}"); continue
+        rolls = row['rolls']
+        others = ' '.join(f"{stat}×{n:g}" for stat, n in sorted(rolls.items(), key=lambda item: -item[1]) if stat not in ('cpct', 'cdmg'))
+        short = ' (未满暴击)' if row['mode'] == 'extreme' and row['crit_rate'] < 100 - 1e-6 else ''
+        print(f"{point} | 躯/脚/球/绳 {'/'.join(map(str, row['main_stats'].values()))} | 暴击 {rolls.get('cpct', 0):g} 爆伤 {rolls.get('cdmg', 0):g} | {others} | 暴击率 {row['crit_rate']:.1f}%{short} 爆伤 {row['crit_dmg']:.1f}%")
+    print(f"\n共 {len(rows)} 组 (失败 {sum('error' in row for row in rows)} 组)，用时 {elapsed:.1f} ms；遗器方案缓存: 命中 {generator.plan_stats['hit']} 次，计算 {generator.plan_stats['miss']} 次；"
+          f"词条分配: 命中 {states.hits} 次，计算 {states.misses} 次。", file=sys.stderr if as_json else sys.stdout)
+    return not any('error' in row for row in rows)
+
+def run_service(socket_path=None):
+    # 使用标准输入/输出时，标准输出专用于协议，其他提示信息改写到标准错误
+    if not socket_path: out, sys.stdout = sys.stdout, sys.stderr
+    if not ensure_target_file(HSR_TARGET_JSON_FILE): return False
+    data_parser = StarRailDataParser(HSR_CHAR_DATA_FILE, HSR_RELIC_DATA_FILE, HSR_WEAPON_DATA_FILE, HSR_TARGET_JSON_FILE)
+    service = StarRailPanelService(PanelGenerator(data_parser, HSR_TARGET_JSON_FILE))
+    if not socket_path: service.serve_stdio(out); return True
+    try: service.serve_socket(socket_path)
+    except ValueError as e: print(f"错误: {e}"); return False
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="星铁预设面板生成脚本，不带参数运行时进入交互模式")
+    subparsers = parser.add_subparsers(dest='command')
+    batch_parser = subparsers.add_parser('batch', help="按 JSON/YAML 配置文件批量生成角色面板")
+    batch_parser.add_argument('spec', help="批量配置文件路径 (.json/.yaml)")
+    serve_parser = subparsers.add_parser('serve', help="以常驻进程运行，从标准输入或 Unix 套接字读取 JSON-lines 请求")
+    serve_parser.add_argument('--socket', help="Unix 套接字路径，不指定时使用标准输入/输出")
+    audit_parser = subparsers.add_parser('audit', help="统计面板文件中每个角色的词条总值与强化次数，并列出异常")
+    audit_parser.add_argument('files', nargs='*', help="面板文件路径，默认检查目标文件")
+    audit_parser.add_argument('--min-crit', type=float, help="暴击率 (含基础5%%) 低于该值时视为异常")
+    audit_parser.add_argument('--json', action='store_true', help="以 JSON 格式输出")
+    validate_parser = subparsers.add_parser('validate', help="校验面板文件的结构与取值，每个错误输出一行 JSON")
+    validate_parser.add_argument('files', nargs='*', help="面板文件路径，默认校验目标文件")
+    validate_parser.add_argument('--jobs', type=int, help="并行进程数，默认按文件数")
+    sweep_parser = subparsers.add_parser('sweep', help="按配置中的参数网格批量计算词条分配与主词条选择，输出对照表 (不写入文件)")
+    sweep_parser.add_argument('spec', help="扫描配置文件路径 (.json/.yaml)，包含 base 与 grid")
+    sweep_parser.add_argument('--json', action='store_true', help="每组结果输出一行 JSON")
+    sync_parser = subparsers.add_parser('sync', help="按同命途角色的已有面板为缺少的角色批量生成默认面板")
+    sync_parser.add_argument('--dry-run', action='store_true', help="只输出将要写入的差异，不修改文件")
+    parser.add_argument('--no-cache', action='store_true', help="不读写元数据快照缓存")
+    parser.add_argument('--compact', action='store_true', help="面板文件写为无缩进的紧凑格式")
+    parser.add_argument('--profile', metavar='FILE', help=f"统计各阶段耗时与计数，退出时写入 JSON 报告 (也可设置环境变量 {PROFILE_ENV})")
+    parser.add_argument('--cprofile', metavar='FILE', help=f"同时以 cProfile 记录并写入统计文件 (也可设置环境变量 {CPROFILE_ENV})")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    print("--- 欢迎使用星铁预设面板生成脚本 ---")
+    args = parse_args()
+    if args.no_cache: CACHE_DIR = None
+    if args.compact: COMPACT_OUTPUT = True
+    profile_file, cprofile_file = args.profile or os.environ.get(PROFILE_ENV), args.cprofile or os.environ.get(CPROFILE_ENV)
+    if profile_file or cprofile_file: start_profiling(profile_file, cprofile_file)
+    # 审计只读取面板文件，不需要 miao-plugin 数据
+    if args.command == 'audit': exit(0 if run_audit(args.files or all_target_files(), args.min_crit, args.json) else 1)
+    if args.command not in ('serve', 'validate', 'sweep'): print("--- 欢迎使用星铁预设面板生成脚本 ---")
     for path, name in [(HSR_CHAR_DATA_FILE, "角色数据"), (HSR_RELIC_DATA_FILE, "遗器数据"), (HSR_WEAPON_DATA_FILE, "光锥数据")]:
         if not os.path.exists(path):
             print(f"错误: {name}文件未找到，请检查顶部的配置路径: {path}"); exit()
-    main_loop()
\ No newline at end of file
+    # 数据文件或目标文件损坏时只在这里退出，常驻服务中同样的错误作为该请求的错误响应返回
+    try:
+        if args.command == 'batch': exit(0 if run_batch(args.spec) else 1)
+        if args.command == 'serve': exit(0 if run_service(args.socket) else 1)
+        if args.command == 'sweep': exit(0 if run_sweep(args.spec, args.json) else 1)
+        if args.command == 'sync': exit(0 if run_sync(args.dry_run) else 1)
+        if args.command == 'validate': exit(0 if run_validate(args.files or all_target_files(), args.jobs) else 1)
+        main_loop()
+    except DataFileError as e: print(f"错误: {e}"); exit(1)
@@ -1,7 +1,17 @@
+import argparse
+import concurrent.futures
+import contextlib
+import difflib
 import json
 import math
 import os
-from collections import defaultdict
+import sys
+import time
+from collections import Counter, defaultdict
+
+from panel_common import (CPROFILE_ENV, PROFILE_ENV, DataFileError, PanelDataParser, PanelService, add_name, allocate_rolls, build_name_index, canonical_panel,
+                          check_spec, count, dump_json, expand_grid, format_grid_value, load_spec, match_name, parse_json, priority_weights, read_spec_file,
+                          roll_states, start_profiling, timed, timer, write_text_atomic)
 
 # 使用前请先修改以下路径
 # 原神极限面板文件
@@ -13,13 +23,57 @@ NUKE_TARGET_JSON_FILE = 'Yunzai/resources/presetPanelData/gs/100000001.json'
 CHAR_DATA_FILE = 'miao-plugin/resources/meta-gs/character/data.json'
 # 圣遗物数据源文件
 ARTIS_DATA_FILE = 'miao-plugin/resources/meta-gs/artifact/data.json'
+# miao-plugin 元数据的快照缓存目录 (位于用户缓存目录下)，源文件未变化时跳过 JSON 解析，设为 None 可关闭
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'presetPanel')
+# 名称别名文件，格式与 name.js 管理的 char_alias.json 相同: {正式名称: [别名, ...]}，角色、套装的名称均可，不存在时忽略，设为 None 可关闭
+ALIAS_FILE = 'panel-alias.json'
+# 快照格式版本，索引结构变化时递增以使旧快照失效
+SNAPSHOT_VERSION = 2
+# 面板文件写为紧凑格式 (无缩进，体积约为一半)，也可使用 --compact 参数；插件读取两种格式均可
+COMPACT_OUTPUT = False
 
-class GenshinDataParser:
+MODE_NAMES = {'extreme': '平衡双暴', 'mastery': '极限精通', 'nuke': '极限爆伤'}
+TARGET_FILES = {
+    'extreme': (EXTREME_TARGET_JSON_FILE, '极限面板'),
+    'mastery': (EXTREME_TARGET_JSON_FILE, '极限面板'),
+    'nuke': (NUKE_TARGET_JSON_FILE, '核爆面板')
+}
+SANDS_MAIN_STATS = ['atk', 'hp', 'def', 'mastery', 'recharge']
+PIECE_TYPES = ['flower', 'plume', 'sands', 'goblet', 'circlet']
+FALLBACK_SUBS = ['recharge', 'atk', 'hp', 'def', 'mastery', 'atkPlus', 'hpPlus', 'defPlus', 'cdmg', 'cpct']
+CRIT_RATE_PER_ROLL = 3.89
+CRIT_CIRCLET_RATE = 31.1
+# 爆伤头主词条 62.2% 约等于 8 次满值爆伤副词条
+CDMG_CIRCLET_ROLLS = 8
+# 圣遗物方案缓存的最大条目数，超出后淘汰最早加入的方案
+PLAN_CACHE_SIZE = 4096
+# 满级5星圣遗物的主词条数值与单次满值副词条数值，用于审计已有面板 (元素伤害加成统一记为 dmg)
+MAIN_STAT_VALUES = {
+    'hpPlus': 4780, 'atkPlus': 311, 'hp': 46.6, 'atk': 46.6, 'def': 58.3, 'mastery': 186.5,
+    'recharge': 51.8, 'cpct': 31.1, 'cdmg': 62.2, 'heal': 35.9, 'dmg': 46.6, 'phy': 58.3
+}
+SUB_STAT_VALUES = {
+    'hp': 5.83, 'hpPlus': 298.75, 'atk': 5.83, 'atkPlus': 19.45, 'def': 7.29, 'defPlus': 23.15,
+    'cpct': 3.89, 'cdmg': 7.77, 'mastery': 23.31, 'recharge': 6.48
+}
+# 旧版面板数据中生之花使用的主词条ID
+LEGACY_MAIN_IDS = {'14001': 'hpPlus'}
+# 面板文件中角色与圣遗物部位的必需字段及类型
+AVATAR_FIELDS = {'name': str, 'id': int, 'elem': str, 'level': int, 'cons': int, 'talent': dict, 'weapon': dict, 'artis': dict}
+# 写入面板文件时角色与部位字段的固定顺序 (与新生成的面板一致)，未列出的字段按原有顺序排在其后，使输出与写入路径无关
+AVATAR_KEY_ORDER = ['name', 'id', 'elem', 'level', 'promote', 'fetter', 'costume', 'cons', 'talent', 'weapon', 'artis', '_source', '_time', '_update', '_talent']
+PIECE_KEY_ORDER = ['level', 'star', 'name', 'mainId', 'attrIds']
+PIECE_FIELDS = {'level': int, 'star': int, 'name': str, 'mainId': int, 'attrIds': list}
+# 内置的旅行者别名，与别名文件中的别名一并加入名称索引
+TRAVELER_ALIASES = {'10000005': ['旅行者', '男主', '空哥'], '10000007': ['旅行者', '女主', '荧妹']}
+class GenshinDataParser(PanelDataParser):
     def __init__(self, char_file, artis_file, target_file):
         self._initialize_maps()
-        self.char_data = self._load_json(char_file)
-        self.artis_data = self._load_json(artis_file)
-        self.target_data = self._load_json(target_file)
+        super().__init__({'char': char_file, 'artis': artis_file, 'target': target_file}, {'char': self._index_char_data, 'artis': self._index_artis_data},
+                         {'char_names': 'char', 'five_star_sets': 'artis', 'set_by_key': 'artis', 'set_names': 'artis'}, CACHE_DIR, ALIAS_FILE, SNAPSHOT_VERSION)
+
+    char_data = property(lambda self: self._source('char'))
+    artis_data = property(lambda self: self._source('artis'))
         
     def _initialize_maps(self):
         self.main_id_map = {
@@ -36,20 +90,29 @@ class GenshinDataParser:
             'def': '501094', 'defPlus': '501084', 'cpct': '501204', 'cdmg': '501224',
             'mastery': '501244', 'recharge': '501234'
         }
+        self.main_id_by_stat = {v: k for k, v in self.main_id_map.items()}
+        self.main_id_by_stat.update(self.elem_dmg_map)
 
-    def _load_json(self, filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"加载文件 '{filepath}' 时出错: {e}"); exit()
-        return {}
+    # 名称 -> ID 等反查表随数据文件构建一次，避免生成时逐项扫描
+    def _index_char_data(self, char_data):
+        char_names = build_name_index((cinfo.get('name'), cid) for cid, cinfo in char_data.items())
+        for cid, aliases in TRAVELER_ALIASES.items():
+            for alias in aliases if cid in char_data else (): add_name(char_names, alias, cid)
+        return {'char_names': char_names}
+
+    def _index_artis_data(self, artis_data):
+        five_star_sets = sorted((v for v in artis_data.values() if isinstance(v.get('idxs'), dict) and len(v['idxs']) == 5), key=lambda x: int(x.get('id', 0)))
+        set_by_key = {}
+        for artifact_set in five_star_sets:
+            set_by_key.setdefault(str(artifact_set.get('id')), artifact_set)
+            set_by_key.setdefault(artifact_set['name'], artifact_set)
+        set_names = build_name_index((artifact_set['name'], str(artifact_set.get('id'))) for artifact_set in five_star_sets)
+        return {'five_star_sets': five_star_sets, 'set_by_key': set_by_key, 'set_names': set_names}
 
 class PanelGenerator:
     def __init__(self, data_parser, target_file_path):
         self.parser = data_parser
         self.target_file_path = target_file_path
-        self.five_star_sets = self._get_5star_sets()
         self.sub_stat_options = {
             "攻击": ["atk", "atkPlus"],
             "生命": ["hp", "hpPlus"],
@@ -59,10 +122,11 @@ class PanelGenerator:
             "暴击率": ["cpct"],
             "暴击伤害": ["cdmg"]
         }
+        self.sub_stat_groups = {key: keys for keys in self.sub_stat_options.values() for key in keys}
+        self.pending_writes = None
+        self.plan_cache, self.plan_stats = {}, {'hit': 0, 'miss': 0}
 
-    def _get_5star_sets(self):
-        sets = [v for v in self.parser.artis_data.values() if isinstance(v.get('idxs'), dict) and len(v['idxs']) == 5]
-        return sorted(sets, key=lambda x: int(x.get('id', 0)))
+    five_star_sets = property(lambda self: self.parser.index['five_star_sets'])
         
     def select_artifact_set(self):
         print("\n--- 请选择圣遗物套装 ---")
@@ -105,138 +169,677 @@ class PanelGenerator:
             if valid_input:
                 return [key for group in selected_keys for key in group]
 
-    def list_missing_characters(self):
+    def missing_characters(self, target_data=None, target_file=None):
+        # 未传入面板数据时只读取目标文件中的角色ID
         all_chars = set(self.parser.char_data.keys())
-        existing_chars = set(self.parser.target_data.get('avatars', {}).keys())
+        existing_chars = set(target_data.get('avatars', {}).keys() if target_data is not None else self.parser.target_avatar_ids(target_file or self.target_file_path))
         ignore_ids = {'10000005', '10000007', '20000000'}
-        missing_chars_id = sorted([cid for cid in (all_chars - existing_chars - ignore_ids) if cid in self.parser.char_data])
+        return sorted([cid for cid in (all_chars - existing_chars - ignore_ids) if cid in self.parser.char_data])
+
+    def list_missing_characters(self):
+        missing_chars_id = self.missing_characters()
         if not missing_chars_id: print(f"\n所有角色数据均已存在于 {os.path.basename(self.target_file_path)} 中。"); return
         print(f"\n--- 以下角色数据尚未写入 {os.path.basename(self.target_file_path)} ---")
         for char_id in missing_chars_id: print(f"ID: {char_id:<10} 名称: {self.parser.char_data[char_id]['name']}")
         print("-" * 40)
 
-    def generate(self, mode='extreme'):
-        selected_set = self.select_artifact_set()
-        char_name_input = input("请输入要生成的角色中文名: ").strip()
-        target_char_id, target_char_info = next(((cid, cinfo) for cid, cinfo in self.parser.char_data.items() if cinfo.get('name') == char_name_input), (None, None))
-        if not target_char_id: print(f"错误: 找不到名为 '{char_name_input}' 的角色。"); return
-        weapon_name = input("请输入武器名称: ").strip()
-        
-        main_stats = {'flower': 'hpPlus', 'plume': 'atkPlus', 'goblet': target_char_info['elem']}
-        
+    def spec_avatar_id(self, spec):
+        check_spec(spec)
+        return self._find_character(str(spec.get('name', '')).strip())[0]
+
+    def _find_character(self, char_name):
+        # 可以写正式名称、别名或名称的一部分 (唯一匹配时)
+        char_id = match_name(self.parser.index['char_names'], char_name, "角色")
+        return char_id, self.parser.char_data[char_id]
+
+    def _find_artifact_set(self, set_name):
+        artifact_set = self.parser.index['set_by_key'].get(str(set_name))
+        return artifact_set or self.parser.index['set_by_key'][match_name(self.parser.index['set_names'], set_name, "5星圣遗物套装")]
+
+    def _expand_sub_stats(self, names, exclude=None, min_select=2, max_select=4):
+        # 批量配置中的副词条可以写选项名 (攻击) 或词条键 (atk)，统一展开为与交互模式相同的词条组
+        if exclude is None: exclude = []
+        if isinstance(names, str): names = [names]
+        groups = []
+        for name in names:
+            keys = self.sub_stat_options.get(name) or self.sub_stat_groups.get(name)
+            if not keys: raise ValueError(f"未知的副词条 '{name}'。")
+            if any(k in exclude for k in keys): raise ValueError(f"副词条 '{name}' 在当前模式下不可选。")
+            if keys not in groups: groups.append(keys)
+        if not (min_select <= len(groups) <= max_select): raise ValueError(f"请选择 {min_select} 到 {max_select} 个副词条。")
+        return [key for group in groups for key in group]
+
+    def _piece_subs(self, mode, piece_type, main_stat_name, user_priority_subs):
+        final_subs = []
+        mode_priority_subs = []
+        if mode == 'extreme': mode_priority_subs = ['cpct', 'cdmg']
+        elif mode == 'nuke': mode_priority_subs = ['cdmg']
+        elif mode == 'mastery' and piece_type in ['flower', 'plume']: mode_priority_subs = ['mastery']
+
+        for stat in mode_priority_subs + user_priority_subs + FALLBACK_SUBS:
+            if len(final_subs) >= 4: break
+            if stat not in final_subs and stat != main_stat_name: final_subs.append(stat)
+        return final_subs
+
+    def _plan_rolls(self, mode, main_stats, user_priority_subs, weights, crit_needed=None):
+        piece_subs = [self._piece_subs(mode, piece_type, main_stats[piece_type], user_priority_subs) for piece_type in PIECE_TYPES]
+        return allocate_rolls(piece_subs, weights, crit_needed=crit_needed, crit_per_roll=CRIT_RATE_PER_ROLL)
+
+    def _plan_extreme_rolls(self, main_stats, user_priority_subs, weights, cr_needed):
+        # 分别计算爆伤头与暴击头的最优分配: 先保证暴击率达标，再比较双暴收益 (爆伤头主词条折算为爆伤词条)，最后取溢出最少者
+        best = None
+        for circlet in ('cdmg', 'cpct'):
+            main_crit = CRIT_CIRCLET_RATE if circlet == 'cpct' else 0.0
+            plan = self._plan_rolls('extreme', {**main_stats, 'circlet': circlet}, user_priority_subs, weights, cr_needed - main_crit)
+            crit_total = plan['crit_rolls'] * CRIT_RATE_PER_ROLL + main_crit
+            score = plan['score'] + (CDMG_CIRCLET_ROLLS * weights['cdmg'] if circlet == 'cdmg' else 0)
+            rank = (1, score, cr_needed - crit_total) if plan['feasible'] else (0, crit_total, score)
+            if best is None or rank > best[0]: best = (rank, circlet, plan, crit_total)
+        return best[1:]
+
+    def _build_artis(self, mode, selected_set, elem, sands_main_stat, user_priority_subs, existing_cr):
+        # 套装、主词条、副词条优先级、模式与暴击需求相同的角色共用同一份圣遗物方案，命中时返回各部位的副本
+        # 精通模式的空之杯不取决于元素，不计入缓存键
+        key = (mode, str(selected_set.get('id')), selected_set['name'], None if mode == 'mastery' else elem, sands_main_stat, tuple(user_priority_subs), existing_cr)
+        cached = self.plan_cache.get(key)
+        if cached is None:
+            self.plan_stats['miss'] += 1; count('plan_cache_miss')
+            if len(self.plan_cache) >= PLAN_CACHE_SIZE: self.plan_cache.pop(next(iter(self.plan_cache)))
+            cached = self.plan_cache[key] = self._plan_artis(mode, selected_set, elem, sands_main_stat, user_priority_subs, existing_cr)
+        else: self.plan_stats['hit'] += 1; count('plan_cache_hit')
+        artifacts, main_stats, print_rolls_info, notes = cached
+        return {idx: {**piece, 'attrIds': list(piece['attrIds'])} for idx, piece in artifacts.items()}, dict(main_stats), print_rolls_info, list(notes)
+
+    def _plan_artis(self, mode, selected_set, elem, sands_main_stat, user_priority_subs, existing_cr):
+        main_stats = {'flower': 'hpPlus', 'plume': 'atkPlus', 'goblet': elem}
+        notes = []
+
         if mode == 'mastery':
             main_stats.update({'sands': 'mastery', 'goblet': 'mastery', 'circlet': 'mastery'})
-            user_priority_subs = self._select_sub_stats(exclude=['mastery'])
+            weights = priority_weights(['mastery'] + user_priority_subs + FALLBACK_SUBS)
+            plan = self._plan_rolls(mode, main_stats, user_priority_subs, weights)
             print_rolls_info = "极限精通"
-        elif mode == 'extreme':
-            valid_main_stats = {'atk', 'hp', 'def', 'mastery', 'recharge'}
-            sands_main_stat = ''
-            while sands_main_stat not in valid_main_stats: sands_main_stat = input("请选择【沙漏】主词条 (atk/hp/def/mastery/recharge): ").strip().lower()
-            main_stats['sands'] = sands_main_stat
-            user_priority_subs = self._select_sub_stats()
-            main_stats['circlet'] = 'cdmg'
-            try: existing_cr = float(input("请输入角色已有的暴击率 (不含基础5%): ").strip())
-            except ValueError: print("输入无效。"); return
-            cr_needed = 100.0 - 5.0 - existing_cr
-            if cr_needed > (3.89 * 6 * 5): 
-                main_stats['circlet'] = 'cpct'
-                print("\n注意: 暴击率需求过高，已自动切换为【暴击头】。")
-                cr_needed -= 31.1
-            cr_rolls_needed = math.ceil(cr_needed / 3.89) if cr_needed > 0 else 0
-            if cr_rolls_needed > 30: cr_rolls_needed = 30
-            cdmg_rolls = 45 - cr_rolls_needed
-            print_rolls_info = f"{cr_rolls_needed} 暴击 | {cdmg_rolls} 爆伤"
-            roll_pool = ['cpct'] * cr_rolls_needed + ['cdmg'] * cdmg_rolls
-        elif mode == 'nuke':
-            valid_main_stats = {'atk', 'hp', 'def', 'mastery', 'recharge'}
-            sands_main_stat = ''
-            while sands_main_stat not in valid_main_stats: sands_main_stat = input("请选择【沙漏】主词条 (atk/hp/def/mastery/recharge): ").strip().lower()
+        else:
             main_stats['sands'] = sands_main_stat
-            user_priority_subs = self._select_sub_stats(exclude=['cpct'])
             main_stats['circlet'] = 'cdmg'
-            print_rolls_info = "极限爆伤"
+            weights = priority_weights(['cdmg'] + user_priority_subs + FALLBACK_SUBS)
+            if mode == 'extreme':
+                cr_needed = 100.0 - 5.0 - existing_cr
+                main_stats['circlet'], plan, crit_total = self._plan_extreme_rolls(main_stats, user_priority_subs, weights, cr_needed)
+                if main_stats['circlet'] == 'cpct': notes.append("注意: 暴击率需求过高，已自动切换为【暴击头】。")
+                if not plan['feasible']: notes.append("注意: 副词条已尽可能分配给暴击率，仍无法达到 100% 暴击率。")
+                cr_rolls, cdmg_rolls = (sum(rolls.get(stat, 0) for rolls in plan['rolls']) for stat in ('cpct', 'cdmg'))
+                print_rolls_info = f"{cr_rolls} 暴击 | {cdmg_rolls} 爆伤 (暴击率 {5.0 + existing_cr + crit_total:.1f}%)"
+            else:
+                plan = self._plan_rolls(mode, main_stats, user_priority_subs, weights)
+                print_rolls_info = "极限爆伤"
+
+        artifacts = {}
+        for i, (piece_type, piece_rolls) in enumerate(zip(PIECE_TYPES, plan['rolls'])):
+            main_id = self.parser.main_id_by_stat.get(main_stats[piece_type], "0")
+            attr_ids = [int(self.parser.sub_attr_max_ids[stat]) for stat, count in piece_rolls.items() for _ in range(count)]
+            artifacts[str(i + 1)] = {"level": 20, "star": 5, "name": selected_set['idxs'][str(i + 1)]['name'], "mainId": int(main_id), "attrIds": attr_ids}
+        return artifacts, main_stats, print_rolls_info, notes
+
+    @timed('build_avatar')
+    def build_avatar(self, spec):
+        check_spec(spec)
+        mode = spec.get('mode', 'extreme')
+        if mode not in MODE_NAMES: raise ValueError(f"未知的面板类型 '{mode}'。")
+        char_name = str(spec.get('name', '')).strip()
+        target_char_id, target_char_info = self._find_character(char_name)
+        char_name = target_char_info['name']
+        selected_set = self._find_artifact_set(spec.get('set'))
+        weapon_name = str(spec.get('weapon', '')).strip()
+        if not weapon_name: raise ValueError(f"角色【{char_name}】未指定武器名称。")
+
+        sands_main_stat = existing_cr = None
+        if mode == 'mastery':
+            user_priority_subs = self._expand_sub_stats(spec.get('subs', []), exclude=['mastery'])
+        else:
+            sands_main_stat = str(spec.get('sands', '')).strip().lower()
+            if sands_main_stat not in SANDS_MAIN_STATS: raise ValueError(f"无效的沙漏主词条 '{sands_main_stat}' ({'/'.join(SANDS_MAIN_STATS)})。")
+            if mode == 'extreme':
+                user_priority_subs = self._expand_sub_stats(spec.get('subs', []))
+                try: existing_cr = float(spec.get('crit_rate'))
+                except (TypeError, ValueError): raise ValueError(f"角色【{char_name}】的已有暴击率无效。")
+            else:
+                user_priority_subs = self._expand_sub_stats(spec.get('subs', []), exclude=['cpct'])
+        artifacts, main_stats, print_rolls_info, notes = self._build_artis(mode, selected_set, target_char_info['elem'], sands_main_stat, user_priority_subs, existing_cr)
+
+        new_char_data = {"name": target_char_info["name"], "id": int(target_char_id), "elem": target_char_info["elem"], "level": 100, "promote": 6, "fetter": 10, "costume": 0, "cons": 6, "talent": {"a": 10, "e": 10, "q": 10}, "weapon": {"name": weapon_name, "level": 90, "promote": 6, "affix": 5}, "artis": artifacts, "_source": "enka", "_time": 1601258400, "_update": 1601258400, "_talent": 1601258400}
+        summary = {"mode_name": MODE_NAMES[mode], "set_name": selected_set['name'], "main_stats": main_stats, "rolls_info": print_rolls_info, "priority_subs": user_priority_subs, "notes": notes}
+        return str(target_char_id), new_char_data, summary
+
+    def default_spec(self, char_id, target_file, target_data):
+        # 由元数据与同武器类型 (近似同定位) 角色的已有面板推导默认配置，同元素、最近更新者优先
+        char_info = self.parser.char_data[char_id]
+        candidates = [(info.get('elem') == char_info.get('elem'), avatar.get('_update', 0), avatar_id)
+                      for avatar_id, avatar in target_data.get('avatars', {}).items()
+                      for info in [self.parser.char_data.get(avatar_id)] if info and info.get('weapon') == char_info.get('weapon')]
+        if not candidates: raise ValueError(f"{os.path.basename(target_file)} 中没有与【{char_info['name']}】武器类型相同的角色可供参考。")
+        reference = target_data['avatars'][max(candidates)[2]]
+        report = PanelAuditor(self.parser).audit({'avatars': {char_id: reference}})[0]
+        main_stats = {piece_type: self.parser.main_id_map.get(str(reference['artis'].get(str(i + 1), {}).get('mainId'))) for i, piece_type in enumerate(PIECE_TYPES)}
+        modes = [mode for mode, (f, _) in TARGET_FILES.items() if f == target_file] or ['extreme']
+        mode = 'mastery' if 'mastery' in modes and main_stats['circlet'] == 'mastery' else modes[0]
+        flower_name = reference['artis'].get('1', {}).get('name')
+        artifact_set = next((s for s in self.five_star_sets if s['idxs']['1'].get('name') == flower_name), None)
+        if artifact_set is None: raise ValueError(f"参考角色【{reference.get('name')}】的圣遗物【{flower_name}】不在圣遗物数据中。")
 
+        # 副词条取参考面板中强化次数最多的两组 (暴击/爆伤及当前模式不可选的词条除外)
+        exclude = {'cpct', 'cdmg'} | ({'mastery'} if mode == 'mastery' else set())
+        group_rolls = defaultdict(int)
+        for stat, n in report['rolls'].items():
+            if stat not in exclude: group_rolls[next(name for name, keys in self.sub_stat_options.items() if stat in keys)] += n
+        subs = [name for name, _ in sorted(group_rolls.items(), key=lambda item: -item[1])][:2]
+        for name in ['攻击', '元素充能']:
+            if len(subs) < 2 and name not in subs: subs.append(name)
+
+        spec = {'name': char_info['name'], 'set': artifact_set['name'], 'weapon': reference.get('weapon', {}).get('name'), 'mode': mode, 'subs': subs}
+        if mode != 'mastery': spec['sands'] = main_stats['sands'] if main_stats['sands'] in SANDS_MAIN_STATS else 'atk'
+        # 参考面板的圣遗物暴击率与 100% 的差额视为角色与武器自带的暴击率
+        if mode == 'extreme': spec['crit_rate'] = max(0.0, round(100 - report['crit_rate'], 1))
+        return spec, reference.get('name')
+
+    def fill_missing(self, target_file, avatars):
+        # 为 avatars 中缺少的角色按默认配置生成面板并直接加入 avatars，参考角色只从原有面板中选取；返回失败的角色名
+        reference_data, failed = {'avatars': dict(avatars)}, []
+        for char_id in self.missing_characters(reference_data):
+            name = self.parser.char_data[char_id]['name']
+            try:
+                spec, reference_name = self.default_spec(char_id, target_file, reference_data)
+                target_char_id, new_char_data, summary = self.build_avatar(spec)
+            except ValueError as e: print(f"跳过【{name}】: {e}"); failed.append(name); continue
+            avatars[target_char_id] = new_char_data
+            print(f"新增 {target_char_id} 【{name}】参考【{reference_name}】{summary['mode_name']} | {summary['set_name']} | {spec['weapon']} | {summary['rolls_info']}")
+        return failed
+
+    def sync_missing(self, target_files, dry_run=False):
+        # 为各目标文件中缺少的角色按默认配置一次性生成面板，各文件只写入一次；dry_run 时只输出差异
+        added, failed = 0, []
+        with self.deferred_writes() as written:
+            for target_file in target_files:
+                target_data = self.parser.target_data if target_file == self.target_file_path else load_target_file(target_file, self.parser)
+                avatars = dict(target_data.get('avatars', {}))
+                print(f"\n===== {target_file} =====")
+                failed += self.fill_missing(target_file, avatars)
+                if len(avatars) == len(target_data.get('avatars', {})): print("没有需要补全的角色。"); continue
+                added += len(avatars) - len(target_data.get('avatars', {}))
+                new_data = {**target_data, 'avatars': avatars}
+                if dry_run:
+                    old_lines, new_lines = (render_panel(data, compact=False).splitlines() for data in (target_data, new_data))
+                    print('\n'.join(difflib.unified_diff(old_lines, new_lines, f"a/{target_file}", f"b/{target_file}", lineterm='')))
+                else: self._save_target(target_file, new_data)
+        if dry_run: print(f"\n预览完成: 将补全 {added} 个角色，失败 {len(failed)} 个 (未写入任何文件)。")
+        else:
+            for target_file, changed in written.items(): print(f"已写入 {target_file}" if changed else f"{target_file} 内容没有变化，跳过写入。")
+            print(f"\n补全完成: 成功 {added} 个，失败 {len(failed)} 个。")
+        print(f"圣遗物方案缓存: 命中 {self.plan_stats['hit']} 次，计算 {self.plan_stats['miss']} 次。")
+        if failed: print(f"失败角色: {', '.join(failed)}")
+        return not failed
+
+    def _print_summary(self, summary):
+        for note in summary['notes']: print(f"\n{note}")
+        main_stats = summary['main_stats']
         print("\n--- 计算结果 ---")
-        mode_name = "平衡双暴" if mode == 'extreme' else "极限爆伤" if mode == 'nuke' else "极限精通"
-        print(f"面板类型: {mode_name}")
-        print(f"圣遗物套装: {selected_set['name']}")
+        print(f"面板类型: {summary['mode_name']}")
+        print(f"圣遗物套装: {summary['set_name']}")
         print(f"主词条: 沙({main_stats['sands']}), 杯({main_stats['goblet']}), 头({main_stats['circlet']})")
-        print(f"词条分配: {print_rolls_info}")
-        if user_priority_subs: print(f"副词条优先级: {', '.join(user_priority_subs)}")
+        print(f"词条分配: {summary['rolls_info']}")
+        if summary['priority_subs']: print(f"副词条优先级: {', '.join(summary['priority_subs'])}")
         print("-" * 30)
 
-        artifacts = {}
-        for i, piece_type in enumerate(['flower', 'plume', 'sands', 'goblet', 'circlet']):
-            main_stat_name = main_stats[piece_type]
-            main_id = self.parser.elem_dmg_map.get(main_stat_name) or \
-                      next((k for k, v in self.parser.main_id_map.items() if v == main_stat_name), "0")
-            
-            piece_rolls = defaultdict(int)
+    def _save_target(self, target_file, target_data):
+        # 延迟写入期间只记录待写文件，由 flush() 统一写入
+        if self.pending_writes is not None: self.pending_writes[target_file] = target_data; return None
+        written = write_json_atomic(target_file, target_data)
+        self.parser.track_write(target_file, target_data)
+        return written
 
-            final_subs = []
-            mode_priority_subs = []
-            if mode == 'extreme': mode_priority_subs = ['cpct', 'cdmg']
-            elif mode == 'nuke': mode_priority_subs = ['cdmg']
-            elif mode == 'mastery' and piece_type in ['flower', 'plume']: mode_priority_subs = ['mastery']
-            
-            full_priority_list = mode_priority_subs + user_priority_subs
-            added_stats = set()
-            for stat in full_priority_list:
-                if len(final_subs) >= 4: break
-                if stat not in added_stats and stat != main_stat_name:
-                    final_subs.append(stat)
-                    added_stats.add(stat)
-
-            fallback_subs = ['recharge', 'atk', 'hp', 'def', 'mastery', 'atkPlus', 'hpPlus', 'defPlus', 'cdmg', 'cpct']
-            for fb_stat in fallback_subs:
-                if len(final_subs) >= 4: break
-                if fb_stat not in added_stats and fb_stat != main_stat_name:
-                    final_subs.append(fb_stat)
-                    added_stats.add(fb_stat)
-
-            for sub in final_subs: piece_rolls[sub] = 1
-
-            upgrades_left = 5
+    def defer_writes(self):
+        if self.pending_writes is None: self.pending_writes = {}
+
+    def flush(self):
+        pending, self.pending_writes = self.pending_writes or {}, None
+        return {target_file: self._save_target(target_file, target_data) for target_file, target_data in pending.items()}
+
+    @contextlib.contextmanager
+    def deferred_writes(self):
+        # 批量生成时每个目标文件只写入一次，退出时返回 {文件: 是否实际写入}
+        written = {}
+        self.defer_writes()
+        try: yield written
+        finally: written.update(self.flush())
+
+    def generate(self, mode='extreme'):
+        selected_set = self.select_artifact_set()
+        char_name_input = input("请输入要生成的角色名称或别名: ").strip()
+        try: char_name_input = self._find_character(char_name_input)[1]['name']
+        except ValueError as e: print(f"错误: {e}"); return
+        weapon_name = input("请输入武器名称: ").strip()
+        spec = {'name': char_name_input, 'set': selected_set['name'], 'weapon': weapon_name, 'mode': mode}
+
+        if mode == 'mastery':
+            spec['subs'] = self._select_sub_stats(exclude=['mastery'])
+        else:
+            sands_main_stat = ''
+            while sands_main_stat not in SANDS_MAIN_STATS: sands_main_stat = input("请选择【沙漏】主词条 (atk/hp/def/mastery/recharge): ").strip().lower()
+            spec['sands'] = sands_main_stat
             if mode == 'extreme':
-                for _ in range(upgrades_left):
-                    stat_to_add = next((s for s in ['cpct', 'cdmg'] if s in roll_pool and piece_rolls.get(s, 0) < 6), None)
-                    if stat_to_add:
-                        piece_rolls[stat_to_add] += 1
-                        roll_pool.remove(stat_to_add)
-                    else:
-                        upgrade_priority = [s for s in user_priority_subs if s in final_subs]
-                        for stat in upgrade_priority:
-                            if piece_rolls[stat] < 6:
-                                piece_rolls[stat] += 1
-                                break
+                spec['subs'] = self._select_sub_stats()
+                try: spec['crit_rate'] = float(input("请输入角色已有的暴击率 (不含基础5%): ").strip())
+                except ValueError: print("输入无效。"); return
             else:
-                upgrade_priority = [s for s in full_priority_list if s in final_subs]
-                if not upgrade_priority: upgrade_priority = final_subs
-
-                for stat in upgrade_priority:
-                    if upgrades_left == 0: break
-                    can_add = 6 - piece_rolls[stat]
-                    add_count = min(upgrades_left, can_add)
-                    piece_rolls[stat] += add_count
-                    upgrades_left -= add_count
+                spec['subs'] = self._select_sub_stats(exclude=['cpct'])
 
-            attr_ids = [int(self.parser.sub_attr_max_ids[stat]) for stat, count in piece_rolls.items() for _ in range(count)]
-            artifacts[str(i + 1)] = {"level": 20, "star": 5, "name": selected_set['idxs'][str(i + 1)]['name'], "mainId": int(main_id), "attrIds": attr_ids}
+        try: target_char_id, new_char_data, summary = self.build_avatar(spec)
+        except ValueError as e: print(f"错误: {e}"); return
+        self._print_summary(summary)
 
-        new_char_data = {"name": target_char_info["name"], "id": int(target_char_id), "elem": target_char_info["elem"], "level": 100, "promote": 6, "fetter": 10, "costume": 0, "cons": 6, "talent": {"a": 10, "e": 10, "q": 10}, "weapon": {"name": weapon_name, "level": 90, "promote": 6, "affix": 5}, "artis": artifacts, "_source": "enka", "_time": 1601258400, "_update": 1601258400, "_talent": 1601258400}
-        
-        avatars_dict = self.parser.target_data.setdefault("avatars", {})
-        avatars_dict[str(target_char_id)] = new_char_data
-        self.parser.target_data["avatars"] = {k: v for k, v in sorted(avatars_dict.items(), key=lambda item: int(item[0]))}
-        with open(self.target_file_path, 'w', encoding='utf-8') as f: json.dump(self.parser.target_data, f, ensure_ascii=False, indent=2)
+        self.parser.target_data.setdefault("avatars", {})[target_char_id] = new_char_data
+        if self._save_target(self.target_file_path, self.parser.target_data) is False: print(f"\n角色【{char_name_input}】的面板数据没有变化，{self.target_file_path} 未改动。"); return
         print(f"\n成功！角色【{char_name_input}】的面板数据已有序地写入/更新至 {self.target_file_path}")
 
+    def expand_modes(self, spec):
+        # modes 可列出多个面板类型，各类型专属的字段 (subs/crit_rate 等) 可写在以类型名为键的子配置中
+        modes = spec.get('modes') or [spec.get('mode', 'extreme')]
+        if isinstance(modes, str): modes = [modes]
+        base = {k: v for k, v in spec.items() if k not in ('modes', *MODE_NAMES)}
+        variants, mode_by_file = [], {}
+        for mode in modes:
+            if mode not in MODE_NAMES: raise ValueError(f"未知的面板类型 '{mode}'。")
+            target_file = (len(modes) == 1 and spec.get('target')) or TARGET_FILES[mode][0]
+            if target_file in mode_by_file: raise ValueError(f"{MODE_NAMES[mode_by_file[target_file]]}与{MODE_NAMES[mode]}面板都写入 {target_file}，只能选择其一。")
+            mode_by_file[target_file] = mode
+            variants.append((target_file, {**base, **(spec.get(mode) or {}), 'mode': mode}))
+        return variants
+
+    def build_variants(self, spec):
+        # 同一角色的多个面板类型共用已加载的元数据，全部生成成功后再写入
+        return [(target_file, *self.build_avatar(variant_spec)) for target_file, variant_spec in self.expand_modes(spec)]
+
+    def save_variants(self, variants):
+        targets = {}
+        with self.deferred_writes() as written:
+            for target_file, target_char_id, new_char_data, _ in variants:
+                if target_file not in targets: targets[target_file] = self.parser.target_data if target_file == self.target_file_path else load_target_file(target_file, self.parser)
+                targets[target_file].setdefault("avatars", {})[target_char_id] = new_char_data
+                self._save_target(target_file, targets[target_file])
+        return written
+
+    def generate_multi(self):
+        selected_set = self.select_artifact_set()
+        char_name_input = input("请输入要生成的角色名称或别名: ").strip()
+        try: char_name_input = self._find_character(char_name_input)[1]['name']
+        except ValueError as e: print(f"错误: {e}"); return
+        weapon_name = input("请输入武器名称: ").strip()
+        print("\n--- 请选择要同时生成的面板 ---")
+        print("1. 平衡双暴 + 极限爆伤")
+        print("2. 极限精通 + 极限爆伤")
+        choice = input("请选择: ").strip()
+        if choice not in ('1', '2'): print("无效输入。"); return
+        modes = ['extreme' if choice == '1' else 'mastery', 'nuke']
+        spec = {'name': char_name_input, 'set': selected_set['name'], 'weapon': weapon_name, 'modes': modes}
+
+        sands_main_stat = ''
+        while sands_main_stat not in SANDS_MAIN_STATS: sands_main_stat = input("请选择【沙漏】主词条 (atk/hp/def/mastery/recharge): ").strip().lower()
+        spec['sands'] = sands_main_stat
+        if 'extreme' in modes:
+            print(f"\n--- {MODE_NAMES['extreme']} ---")
+            spec['extreme'] = {'subs': self._select_sub_stats()}
+            try: spec['extreme']['crit_rate'] = float(input("请输入角色已有的暴击率 (不含基础5%): ").strip())
+            except ValueError: print("输入无效。"); return
+        else:
+            print(f"\n--- {MODE_NAMES['mastery']} ---")
+            spec['mastery'] = {'subs': self._select_sub_stats(exclude=['mastery'])}
+        print(f"\n--- {MODE_NAMES['nuke']} ---")
+        spec['nuke'] = {'subs': self._select_sub_stats(exclude=['cpct'])}
+
+        try: variants = self.build_variants(spec)
+        except ValueError as e: print(f"错误: {e}"); return
+        for _, _, _, summary in variants: self._print_summary(summary)
+        for target_file, changed in self.save_variants(variants).items():
+            print(f"角色【{char_name_input}】的面板数据已写入 {target_file}" if changed else f"{target_file} 内容没有变化，未改动。")
+
+    def run_batch(self, entries):
+        # 所有角色共用同一份已加载的元数据，目标文件在全部生成后各写入一次
+        targets = {self.target_file_path: self.parser.target_data}
+        generated, failed = defaultdict(list), []
+        with self.deferred_writes() as written:
+            for n, spec in enumerate(entries, 1):
+                label = spec.get('name') or f"#{n}"
+                try:
+                    variants = self.build_variants(spec)
+                    for target_file, *_ in variants:
+                        if target_file not in targets: targets[target_file] = load_target_file(target_file, self.parser)
+                except (KeyError, ValueError) as e:
+                    print(f"[{n}/{len(entries)}] 跳过【{label}】: {e}"); failed.append(label); continue
+                for target_file, target_char_id, new_char_data, summary in variants:
+                    targets[target_file].setdefault("avatars", {})[target_char_id] = new_char_data
+                    self._save_target(target_file, targets[target_file])
+                    generated[target_file].append(label)
+                    print(f"[{n}/{len(entries)}] 【{label}】{summary['mode_name']} | {summary['set_name']} | {summary['rolls_info']}")
+        for target_file, names in generated.items():
+            if written.get(target_file): print(f"已写入 {len(names)} 个角色至 {target_file}")
+            else: print(f"{target_file} 内容没有变化，跳过写入。")
+        print(f"\n批量生成完成: 成功 {sum(len(v) for v in generated.values())} 个，失败 {len(failed)} 个。")
+        print(f"圣遗物方案缓存: 命中 {self.plan_stats['hit']} 次，计算 {self.plan_stats['miss']} 次。")
+        if failed: print(f"失败角色: {', '.join(map(str, failed))}")
+        return not failed
+
+    def sweep(self, base, grid):
+        # 角色与套装只解析一次，各组取值共用圣遗物方案缓存与词条分配结果，生成后由审计器一次性统计各组的词条
+        char_id, char_info = self._find_character(str(base.get('name', '')).strip())
+        base = {**base, 'name': char_info['name'], 'set': self._find_artifact_set(base.get('set'))['name']}
+        rows, avatars = [], {}
+        for point in expand_grid(grid):
+            spec = {**base, **point}
+            try: _, avatar, summary = self.build_avatar(spec)
+            except (KeyError, ValueError) as e: rows.append({'point': point, 'error': str(e)}); continue
+            main_stats = summary['main_stats']
+            existing_cr = float(spec.get('crit_rate') or 0) if spec.get('mode', 'extreme') == 'extreme' else 0.0
+            avatars[str(len(avatars))] = avatar
+            rows.append({'point': point, 'mode': spec.get('mode', 'extreme'), 'main_stats': {k: main_stats[k] for k in ('sands', 'goblet', 'circlet')}, 'existing_cr': existing_cr})
+        reports = iter(PanelAuditor(self.parser).audit({'avatars': avatars}))
+        for row in rows:
+            if 'error' in row: continue
+            report = next(reports)
+            row.update(rolls=report['rolls'], crit_rate=round(report['crit_rate'] + row.pop('existing_cr'), 2), crit_dmg=report['crit_dmg'])
+        return rows
+
+class PanelAuditor:
+    # 一次遍历将整个面板文件的 attrIds 解码为 角色 × 词条 的强化次数矩阵，再按列乘以单次数值得到各项总值
+    # 矩阵为普通的 Python 列表，不依赖 numpy (没有向量化运算)，三个面板文件均在 10 ms 以内
+    def __init__(self, data_parser):
+        self.stats = list(data_parser.sub_attr_max_ids)
+        self.col_by_attr_id = {attr_id: col for col, attr_id in enumerate(data_parser.sub_attr_max_ids.values())}
+        self.roll_values = [SUB_STAT_VALUES[stat] for stat in self.stats]
+        self.main_by_id = {**LEGACY_MAIN_IDS, **data_parser.main_id_map}
+        self.main_by_id.update({main_id: 'phy' if elem == 'phy' else 'dmg' for elem, main_id in data_parser.elem_dmg_map.items()})
+
+    def decode(self, avatars):
+        matrix, pieces = [], []
+        for avatar in avatars.values():
+            row, avatar_pieces = [0] * len(self.stats), []
+            for piece_idx, piece in sorted(avatar.get('artis', {}).items()):
+                cols = [self.col_by_attr_id.get(str(attr_id)) for attr_id in piece.get('attrIds', [])]
+                for col in cols:
+                    if col is not None: row[col] += 1
+                avatar_pieces.append((piece_idx, piece, cols))
+            matrix.append(row); pieces.append(avatar_pieces)
+        return matrix, pieces
+
+    def _piece_anomalies(self, label, piece, cols, main_stat):
+        anomalies = []
+        if main_stat is None: anomalies.append(f"{label}: 未知的主词条ID {piece.get('mainId')}")
+        unknown = [attr_id for attr_id, col in zip(piece.get('attrIds', []), cols) if col is None]
+        if unknown: anomalies.append(f"{label}: 未知的副词条ID {', '.join(map(str, unknown))}")
+        if len(cols) != 9: anomalies.append(f"{label}: 副词条共 {len(cols)} 次 (应为 9 次)")
+        counts = Counter(self.stats[col] for col in cols if col is not None)
+        if len(counts) > 4: anomalies.append(f"{label}: 副词条种类为 {len(counts)} 种 (最多 4 种)")
+        for stat, n in counts.items():
+            if n > 6: anomalies.append(f"{label}: {stat} 强化 {n} 次 (最多 6 次)")
+        if main_stat in counts: anomalies.append(f"{label}: 副词条与主词条相同 ({main_stat})")
+        return anomalies
+
+    def audit(self, target_data, min_crit=None):
+        avatars = target_data.get('avatars', {})
+        matrix, pieces = self.decode(avatars)
+        reports = []
+        for (avatar_id, avatar), row, avatar_pieces in zip(avatars.items(), matrix, pieces):
+            totals = {stat: n * value for stat, n, value in zip(self.stats, row, self.roll_values) if n}
+            anomalies = []
+            for piece_idx, piece, cols in avatar_pieces:
+                main_stat = self.main_by_id.get(str(piece.get('mainId')))
+                if main_stat is not None: totals[main_stat] = totals.get(main_stat, 0) + MAIN_STAT_VALUES[main_stat]
+                label = PIECE_TYPES[int(piece_idx) - 1] if piece_idx in ('1', '2', '3', '4', '5') else piece_idx
+                anomalies += self._piece_anomalies(label, piece, cols, main_stat)
+            missing = [PIECE_TYPES[i] for i in range(5) if str(i + 1) not in avatar.get('artis', {})]
+            if missing: anomalies.append(f"缺少部位: {', '.join(missing)}")
+            crit_rate, crit_dmg = 5 + totals.get('cpct', 0), 50 + totals.get('cdmg', 0)
+            if min_crit is not None and crit_rate < min_crit: anomalies.append(f"暴击率 {crit_rate:.1f}% 低于 {min_crit:g}%")
+            reports.append({
+                'id': avatar_id, 'name': avatar.get('name'), 'crit_rate': round(crit_rate, 2), 'crit_dmg': round(crit_dmg, 2),
+                'rolls': {stat: n for stat, n in zip(self.stats, row) if n},
+                'totals': {stat: round(value, 2) for stat, value in totals.items()}, 'anomalies': anomalies
+            })
+        return reports
+
+class PanelValidator:
+    # 根据生成器的映射表与元数据预先计算各字段的合法取值集合，逐个角色检查面板文件，错误附带 JSON 路径
+    def __init__(self, data_parser):
+        main_ids = lambda *stats: {data_parser.main_id_by_stat[stat] for stat in stats}
+        elems = list(data_parser.elem_dmg_map)
+        self.main_ids_by_piece = {
+            '1': main_ids('hpPlus') | set(LEGACY_MAIN_IDS), '2': main_ids('atkPlus'), '3': main_ids(*SANDS_MAIN_STATS),
+            '4': main_ids('hp', 'atk', 'def', 'mastery', *elems), '5': main_ids('hp', 'atk', 'def', 'mastery', 'cpct', 'cdmg', 'heal')
+        }
+        self.main_stat_by_id = {**LEGACY_MAIN_IDS, **data_parser.main_id_map}
+        self.sub_stat_by_id = {attr_id: stat for stat, attr_id in data_parser.sub_attr_max_ids.items()}
+        self.piece_names = {idx: set() for idx in self.main_ids_by_piece}
+        for artifact_set in data_parser.index['five_star_sets']:
+            for idx, piece in artifact_set['idxs'].items(): self.piece_names.setdefault(idx, set()).add(piece.get('name'))
+        self.char_ids = set(map(str, data_parser.char_data))
+
+    def validate(self, target_data):
+        errors = []
+        error = lambda path, code, message: errors.append({'path': path, 'code': code, 'message': message})
+        if not isinstance(target_data, dict) or not isinstance(target_data.get('avatars'), dict):
+            error('$.avatars', 'schema', "缺少 avatars 对象"); return errors
+        for key in ('uid', 'name'):
+            if not isinstance(target_data.get(key), str): error(f"$.{key}", 'schema', f"缺少字符串字段 {key}")
+        for avatar_id, avatar in target_data['avatars'].items(): self._validate_avatar(f"$.avatars['{avatar_id}']", avatar_id, avatar, error)
+        return errors
+
+    def _validate_fields(self, path, value, fields, error):
+        if not isinstance(value, dict): error(path, 'schema', "应为对象"); return False
+        for key, field_type in fields.items():
+            if not isinstance(value.get(key), field_type): error(f"{path}.{key}", 'schema', f"缺少字段或类型不是 {field_type.__name__}")
+        return True
+
+    def _validate_avatar(self, path, avatar_id, avatar, error):
+        if not self._validate_fields(path, avatar, AVATAR_FIELDS, error): return
+        if str(avatar.get('id')) != avatar_id: error(f"{path}.id", 'id-mismatch', f"角色ID {avatar.get('id')} 与键 {avatar_id} 不一致")
+        if avatar_id not in self.char_ids: error(path, 'unknown-character', f"角色数据中没有ID {avatar_id}")
+        artis = avatar.get('artis')
+        if not isinstance(artis, dict): return
+        for idx in self.main_ids_by_piece:
+            if idx not in artis: error(f"{path}.artis", 'missing-piece', f"缺少部位 {idx} ({PIECE_TYPES[int(idx) - 1]})")
+        for idx, piece in artis.items():
+            piece_path = f"{path}.artis['{idx}']"
+            if idx not in self.main_ids_by_piece: error(piece_path, 'unknown-piece', f"未知的部位 {idx}"); continue
+            if self._validate_fields(piece_path, piece, PIECE_FIELDS, error): self._validate_piece(piece_path, idx, piece, error)
+
+    def _validate_piece(self, path, idx, piece, error):
+        if piece['star'] != 5 or piece['level'] != 20: error(path, 'not-max-level', f"应为 5 星 20 级 (当前 {piece['star']} 星 {piece['level']} 级)")
+        if piece['name'] not in self.piece_names[idx]: error(f"{path}.name", 'unknown-artifact', f"圣遗物数据中没有部位 {idx} 的【{piece['name']}】")
+        main_id = str(piece['mainId'])
+        if main_id not in self.main_ids_by_piece[idx]: error(f"{path}.mainId", 'invalid-main-id', f"主词条ID {main_id} 不能用于部位 {idx} ({PIECE_TYPES[int(idx) - 1]})")
+        attr_ids = piece['attrIds']
+        if len(attr_ids) != 9: error(f"{path}.attrIds", 'roll-count', f"副词条共 {len(attr_ids)} 次 (应为 9 次)")
+        subs = []
+        for i, attr_id in enumerate(attr_ids):
+            stat = self.sub_stat_by_id.get(str(attr_id))
+            if stat is None: error(f"{path}.attrIds[{i}]", 'unknown-sub-id', f"未知的副词条ID {attr_id}")
+            else: subs.append(stat)
+        counts = Counter(subs)
+        if len(counts) > 4: error(f"{path}.attrIds", 'too-many-subs', f"副词条种类为 {len(counts)} 种 (最多 4 种)")
+        for stat, n in counts.items():
+            if n > 6: error(f"{path}.attrIds", 'max-rolls', f"{stat} 强化 {n} 次 (最多 6 次)")
+        main_stat = self.main_stat_by_id.get(main_id)
+        if main_stat in counts: error(f"{path}.attrIds", 'sub-equals-main', f"副词条与主词条相同 ({main_stat})")
+
+def validate_panel_file(validator, target_file):
+    try:
+        with open(target_file, 'rb') as f: target_data = parse_json(f.read())
+    except (OSError, ValueError) as e: return [{'path': '$', 'code': 'unreadable', 'message': str(e)}]
+    return validator.validate(target_data)
+
+class GenshinPanelService(PanelService):
+    # 请求可用 target 或 mode 选择目标文件 (极限/精通与核爆面板)
+    def _target_file(self, request):
+        if request.get('target'): return request['target']
+        mode = request.get('mode', self._spec(request).get('mode', 'extreme'))
+        if not isinstance(mode, str) or mode not in TARGET_FILES: raise ValueError(f"未知的面板类型 '{mode}' (可选: {', '.join(MODE_NAMES)})。")
+        return TARGET_FILES[mode][0]
+
+    def _target_data(self, target_file):
+        if target_file == self.generator.target_file_path: return self.generator.parser.target_data
+        return load_target_file(target_file, self.generator.parser)
+
+    def op_generate(self, request):
+        spec = self._spec(request)
+        if request.get('target') and not spec.get('target'): spec = {**spec, 'target': request['target']}
+        # defer 为 true 时只记录待写文件，直到收到 flush 请求才写入
+        if request.get('write') and request.get('defer'): self.generator.defer_writes()
+        results = []
+        for target_file, target_char_id, new_char_data, summary in self.generator.build_variants(spec):
+            result = {'avatar_id': target_char_id, 'avatar': new_char_data, 'summary': summary}
+            if request.get('write'):
+                target_data = self.generator.pending_writes.get(target_file) if self.generator.pending_writes else None
+                if target_data is None: target_data = self._target_data(target_file)
+                target_data.setdefault("avatars", {})[target_char_id] = new_char_data
+                result.update(target=target_file, written=self.generator._save_target(target_file, target_data))
+            results.append(result)
+        # 使用 modes 时按类型返回多个结果
+        return {'variants': results} if 'modes' in spec else results[0]
+
+    def op_validate(self, request):
+        # 带 spec 时校验生成配置，否则校验面板文件 (target 指定文件，默认全部目标文件)
+        if 'spec' in request:
+            self.generator.build_avatar(self._spec(request))
+            return {}
+        validator = PanelValidator(self.generator.parser)
+        files = [request['target']] if request.get('target') else all_target_files()
+        return {'errors': [{'file': target_file, **error} for target_file in files for error in validate_panel_file(validator, target_file)]}
+
+    def op_list_missing(self, request):
+        target_file = self._target_file(request)
+        pending = self.generator.pending_writes.get(target_file) if self.generator.pending_writes else None
+        missing = self.generator.missing_characters(pending, target_file)
+        return {'missing': [{'id': cid, 'name': self.generator.parser.char_data[cid]['name']} for cid in missing]}
+
+def render_panel(data, compact=None):
+    # 面板文件只在这里排序: 角色按ID、部位按序号、字段按固定顺序，写入与预览差异使用同样的输出
+    with timer('canonical_order'): data = canonical_panel(data, AVATAR_KEY_ORDER, PIECE_KEY_ORDER)
+    with timer('json_dumps'): return dump_json(data, COMPACT_OUTPUT if compact is None else compact)
+
+@timed('write_json')
+def write_json_atomic(filepath, data):
+    content = render_panel(data)
+    if not write_text_atomic(filepath, content): return False
+    count('files_written'); count('bytes_written', len(content.encode('utf-8')))
+    return True
+
+def all_target_files():
+    return list(dict.fromkeys(f for f, _ in TARGET_FILES.values()))
+
+def ensure_target_file(target_file, name=None):
+    if os.path.exists(target_file): return True
+    if name is None: name = next((n for f, n in TARGET_FILES.values() if f == target_file), '预设面板')
+    print(f"目标文件 '{target_file}' 不存在，将创建一个新文件。")
+    try: write_json_atomic(target_file, {"uid": os.path.basename(target_file).split('.')[0], "name": name, "avatars": {}})
+    except IOError as e: print(f"错误: 无法创建文件 '{target_file}': {e}"); return False
+    return True
+
+def load_target_file(target_file, data_parser):
+    if not ensure_target_file(target_file): raise ValueError(f"无法创建目标文件 '{target_file}'。")
+    return data_parser._load_json(target_file)
+
+def run_audit(files, min_crit=None, as_json=False):
+    auditor = PanelAuditor(GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, files[0]))
+    results, ok = {}, True
+    for target_file in files:
+        start = time.perf_counter()
+        try:
+            with open(target_file, 'rb') as f: target_data = parse_json(f.read())
+        except (OSError, ValueError) as e: print(f"错误: 无法读取面板文件 '{target_file}': {e}", file=sys.stderr); ok = False; continue
+        reports = auditor.audit(target_data, min_crit)
+        results[target_file] = reports
+        flagged = sum(1 for report in reports if report['anomalies'])
+        ok = ok and not flagged
+        if as_json: continue
+        print(f"\n===== {target_file}: {len(reports)} 个角色，{flagged} 个存在异常 (用时 {(time.perf_counter() - start) * 1000:.1f} ms) =====")
+        for report in reports:
+            rolls = ' '.join(f"{stat}×{n}" for stat, n in sorted(report['rolls'].items(), key=lambda item: -item[1]))
+            print(f"{report['id']} {report['name']}: 暴击率 {report['crit_rate']:.1f}% | 爆伤 {report['crit_dmg']:.1f}% | {rolls}")
+            for anomaly in report['anomalies']: print(f"  ! {anomaly}")
+    if as_json: print(json.dumps(results, ensure_ascii=False, indent=2))
+    return ok
+
+def run_validate(files, jobs=None):
+    validator = PanelValidator(GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, files[0]))
+    # 校验器只包含预先计算好的集合，可直接传给子进程，多个文件时并行校验
+    if len(files) > 1 and jobs != 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or min(len(files), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(validate_panel_file, [validator] * len(files), files))
+    else: results = [validate_panel_file(validator, target_file) for target_file in files]
+    count = 0
+    for target_file, errors in zip(files, results):
+        for error in errors: print(json.dumps({'file': target_file, **error}, ensure_ascii=False)); count += 1
+    print(f"已校验 {len(files)} 个文件，发现 {count} 个错误。", file=sys.stderr)
+    return count == 0
+
+def run_sync(target_files, dry_run=False):
+    for target_file in target_files:
+        if not ensure_target_file(target_file): return False
+    data_parser = GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, target_files[0])
+    return PanelGenerator(data_parser, target_files[0]).sync_missing(target_files, dry_run)
+
+def regenerate(target_file, spec_file=None, dry_run=False, only=None):
+    # 供 panel-tools.py regen 在子进程中调用: 按批量配置重新生成写入 target_file 的角色，再补全缺少的角色，最后只写入一次；only 为角色ID集合时只重新生成配置中的这些角色
+    for path, name in [(CHAR_DATA_FILE, "角色数据"), (ARTIS_DATA_FILE, "圣遗物数据")]:
+        if not os.path.exists(path): raise ValueError(f"{name}文件未找到，请检查顶部的配置路径: {path}")
+    if not ensure_target_file(target_file): raise ValueError(f"无法创建目标文件 '{target_file}'。")
+    generator = PanelGenerator(GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, target_file), target_file)
+    target_data = generator.parser.target_data
+    avatars, generated, failed = dict(target_data.get('avatars', {})), 0, []
+    for n, spec in enumerate(load_spec(spec_file) if spec_file else [], 1):
+        label = spec.get('name') or f"#{n}"
+        try:
+            if only is not None and generator.spec_avatar_id(spec) not in only: continue
+            variants = [generator.build_avatar(variant_spec) for variant_file, variant_spec in generator.expand_modes(spec) if variant_file == target_file]
+        except (KeyError, ValueError) as e: print(f"跳过【{label}】: {e}"); failed.append(label); continue
+        for target_char_id, new_char_data, summary in variants:
+            avatars[target_char_id] = new_char_data; generated += 1
+            print(f"【{label}】{summary['mode_name']} | {summary['set_name']} | {summary['rolls_info']}")
+    count = len(avatars)
+    failed += generator.fill_missing(target_file, avatars)
+    new_data = {**target_data, 'avatars': avatars}
+    return {'file': target_file, 'generated': generated, 'added': len(avatars) - count, 'failed': failed, 'changed': new_data != target_data,
+            'written': False if dry_run else write_json_atomic(target_file, new_data), 'plan_cache': dict(generator.plan_stats)}
+
+def metadata_files():
+    return [CHAR_DATA_FILE, ARTIS_DATA_FILE]
+
+def metadata_index():
+    # 供 panel-tools.py watch 比较元数据变化: 角色 ID -> (名称, 元素, 武器类型)，套装 ID -> (名称, 各部位名称)
+    data_parser = GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, EXTREME_TARGET_JSON_FILE)
+    return {'characters': {str(cid): (info.get('name'), info.get('elem'), info.get('weapon')) for cid, info in data_parser.char_data.items()},
+            'sets': {str(s['id']): (s['name'], tuple(piece.get('name') for _, piece in sorted(s['idxs'].items()))) for s in data_parser.index['five_star_sets']}}
+
+def affected_avatars(target_data, previous, current):
+    # 对比前后两次 metadata_index()，找出角色信息变化/被移除、或所用套装变化/被移除的已有角色，返回 ID -> 原因
+    set_by_piece = {piece: info[0] for sid, info in previous['sets'].items() if current['sets'].get(sid) != info for piece in info[1]}
+    affected = {}
+    for avatar_id, avatar in target_data.get('avatars', {}).items():
+        reasons = []
+        if avatar_id in previous['characters'] and current['characters'].get(avatar_id) != previous['characters'][avatar_id]:
+            reasons.append("角色数据已变化" if avatar_id in current['characters'] else "角色已从元数据中移除")
+        artis = avatar.get('artis') if isinstance(avatar.get('artis'), dict) else {}
+        sets = sorted({set_by_piece[piece['name']] for piece in artis.values() if isinstance(piece, dict) and piece.get('name') in set_by_piece})
+        if sets: reasons.append(f"套装【{'、'.join(sets)}】已变化或被移除")
+        if reasons: affected[avatar_id] = f"{avatar.get('name')}: {'；'.join(reasons)}"
+    return affected
+
 def main_loop():
     while True:
         print("\n===== 模式选择 =====")
         print("1. 极限/精通面板 (写入 100000000.json)")
         print("2. 核爆面板 (写入 100000001.json)")
-        print("3. 退出")
+        print("3. 同时生成极限/精通与核爆面板")
+        print("4. 退出")
         mode_choice = input("请选择模式: ").strip()
 
         if mode_choice == '1':
@@ -252,22 +855,22 @@ def main_loop():
         elif mode_choice == '2':
             target_file, mode, name = NUKE_TARGET_JSON_FILE, 'nuke', '核爆面板'
         elif mode_choice == '3':
+            for target_file, name in [(EXTREME_TARGET_JSON_FILE, '极限面板'), (NUKE_TARGET_JSON_FILE, '核爆面板')]:
+                if not ensure_target_file(target_file, name): break
+            else: PanelGenerator(GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, EXTREME_TARGET_JSON_FILE), EXTREME_TARGET_JSON_FILE).generate_multi()
+            continue
+        elif mode_choice == '4':
             print("程序已退出。"); break
         else:
             print("无效输入。"); continue
 
-        if not os.path.exists(target_file):
-            print(f"目标文件 '{target_file}' 不存在，将创建一个新文件。")
-            try:
-                with open(target_file, 'w', encoding='utf-8') as f: json.dump({"uid": os.path.basename(target_file).split('.')[0], "name": name, "avatars": {}}, f, indent=2)
-            except IOError as e: print(f"错误: 无法创建文件 '{target_file}': {e}"); continue
+        if not ensure_target_file(target_file, name): continue
         
         data_parser = GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, target_file)
         generator = PanelGenerator(data_parser, target_file)
 
         while True:
-            mode_name = "平衡双暴" if mode == 'extreme' else "极限精通" if mode == 'mastery' else "极限爆伤"
-            print(f"\n--- 当前模式: {mode_name} ---")
+            print(f"\n--- 当前模式: {MODE_NAMES[mode]} ---")
             print("1. 查看未收录角色列表")
             print("2. 生成新的角色面板")
             print("3. 返回主菜单")
@@ -277,8 +880,92 @@ def main_loop():
             elif sub_choice == '3': break
             else: print("无效输入。")
 
+def run_batch(spec_file):
+    try: entries = load_spec(spec_file)
+    except (OSError, ValueError) as e: print(f"错误: 无法读取批量配置 '{spec_file}': {e}"); return False
+    if not entries: print(f"错误: 批量配置 '{spec_file}' 中没有角色。"); return False
+    if not ensure_target_file(EXTREME_TARGET_JSON_FILE): return False
+    data_parser = GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, EXTREME_TARGET_JSON_FILE)
+    return PanelGenerator(data_parser, EXTREME_TARGET_JSON_FILE).run_batch(entries)
+
+def run_sweep(spec_file, as_json=False):
+    # 配置文件中 base 为基础配置 (同批量配置中的单个角色)，grid 为要扫描的参数，如 crit_rate/sands/subs/mode
+    try:
+        spec = read_spec_file(spec_file) or {}
+        base, grid = {**spec.get('defaults', {}), **spec.get('base', {})}, spec.get('grid') or {}
+        if not isinstance(grid, dict) or not grid: raise ValueError("缺少 grid 参数。")
+    except (OSError, ValueError, AttributeError) as e: print(f"错误: 无法读取扫描配置 '{spec_file}': {e}"); return False
+    start = time.perf_counter()
+    generator = PanelGenerator(GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, EXTREME_TARGET_JSON_FILE), EXTREME_TARGET_JSON_FILE)
+    try: rows = generator.sweep(base, grid)
+    except ValueError as e: print(f"错误: {e}"); return False
+    elapsed, states = (time.perf_counter() - start) * 1000, roll_states.cache_info()
+    for row in rows:
+        if as_json: print(json.dumps(row, ensure_ascii=False)); continue
+        point = ' '.join(f"{key}={format_grid_value(value)}" for key, value in row['point'].items())
+        if 'error' in row: print(f"{point} | 错误: {row['error']}"); continue
+        rolls = row['rolls']
+        others = ' '.join(f"{stat}×{n}" for stat, n in sorted(rolls.items(), key=lambda item: -item[1]) if stat not in ('cpct', 'cdmg'))
+        short = ' (未满暴击)' if row['mode'] == 'extreme' and row['crit_rate'] < 100 - 1e-6 else ''
+        print(f"{point} | 沙/杯/头 {'/'.join(row['main_stats'].values())} | 暴击 {rolls.get('cpct', 0)} 爆伤 {rolls.get('cdmg', 0)} | {others} | 暴击率 {row['crit_rate']:.1f}%{short} 爆伤 {row['crit_dmg']:.1f}%")
+    print(f"\n共 {len(rows)} 组 (失败 {sum('error' in row for row in rows)} 组)，用时 {elapsed:.1f} ms；圣遗物方案缓存: 命中 {generator.plan_stats['hit']} 次，计算 {generator.plan_stats['miss']} 次；"
+          f"词条分配: 命中 {states.hits} 次，计算 {states.misses} 次。", file=sys.stderr if as_json else sys.stdout)
+    return not any('error' in row for row in rows)
+
+def run_service(socket_path=None):
+    # 使用标准输入/输出时，标准输出专用于协议，其他提示信息改写到标准错误
+    if not socket_path: out, sys.stdout = sys.stdout, sys.stderr
+    if not ensure_target_file(EXTREME_TARGET_JSON_FILE): return False
+    data_parser = GenshinDataParser(CHAR_DATA_FILE, ARTIS_DATA_FILE, EXTREME_TARGET_JSON_FILE)
+    service = GenshinPanelService(PanelGenerator(data_parser, EXTREME_TARGET_JSON_FILE))
+    if not socket_path: service.serve_stdio(out); return True
+    try: service.serve_socket(socket_path)
+    except ValueError as e: print(f"错误: {e}"); return False
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="原神预设面板生成脚本，不带参数运行时进入交互模式")
+    subparsers = parser.add_subparsers(dest='command')
+    batch_parser = subparsers.add_parser('batch', help="按 JSON/YAML 配置文件批量生成角色面板")
+    batch_parser.add_argument('spec', help="批量配置文件路径 (.json/.yaml)")
+    serve_parser = subparsers.add_parser('serve', help="以常驻进程运行，从标准输入或 Unix 套接字读取 JSON-lines 请求")
+    serve_parser.add_argument('--socket', help="Unix 套接字路径，不指定时使用标准输入/输出")
+    audit_parser = subparsers.add_parser('audit', help="统计面板文件中每个角色的词条总值与强化次数，并列出异常")
+    audit_parser.add_argument('files', nargs='*', help="面板文件路径，默认检查全部目标文件")
+    audit_parser.add_argument('--min-crit', type=float, help="暴击率 (含基础5%%) 低于该值时视为异常")
+    audit_parser.add_argument('--json', action='store_true', help="以 JSON 格式输出")
+    validate_parser = subparsers.add_parser('validate', help="校验面板文件的结构与取值，每个错误输出一行 JSON")
+    validate_parser.add_argument('files', nargs='*', help="面板文件路径，默认校验全部目标文件")
+    validate_parser.add_argument('--jobs', type=int, help="并行进程数，默认按文件数")
+    sweep_parser = subparsers.add_parser('sweep', help="按配置中的参数网格批量计算词条分配与主词条选择，输出对照表 (不写入文件)")
+    sweep_parser.add_argument('spec', help="扫描配置文件路径 (.json/.yaml)，包含 base 与 grid")
+    sweep_parser.add_argument('--json', action='store_true', help="每组结果输出一行 JSON")
+    sync_parser = subparsers.add_parser('sync', help="按同武器类型角色的已有面板为缺少的角色批量生成默认面板")
+    sync_parser.add_argument('files', nargs='*', help="目标面板文件路径，默认全部目标文件")
+    sync_parser.add_argument('--dry-run', action='store_true', help="只输出将要写入的差异，不修改文件")
+    parser.add_argument('--no-cache', action='store_true', help="不读写元数据快照缓存")
+    parser.add_argument('--compact', action='store_true', help="面板文件写为无缩进的紧凑格式")
+    parser.add_argument('--profile', metavar='FILE', help=f"统计各阶段耗时与计数，退出时写入 JSON 报告 (也可设置环境变量 {PROFILE_ENV})")
+    parser.add_argument('--cprofile', metavar='FILE', help=f"同时以 cProfile 记录并写入统计文件 (也可设置环境变量 {CPROFILE_ENV})")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    print("--- 欢迎使用原神预设面板生成脚本 ---")
+    args = parse_args()
+    if args.no_cache: CACHE_DIR = None
+    if args.compact: COMPACT_OUTPUT = True
+    profile_file, cprofile_file = args.profile or os.environ.get(PROFILE_ENV), args.cprofile or os.environ.get(CPROFILE_ENV)
+    if profile_file or cprofile_file: start_profiling(profile_file, cprofile_file)
+    # 审计只读取面板文件，不需要 miao-plugin 数据
+    if args.command == 'audit': exit(0 if run_audit(args.files or all_target_files(), args.min_crit, args.json) else 1)
+    if args.command not in ('serve', 'validate', 'sweep'): print("--- 欢迎使用原神预设面板生成脚本 ---")
     for path, name in [(CHAR_DATA_FILE, "角色数据"), (ARTIS_DATA_FILE, "圣遗物数据")]:
         if not os.path.exists(path): print(f"错误: {name}文件未找到，请检查顶部的配置路径: {path}"); exit()
-    main_loop()
\ No newline at end of file
+    # 数据文件或目标文件损坏时只在这里退出，常驻服务中同样的错误作为该请求的错误响应返回
+    try:
+        if args.command == 'batch': exit(0 if run_batch(args.spec) else 1)
+        if args.command == 'serve': exit(0 if run_service(args.socket) else 1)
+        if args.command == 'sweep': exit(0 if run_sweep(args.spec, args.json) else 1)
+        if args.command == 'sync': exit(0 if run_sync(args.files or all_target_files(), args.dry_run) else 1)
+        if args.command == 'validate': exit(0 if run_validate(args.files or all_target_files(), args.jobs) else 1)
+        main_loop()
+    except DataFileError as e: print(f"错误: {e}"); exit(1)
@@ -0,0 +1,197 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 预设面板生成脚本基准测试: 以仓库自带的面板文件为“当前规模”，按倍数复制出合成的 miao-plugin 元数据与面板文件，
+# 分阶段计时 (元数据读取、索引构建、快照读取、单个角色生成、写入面板文件)，并与保存的基准结果比较
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+JSON_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'json')
+# 默认的基准结果文件 (位于用户缓存目录下，与生成脚本的元数据快照同一目录)，使用 --save 写入
+BASELINE_FILE = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'presetPanel', 'panel-bench.json')
+PHASES = ['load', 'index', 'snapshot', 'generate', 'serialize']
+PHASE_NAMES = {'load': '读取元数据', 'index': '构建索引', 'snapshot': '读取快照', 'generate': '生成 (每个角色)', 'serialize': '写入面板文件'}
+GS_WEAPON_TYPES = ['sword', 'claymore', 'polearm', 'catalyst', 'bow']
+SR_PATHS = ['毁灭', '巡猎', '智识', '同谐', '虚无', '存护', '丰饶', '记忆']
+
+def load_generator(game):
+    script = os.path.join(SCRIPT_DIR, GAMES[game]['script'])
+    spec = importlib.util.spec_from_file_location(f"panel_generator_{game}", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False)
+
+# ---------- 合成数据: 第 k 份副本的角色ID、名称、套装与部位名称/ID均带偏移或后缀，各副本互不重名 ----------
+
+def synth_gs(scale, out_dir):
+    with open(os.path.join(JSON_DIR, 'gs', '100000000.json'), 'r', encoding='utf-8') as f: source = json.load(f)
+    chars, sets, avatars = {}, {}, {}
+    set_ids = {}
+    for avatar in source['avatars'].values():
+        names = tuple(avatar['artis'][str(i)]['name'] for i in range(1, 6))
+        set_ids.setdefault(names, 15000 + len(set_ids) + 1)
+    for k in range(scale):
+        suffix = f"#{k}" if k else ""
+        for names, set_id in set_ids.items():
+            sid = str(set_id + k * 1000)
+            sets[sid] = {'id': sid, 'name': f"套装{sid}", 'idxs': {str(i + 1): {'id': f"{sid}{i}", 'name': name + suffix} for i, name in enumerate(names)}}
+        for avatar_id, avatar in source['avatars'].items():
+            cid = str(int(avatar_id) + k * 100000000)
+            chars[cid] = {'id': int(cid), 'name': avatar['name'] + suffix, 'abbr': avatar['name'][-2:], 'star': 5, 'elem': avatar['elem'], 'weapon': GS_WEAPON_TYPES[int(avatar_id) % 5]}
+            artis = {idx: {**piece, 'name': piece['name'] + suffix} for idx, piece in avatar['artis'].items()}
+            avatars[cid] = {**avatar, 'id': int(cid), 'name': avatar['name'] + suffix, 'artis': artis}
+    files = {'char': os.path.join(out_dir, 'meta-gs', 'character', 'data.json'), 'artis': os.path.join(out_dir, 'meta-gs', 'artifact', 'data.json'),
+             'target': os.path.join(out_dir, 'gs', '100000000.json')}
+    write_json(files['char'], chars); write_json(files['artis'], sets); write_json(files['target'], {**source, 'avatars': avatars})
+    return files
+
+def synth_sr(scale, out_dir):
+    with open(os.path.join(JSON_DIR, 'sr', '100000000.json'), 'r', encoding='utf-8') as f: source = json.load(f)
+    chars, relics, weapons, avatars = {}, {}, {}, {}
+    # 遗器ID为 品质 + 套装ID + 部位，隧洞遗器 (套装ID < 300) 有 1-4 号部位，位面饰品有 5、6 号部位
+    set_ids = sorted({int(str(piece['id'])[1:4]) for avatar in source['avatars'].values() for piece in avatar['artis'].values()})
+    for k in range(scale):
+        suffix = f"#{k}" if k else ""
+        # 套装ID小于 200 的为隧洞遗器，数量受ID范围限制，只复制位面饰品套装
+        for set_id in set_ids:
+            if set_id < 300 and k: continue
+            sid = set_id + (k * 100 if set_id >= 300 else 0)
+            pieces = range(1, 5) if set_id < 300 else range(5, 7)
+            relics[str(sid)] = {'id': str(sid), 'name': f"遗器{sid}", 'idxs': {str(p): {'name': f"遗器{sid}-{p}", 'ids': {f"{r}{sid}{p}": r - 1 for r in range(3, 7)}} for p in pieces}}
+        for avatar_id, avatar in source['avatars'].items():
+            cid = str(int(avatar_id) + k * 10000)
+            chars[cid] = {'id': int(cid), 'name': avatar['name'] + suffix, 'elem': avatar['elem'], 'star': 5, 'weapon': SR_PATHS[int(avatar_id) % 8]}
+            wid = avatar['weapon']['id'] + k * 100000
+            weapons[str(wid)] = {'id': wid, 'name': f"光锥{wid}", 'star': 5, 'type': SR_PATHS[wid % 8]}
+            artis = {}
+            for idx, piece in avatar['artis'].items():
+                set_id = int(str(piece['id'])[1:4])
+                artis[idx] = {**piece, 'id': int(f"6{set_id + k * 100}{idx}") if set_id >= 300 else piece['id']}
+            avatars[cid] = {**avatar, 'id': int(cid), 'name': avatar['name'] + suffix, 'weapon': {**avatar['weapon'], 'id': wid}, 'artis': artis}
+    files = {'char': os.path.join(out_dir, 'meta-sr', 'character', 'data.json'), 'relic': os.path.join(out_dir, 'meta-sr', 'artifact', 'data.json'),
+             'weapon': os.path.join(out_dir, 'meta-sr', 'weapon', 'data.json'), 'target': os.path.join(out_dir, 'sr', '100000000.json')}
+    write_json(files['char'], chars); write_json(files['relic'], relics); write_json(files['weapon'], weapons); write_json(files['target'], {**source, 'avatars': avatars})
+    return files
+
+GAMES = {
+    'gs': {'script': '100000000.py', 'parser': 'GenshinDataParser', 'sources': ['char', 'artis'], 'synth': synth_gs,
+           'default_spec': lambda generator, char_id, files, target_data: generator.default_spec(char_id, files['target'], target_data)},
+    'sr': {'script': '100000000-SR.py', 'parser': 'StarRailDataParser', 'sources': ['char', 'relic', 'weapon'], 'synth': synth_sr,
+           'default_spec': lambda generator, char_id, files, target_data: generator.default_spec(char_id, target_data)}
+}
+
+# ---------- 计时 ----------
+
+def bench_game(game, scale, work_dir, repeat=3, max_avatars=200):
+    config = GAMES[game]
+    files = config['synth'](scale, os.path.join(work_dir, f"{game}-{scale}x"))
+    module = load_generator(game)
+    make_parser = lambda: getattr(module, config['parser'])(*[files[k] for k in config['sources']], files['target'])
+    best = {}
+    record = lambda phase, seconds: best.__setitem__(phase, min(best.get(phase, seconds), seconds))
+    for _ in range(repeat):
+        # 读取与索引分开计时，不使用快照
+        module.CACHE_DIR = None
+        parser = make_parser()
+        sources = {}
+        start = time.perf_counter()
+        for kind in config['sources']: sources[kind] = parser._load_json(files[kind])
+        record('load', time.perf_counter() - start)
+        start = time.perf_counter()
+        for kind in config['sources']: parser.indexers[kind](sources[kind])
+        record('index', time.perf_counter() - start)
+        # 快照: 先写入一次，再计时从快照读取全部元数据
+        module.CACHE_DIR = os.path.join(work_dir, '.panel-cache')
+        for kind in config['sources']: make_parser()._source(kind)
+        parser = make_parser()
+        start = time.perf_counter()
+        for kind in config['sources']: parser._source(kind)
+        record('snapshot', time.perf_counter() - start)
+        # 生成: 与 sync 相同，由已有面板推导默认配置，只计 build_avatar 的耗时；各副本的配置相同，每个角色前清空方案缓存与词条分配缓存，使各规模可比
+        generator = module.PanelGenerator(parser, files['target'])
+        target_data = parser.target_data
+        char_ids = list(target_data['avatars'])
+        char_ids = char_ids[::max(1, len(char_ids) // max_avatars)][:max_avatars]
+        specs = []
+        for char_id in char_ids:
+            try: specs.append(config['default_spec'](generator, char_id, files, target_data)[0])
+            except ValueError: pass
+        # 没有可生成的角色 (如面板文件为空) 时无法计时，跳过该游戏
+        if not specs: return None
+        start = time.perf_counter()
+        for spec in specs:
+            generator.plan_cache.clear(); module.roll_states.cache_clear(); generator.build_avatar(spec)
+        record('generate', (time.perf_counter() - start) / len(specs))
+        out_file = os.path.join(work_dir, f"{game}-{scale}x-out.json")
+        if os.path.exists(out_file): os.remove(out_file)
+        start = time.perf_counter()
+        module.write_json_atomic(out_file, target_data)
+        record('serialize', time.perf_counter() - start)
+    return {'avatars': len(target_data['avatars']), 'size': os.path.getsize(files['target']), **best}
+
+def compare(results, baseline, threshold):
+    # 返回超过基准 (1 + threshold) 倍的阶段列表
+    regressions = []
+    for game, scales in results.items():
+        for scale, phases in scales.items():
+            base = baseline.get(game, {}).get(scale)
+            if not base: continue
+            for phase in PHASES:
+                if base.get(phase) and phases[phase] > base[phase] * (1 + threshold): regressions.append((game, scale, phase, base[phase], phases[phase]))
+    return regressions
+
+def run_bench(games, scales, repeat, max_avatars, baseline_file, save=False, threshold=0.2, keep=None):
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file, 'r', encoding='utf-8') as f: baseline = json.load(f)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='panel-bench-') as tmp_dir:
+        work_dir = keep or tmp_dir
+        for game in games:
+            for scale in scales:
+                print(f"正在测试 {GAMES[game]['script']} {scale}× ...", file=sys.stderr)
+                result = bench_game(game, scale, work_dir, repeat, max_avatars)
+                if result is None: print(f"{GAMES[game]['script']} 没有可生成的角色，跳过。", file=sys.stderr); break
+                results.setdefault(game, {})[str(scale)] = result
+    print(f"{'游戏':<4}{'规模':>6}{'角色数':>8}{'文件大小':>10}" + ''.join(f"{PHASE_NAMES[phase]:>12}" for phase in PHASES))
+    for game, scales in results.items():
+        for scale, phases in scales.items():
+            base = baseline.get(game, {}).get(scale, {})
+            cells = []
+            for phase in PHASES:
+                cell = f"{phases[phase] * 1000:.2f}ms"
+                if base.get(phase): cell += f"({phases[phase] / base[phase] - 1:+.0%})"
+                cells.append(f"{cell:>16}")
+            print(f"{game:<6}{scale + '×':>6}{phases['avatars']:>9}{phases['size'] / 1024:>10.0f}K" + ''.join(cells))
+    regressions = compare(results, baseline, threshold)
+    for game, scale, phase, base, current in regressions:
+        print(f"回归: {game} {scale}× {PHASE_NAMES[phase]} {base * 1000:.2f}ms -> {current * 1000:.2f}ms (+{current / base - 1:.0%})")
+    if save:
+        write_json(os.path.abspath(baseline_file), {**baseline, **{game: {**baseline.get(game, {}), **scales} for game, scales in results.items()}})
+        print(f"已保存基准结果至 {baseline_file}")
+    elif not baseline: print(f"没有基准结果，可使用 --save 将本次结果保存至 {baseline_file}")
+    return not regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="预设面板生成脚本基准测试 (使用合成数据，不需要 miao-plugin)")
+    parser.add_argument('--game', action='append', choices=list(GAMES), help="只测试指定游戏，可重复")
+    parser.add_argument('--scale', type=int, action='append', help="数据规模倍数，可重复，默认 1、10、100")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数，各阶段取最短耗时，默认 3")
+    parser.add_argument('--avatars', type=int, default=200, help="生成阶段最多测试的角色数，默认 200")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f"基准结果文件，默认 {BASELINE_FILE}")
+    parser.add_argument('--save', action='store_true', help="将本次结果保存为基准")
+    parser.add_argument('--threshold', type=float, default=0.2, help="比基准慢多少视为回归，默认 0.2 (20%%)")
+    parser.add_argument('--keep', help="将合成数据保留在指定目录")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    ok = run_bench(args.game or list(GAMES), args.scale or [1, 10, 100], args.repeat, args.avatars, args.baseline, args.save, args.threshold, args.keep)
+    exit(0 if ok else 1)
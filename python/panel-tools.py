@@ -0,0 +1,580 @@
+import argparse
+import array
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from panel_common import PanelReader, dump_json, parse_json, write_text_atomic
+
+# 预设面板文件工具: 与原神/星铁生成脚本共用同一面板格式，不依赖 miao-plugin 数据
+# 分片目录中的清单文件名
+MANIFEST_FILE = 'manifest.json'
+# 紧凑格式标识: 相同的圣遗物/遗器部位存为共享模板，按内容哈希引用
+PACK_FORMAT = 'presetPanel-pack'
+PACK_VERSION = 1
+# regen 命令调用的生成脚本，需与本工具放在同一目录，路径配置沿用各脚本顶部的设置
+GENERATOR_SCRIPTS = {'gs': '100000000.py', 'sr': '100000000-SR.py'}
+
+def load_json(filepath):
+    with open(filepath, 'rb') as f: return parse_json(f.read())
+
+def write_json_atomic(filepath, data, compact=False):
+    return write_text_atomic(filepath, dump_json(data, compact))
+
+def sort_avatars(avatars):
+    return {k: v for k, v in sorted(avatars.items(), key=lambda item: int(item[0]))}
+
+# ---------- 分片存储: 每个角色一个文件，另有清单记录文件头与各角色的摘要 ----------
+
+def _shard_entry(avatar_id, avatar):
+    content = dump_json(avatar).encode('utf-8')
+    return {"name": avatar.get('name'), "file": f"{avatar_id}.json", "size": len(content), "sha1": hashlib.sha1(content).hexdigest()}
+
+def load_manifest(shard_dir):
+    manifest_file = os.path.join(shard_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file): raise ValueError(f"'{shard_dir}' 不是分片目录 (缺少 {MANIFEST_FILE})。")
+    return load_json(manifest_file)
+
+def shard_panel_file(panel_file, shard_dir):
+    data = load_panel(panel_file)
+    avatars = sort_avatars(data.get('avatars', {}))
+    # 文件头保留原有键顺序，avatars 位置用 null 占位，合并时原样还原
+    header = {k: (None if k == 'avatars' else v) for k, v in data.items()}
+    header.setdefault('avatars', None)
+    # 已有的分片目录只清理上次清单中记录、本次已没有的分片；没有清单的非空目录可能存放着其他文件 (如面板文件本身)，拒绝写入
+    previous = {}
+    if os.path.isfile(os.path.join(shard_dir, MANIFEST_FILE)): previous = load_manifest(shard_dir).get('avatars', {})
+    elif os.path.isdir(shard_dir) and os.listdir(shard_dir): raise ValueError(f"'{shard_dir}' 不是空目录且没有 {MANIFEST_FILE}，请指定新的目录或已有的分片目录。")
+    os.makedirs(shard_dir, exist_ok=True)
+    written = 0
+    manifest = {"header": header, "avatars": {}}
+    for avatar_id, avatar in avatars.items():
+        manifest['avatars'][avatar_id] = _shard_entry(avatar_id, avatar)
+        written += write_json_atomic(os.path.join(shard_dir, f"{avatar_id}.json"), avatar)
+    for avatar_id, entry in previous.items():
+        stale_file = os.path.join(shard_dir, os.path.basename(str(entry.get('file') or f"{avatar_id}.json")))
+        if avatar_id not in manifest['avatars'] and os.path.isfile(stale_file): os.remove(stale_file)
+    write_json_atomic(os.path.join(shard_dir, MANIFEST_FILE), manifest)
+    return len(avatars), written
+
+def read_shard(shard_dir, avatar_id, manifest=None):
+    if manifest is None: manifest = load_manifest(shard_dir)
+    entry = manifest['avatars'].get(str(avatar_id))
+    if entry is None: return None
+    return load_json(os.path.join(shard_dir, entry['file']))
+
+def put_shard(shard_dir, avatar):
+    manifest = load_manifest(shard_dir)
+    avatar_id = str(avatar['id'])
+    changed = write_json_atomic(os.path.join(shard_dir, f"{avatar_id}.json"), avatar)
+    manifest['avatars'][avatar_id] = _shard_entry(avatar_id, avatar)
+    manifest['avatars'] = sort_avatars(manifest['avatars'])
+    write_json_atomic(os.path.join(shard_dir, MANIFEST_FILE), manifest)
+    return changed
+
+def unshard_panel_dir(shard_dir, panel_file):
+    manifest = load_manifest(shard_dir)
+    data = dict(manifest['header'])
+    data['avatars'] = {avatar_id: read_shard(shard_dir, avatar_id, manifest) for avatar_id in manifest['avatars']}
+    return len(data['avatars']), write_json_atomic(panel_file, data)
+
+# ---------- 读取单个角色 ----------
+
+def read_avatar(path, avatar_id):
+    # path 可以是分片目录、普通面板文件或紧凑格式文件 (只展开所需的角色)
+    if os.path.isdir(path): return read_shard(path, avatar_id)
+    # 普通面板文件通过字节偏移索引只解码该角色
+    with PanelReader(path) as reader:
+        if reader.offsets is not None: return reader.read(avatar_id)
+    data = load_json(path)
+    if is_packed(data): return expand_avatar(data, avatar_id)
+    return data.get('avatars', {}).get(str(avatar_id))
+
+# ---------- 紧凑格式: 部位模板按内容哈希共享，attrIds 以 [值, 连续次数] 游程编码 ----------
+
+def is_packed(data):
+    return isinstance(data, dict) and data.get('format') == PACK_FORMAT
+
+def encode_runs(values):
+    runs = []
+    for value in values:
+        if runs and runs[-1][0] == value: runs[-1][1] += 1
+        else: runs.append([value, 1])
+    return runs
+
+def decode_runs(runs):
+    return [value for value, count in runs for _ in range(count)]
+
+def pack_panel_data(data):
+    templates, avatars = {}, {}
+    for avatar_id, avatar in data.get('avatars', {}).items():
+        artis = avatar.get('artis')
+        if not isinstance(artis, dict): avatars[avatar_id] = avatar; continue
+        refs = {}
+        for idx, piece in artis.items():
+            # attrIds 不是列表的部位原样内联，展开时以类型区分模板引用 (字符串) 与内联部位 (对象)
+            if not isinstance(piece, dict) or not isinstance(piece.get('attrIds'), list): refs[idx] = piece; continue
+            template = {k: (encode_runs(v) if k == 'attrIds' else v) for k, v in piece.items()}
+            digest = hashlib.sha1(dump_json(template, compact=True).encode('utf-8')).hexdigest()
+            key = digest[:12] if templates.get(digest[:12], template) == template else digest
+            templates[key] = template; refs[idx] = key
+        avatars[avatar_id] = {k: (refs if k == 'artis' else v) for k, v in avatar.items()}
+    header = {k: (None if k == 'avatars' else v) for k, v in data.items()}
+    header.setdefault('avatars', None)
+    return {"format": PACK_FORMAT, "version": PACK_VERSION, "header": header, "templates": templates, "avatars": avatars}
+
+def expand_avatar(pack, avatar_id):
+    avatar = pack['avatars'].get(str(avatar_id))
+    if avatar is None or not isinstance(avatar.get('artis'), dict): return avatar
+    templates = pack['templates']
+    artis = {}
+    for idx, ref in avatar['artis'].items():
+        if not isinstance(ref, str): artis[idx] = ref; continue
+        if ref not in templates: raise ValueError(f"角色 {avatar_id} 引用的模板 {ref} 不存在。")
+        artis[idx] = {k: (decode_runs(v) if k == 'attrIds' else v) for k, v in templates[ref].items()}
+    return {k: (artis if k == 'artis' else v) for k, v in avatar.items()}
+
+def unpack_panel_data(pack):
+    if pack.get('version') != PACK_VERSION: raise ValueError(f"不支持的紧凑格式版本 {pack.get('version')}。")
+    data = dict(pack['header'])
+    data['avatars'] = {avatar_id: expand_avatar(pack, avatar_id) for avatar_id in pack['avatars']}
+    return data
+
+def load_panel(path):
+    # 读取面板文件，紧凑格式自动展开为原格式
+    data = load_json(path)
+    return unpack_panel_data(data) if is_packed(data) else data
+
+# ---------- 紧凑对象模型: 角色/武器/部位为 __slots__ 对象，副词条为整数数组，可与原格式无损互转 ----------
+# 独立的实验: 只有 model 命令用它评估内存占用，其他命令与生成脚本仍使用原格式的 dict
+
+def shared(pool, value):
+    # pool 为单次加载的共享表: 同一面板内相同的键顺序、部位名称等只保留一个对象，加载结束后共享表随之释放
+    return pool.setdefault(value, value)
+
+class Record:
+    # FIELDS 中的键存为属性，其余键保留在 extra 中；order 记录原有键顺序，转回 JSON 时按原顺序输出
+    __slots__ = ('order', 'extra')
+    FIELDS = ()
+
+    @classmethod
+    def from_json(cls, data, pool=None):
+        if pool is None: pool = {}
+        record = cls.__new__(cls)
+        for key in cls.FIELDS: setattr(record, key, None)
+        record.order, record.extra = shared(pool, tuple(data)), None
+        for key, value in data.items():
+            if key in cls.FIELDS: setattr(record, key, record.decode(key, value, pool))
+            else:
+                if record.extra is None: record.extra = {}
+                record.extra[key] = value
+        return record
+
+    def decode(self, key, value, pool): return value
+
+    def encode(self, key, value): return value
+
+    def to_json(self):
+        return {key: (self.encode(key, getattr(self, key)) if key in self.FIELDS else self.extra[key]) for key in self.order}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_json() == other.to_json()
+
+class RollVector:
+    # 原神 attrIds 为整数ID，存为 array('l')；星铁为 "词条,c1,c2" 字符串，每次强化存为 3 个字节；其他格式原样保留为列表
+    __slots__ = ('kind', 'values')
+
+    @classmethod
+    def from_json(cls, attr_ids):
+        rolls = cls.__new__(cls)
+        rolls.kind, rolls.values = None, list(attr_ids)
+        if all(type(v) is int for v in attr_ids):
+            try: rolls.kind, rolls.values = 'int', array.array('l', attr_ids)
+            except OverflowError: pass
+        elif all(type(v) is str for v in attr_ids):
+            parts = [part for v in attr_ids for part in v.split(',')]
+            if len(parts) == 3 * len(attr_ids) and all(part.isdigit() and str(int(part)) == part and int(part) < 256 for part in parts):
+                rolls.kind, rolls.values = 'triple', array.array('B', map(int, parts))
+        return rolls
+
+    def __len__(self):
+        return len(self.values) // 3 if self.kind == 'triple' else len(self.values)
+
+    def __iter__(self):
+        if self.kind == 'triple':
+            values = self.values
+            return (f"{values[i]},{values[i + 1]},{values[i + 2]}" for i in range(0, len(values), 3))
+        return iter(self.values)
+
+    def to_json(self):
+        return list(self)
+
+    def __eq__(self, other):
+        return isinstance(other, RollVector) and self.kind == other.kind and self.values == other.values
+
+class Weapon(Record):
+    FIELDS = ('name', 'id', 'level', 'promote', 'affix', 'star')
+    __slots__ = FIELDS
+
+    def decode(self, key, value, pool):
+        return shared(pool, value) if key == 'name' and isinstance(value, str) else value
+
+class Piece(Record):
+    # 原神部位以 name 标识，星铁以 id 标识；idx 为部位序号 (整数)，不属于原格式的字段
+    FIELDS = ('level', 'star', 'name', 'id', 'mainId', 'attrIds')
+    __slots__ = FIELDS + ('idx',)
+
+    def decode(self, key, value, pool):
+        if key == 'attrIds' and isinstance(value, list): return RollVector.from_json(value)
+        return shared(pool, value) if key == 'name' and isinstance(value, str) else value
+
+    def encode(self, key, value):
+        return value.to_json() if isinstance(value, RollVector) else value
+
+class Avatar(Record):
+    FIELDS = ('name', 'id', 'elem', 'level', 'cons', 'weapon', 'artis')
+    __slots__ = FIELDS
+
+    def decode(self, key, value, pool):
+        if key == 'weapon' and isinstance(value, dict): return Weapon.from_json(value, pool)
+        # 部位序号为规范的整数字符串且内容为对象时存为按原顺序排列的 Piece 元组，否则原样保留
+        if key == 'artis' and isinstance(value, dict) and all(k.isdigit() and str(int(k)) == k and isinstance(v, dict) for k, v in value.items()):
+            pieces = []
+            for k, v in value.items():
+                piece = Piece.from_json(v, pool); piece.idx = int(k); pieces.append(piece)
+            return tuple(pieces)
+        return shared(pool, value) if key == 'elem' and isinstance(value, str) else value
+
+    def encode(self, key, value):
+        if isinstance(value, Weapon): return value.to_json()
+        if isinstance(value, tuple): return {str(piece.idx): piece.to_json() for piece in value}
+        return value
+
+    def piece(self, idx):
+        return next((piece for piece in self.artis if piece.idx == idx), None) if isinstance(self.artis, tuple) else None
+
+class Panel(Record):
+    FIELDS = ('avatars',)
+    __slots__ = FIELDS
+
+    def decode(self, key, value, pool):
+        return {avatar_id: Avatar.from_json(avatar, pool) for avatar_id, avatar in value.items()} if isinstance(value, dict) else value
+
+    def encode(self, key, value):
+        return {avatar_id: avatar.to_json() for avatar_id, avatar in value.items()} if isinstance(value, dict) else value
+
+# ---------- 结构化比较与三方合并: 按角色 ID 与部位序号逐层对齐，列表 (如 attrIds) 整体比较 ----------
+
+# 表示某一侧不存在该字段/角色
+MISSING = object()
+
+def child_path(path, key):
+    if not key.isidentifier(): return f"{path}['{key}']"
+    return f"{path}.{key}" if path else key
+
+def format_value(value):
+    return "(无)" if value is MISSING else dump_json(value, compact=True)
+
+def diff_values(old, new, path=''):
+    # 返回 [(路径, 旧值, 新值)]，只在两侧都是对象时逐键深入，每个值只比较常数层，总耗时与文件大小成线性
+    if old == new: return []
+    if not (isinstance(old, dict) and isinstance(new, dict)): return [(path, old, new)]
+    changes = []
+    for key in list(old) + [k for k in new if k not in old]: changes += diff_values(old.get(key, MISSING), new.get(key, MISSING), child_path(path, key))
+    return changes
+
+def diff_panels(old, new):
+    old_avatars, new_avatars = old.get('avatars', {}), new.get('avatars', {})
+    header = lambda data: {k: v for k, v in data.items() if k != 'avatars'}
+    result = {'header': diff_values(header(old), header(new)), 'added': [], 'removed': [], 'changed': {}}
+    for avatar_id in sort_avatars({**old_avatars, **new_avatars}):
+        if avatar_id not in old_avatars: result['added'].append(avatar_id)
+        elif avatar_id not in new_avatars: result['removed'].append(avatar_id)
+        else:
+            changes = diff_values(old_avatars[avatar_id], new_avatars[avatar_id])
+            if changes: result['changed'][avatar_id] = changes
+    return result
+
+def merge_values(base, upstream, local, path, conflicts, prefer='local'):
+    # 只有一侧相对 base 有修改时取该侧；两侧都修改且都是对象时逐键合并，否则记为冲突并按 prefer 取值
+    if upstream == local or upstream == base: return local
+    if local == base: return upstream
+    if isinstance(upstream, dict) and isinstance(local, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for key in list(local) + [k for k in upstream if k not in local]:
+            value = merge_values(base.get(key, MISSING), upstream.get(key, MISSING), local.get(key, MISSING), child_path(path, key), conflicts, prefer)
+            if value is not MISSING: merged[key] = value
+        return merged
+    conflicts.append((path, base, upstream, local))
+    return upstream if prefer == 'upstream' else local
+
+def merge_panels(base, upstream, local, prefer='local'):
+    conflicts = []
+    merged = merge_values(base, upstream, local, '$', conflicts, prefer)
+    if isinstance(merged.get('avatars'), dict): merged['avatars'] = sort_avatars(merged['avatars'])
+    return merged, conflicts
+
+# ---------- 并行重新生成: 每个面板文件一个子进程，各自加载元数据并只写入自己的文件 ----------
+
+def load_generator(game):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), GENERATOR_SCRIPTS[game])
+    if not os.path.exists(script): raise ValueError(f"未找到生成脚本 '{script}'。")
+    spec = importlib.util.spec_from_file_location(f"panel_generator_{game}", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def regen_target(game, target_file, spec_file=None, dry_run=False, no_cache=False, compact=False, only=None):
+    # 在子进程中运行，脚本输出收集后随结果一并返回，避免多个进程的输出交错
+    start, log = time.perf_counter(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            module = load_generator(game)
+            if no_cache: module.CACHE_DIR = None
+            if compact: module.COMPACT_OUTPUT = True
+            result = module.regenerate(target_file, spec_file, dry_run, only)
+    # 元数据或面板文件缺失、损坏时生成脚本抛出 ValueError (DataFileError)
+    except (OSError, ValueError, KeyError) as e: result = {'file': target_file, 'error': str(e)}
+    return {**result, 'game': game, 'log': log.getvalue(), 'seconds': time.perf_counter() - start}
+
+def regen_all(tasks, specs=None, dry_run=False, no_cache=False, jobs=None, verbose=False, compact=False, only=None):
+    # tasks 为 (游戏, 面板文件) 列表，每项一个子进程；only 可按 (游戏, 面板文件) 给出只需重新生成的角色ID集合
+    specs, only, results = specs or {}, only or {}, []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or len(tasks)) as pool:
+        futures = [pool.submit(regen_target, game, target_file, specs.get(game), dry_run, no_cache, compact, only.get((game, target_file))) for game, target_file in tasks]
+        for n, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            result = future.result(); results.append(result)
+            if verbose or 'error' in result: print(result['log'], end='')
+            if 'error' in result: print(f"[{n}/{len(tasks)}] {result['file']}: 失败 ({result['error']})"); continue
+            state = "已写入" if result['written'] else ("有变化 (未写入)" if result['changed'] else "没有变化")
+            print(f"[{n}/{len(tasks)}] {result['file']}: 重新生成 {result['generated']} 个，补全 {result['added']} 个，失败 {len(result['failed'])} 个，{state} ({result['seconds']:.2f} s)")
+    elapsed = time.perf_counter() - start
+    print(f"\n{'文件':<46}{'生成':>6}{'补全':>6}{'失败':>6}{'用时':>9}")
+    for result in sorted(results, key=lambda r: [t[1] for t in tasks].index(r['file'])):
+        if 'error' in result: print(f"{result['file']:<48}{'-':>8}{'-':>8}{'-':>8}{result['seconds']:>10.2f}s"); continue
+        print(f"{result['file']:<48}{result['generated']:>8}{result['added']:>8}{len(result['failed']):>8}{result['seconds']:>10.2f}s")
+    print(f"总用时 {elapsed:.2f} s (逐个运行约 {sum(r['seconds'] for r in results):.2f} s)" + ("，预览模式未写入任何文件" if dry_run else "") + "。")
+    for result in results:
+        if result.get('failed'): print(f"{result['file']} 失败角色: {', '.join(map(str, result['failed']))}")
+    return all('error' not in r and not r['failed'] for r in results)
+
+# ---------- 监听模式: 轮询元数据、面板文件与批量配置，变化时只重新生成受影响的文件 ----------
+
+def file_fingerprint(path, previous=None):
+    # 大小与修改时间未变时沿用上次的结果，变化时再计算内容哈希，只被 touch 过的文件不会触发重新生成
+    try: stat = os.stat(path)
+    except OSError: return None
+    if previous and previous[0] == (stat.st_size, stat.st_mtime_ns): return previous
+    with open(path, 'rb') as f: return (stat.st_size, stat.st_mtime_ns), hashlib.sha1(f.read()).hexdigest()
+
+def diff_metadata(previous, current):
+    lines = []
+    for kind, label in (('characters', '角色'), ('sets', '套装')):
+        old, new = previous[kind], current[kind]
+        for key in sorted(new.keys() - old.keys(), key=int): lines.append(f"  + {label} {key} {new[key][0]}")
+        for key in sorted(old.keys() - new.keys(), key=int): lines.append(f"  - {label} {key} {old[key][0]}")
+        for key in sorted((k for k in old.keys() & new.keys() if old[k] != new[k]), key=int): lines.append(f"  ~ {label} {key} {new[key][0]}")
+    return lines
+
+def queue_regen(pending, target_file, only=None):
+    # only 为 None 表示按整个批量配置重新生成，否则只重新生成其中的角色 (缺少的角色总会补全)；同一文件的多个原因合并
+    if only is None or pending.get(target_file, set()) is None: pending[target_file] = None
+    else: pending[target_file] = pending.get(target_file, set()) | set(only)
+
+def watch_panels(games, specs=None, interval=5.0, no_cache=False, jobs=None, verbose=False, compact=False):
+    specs = specs or {}
+    modules = {game: load_generator(game) for game in games}
+    state = {}
+    for game, module in modules.items():
+        if no_cache: module.CACHE_DIR = None
+        for path in module.metadata_files():
+            if not os.path.exists(path): raise ValueError(f"未找到元数据文件 '{path}'，请检查 {GENERATOR_SCRIPTS[game]} 顶部的配置路径。")
+        files = {'metadata': module.metadata_files(), 'target': module.all_target_files(), 'spec': [specs[game]] if specs.get(game) else []}
+        state[game] = {'files': files, 'fingerprints': {}, 'index': module.metadata_index()}
+    # 启动时先处理一次，补全监听开始前新增的角色
+    pending = {game: dict.fromkeys(state[game]['files']['target']) for game in games}
+    print(f"开始监听 {', '.join(GENERATOR_SCRIPTS[game] for game in games)} 使用的元数据与面板文件，每 {interval:g} 秒检查一次，按 Ctrl+C 退出。")
+    while True:
+        for game, module in modules.items():
+            files, fingerprints = state[game]['files'], state[game]['fingerprints']
+            changed = set()
+            for kind, paths in files.items():
+                for path in paths:
+                    fingerprint = file_fingerprint(path, fingerprints.get(path))
+                    if path in fingerprints and (fingerprint or (None, None))[1] != (fingerprints[path] or (None, None))[1]: changed.add((kind, path))
+                    fingerprints[path] = fingerprint
+            if any(kind == 'metadata' for kind, _ in changed):
+                previous, current = state[game]['index'], module.metadata_index()
+                state[game]['index'] = current
+                print(f"\n[{time.strftime('%H:%M:%S')}] {GENERATOR_SCRIPTS[game]} 的元数据已变化:")
+                print('\n'.join(diff_metadata(previous, current)) or "  角色与套装没有变化")
+                new_characters = current['characters'].keys() - previous['characters'].keys()
+                for target_file in files['target']:
+                    try: affected = module.affected_avatars(load_json(target_file), previous, current)
+                    except (OSError, ValueError): affected = {}
+                    for avatar_id, reason in affected.items(): print(f"  ! {target_file} {avatar_id} {reason}")
+                    if affected: print("  批量配置中的上述角色将重新生成，其余需手动检查" if files['spec'] else "  以上角色需手动检查")
+                    # 只重新生成批量配置中受影响的角色，元数据新增的角色由补全生成；配置以外的已有角色不会被覆盖
+                    if new_characters or (affected and files['spec']): queue_regen(pending[game], target_file, affected if files['spec'] else ())
+            if any(kind == 'spec' for kind, _ in changed):
+                for target_file in files['target']: queue_regen(pending[game], target_file)
+            # 面板文件被外部修改 (如删除了角色) 时按批量配置重新生成并检查缺少的角色
+            for kind, path in changed:
+                if kind == 'target': queue_regen(pending[game], path)
+        tasks = [(game, target_file) for game in games for target_file in state[game]['files']['target'] if target_file in pending[game]]
+        if tasks:
+            print(f"\n[{time.strftime('%H:%M:%S')}] 重新生成 {len(tasks)} 个面板文件:")
+            regen_all(tasks, specs, False, no_cache, jobs, verbose, compact, {(game, target_file): pending[game][target_file] for game, target_file in tasks})
+            # 本次写入的面板文件不应再次触发
+            for game, target_file in tasks: state[game]['fingerprints'][target_file] = file_fingerprint(target_file)
+            pending = {game: {} for game in games}
+        time.sleep(interval)
+
+# ---------- 命令行 ----------
+
+def cmd_shard(args):
+    count, written = shard_panel_file(args.file, args.dir)
+    print(f"已将 {count} 个角色拆分至 {args.dir} (更新 {written} 个分片)。")
+
+def cmd_unshard(args):
+    count, written = unshard_panel_dir(args.dir, args.file)
+    print(f"已将 {count} 个角色合并至 {args.file}" + ("" if written else " (内容没有变化，跳过写入)") + "。")
+
+def cmd_get(args):
+    avatar = read_avatar(args.path, args.id)
+    if avatar is None: print(f"错误: {args.path} 中没有角色 {args.id}。", file=sys.stderr); return False
+    print(dump_json(avatar))
+
+def cmd_put(args):
+    avatar = load_json(args.avatar)
+    changed = put_shard(args.dir, avatar)
+    print(f"角色【{avatar.get('name')}】" + ("已写入分片。" if changed else "没有变化。"))
+
+def cmd_pack(args):
+    data = load_json(args.file)
+    if is_packed(data): raise ValueError(f"'{args.file}' 已是紧凑格式。")
+    pack = pack_panel_data(data)
+    written = write_json_atomic(args.out, pack, compact=True)
+    pieces = sum(len(a['artis']) for a in pack['avatars'].values() if isinstance(a.get('artis'), dict))
+    print(f"已打包 {len(pack['avatars'])} 个角色: {pieces} 个部位共用 {len(pack['templates'])} 个模板，{os.path.getsize(args.file)} -> {os.path.getsize(args.out)} 字节" + ("" if written else " (内容没有变化，跳过写入)") + "。")
+
+def cmd_unpack(args):
+    data = load_json(args.pack)
+    if not is_packed(data): raise ValueError(f"'{args.pack}' 不是紧凑格式文件。")
+    data = unpack_panel_data(data)
+    written = write_json_atomic(args.file, data)
+    print(f"已展开 {len(data['avatars'])} 个角色至 {args.file}" + ("" if written else " (内容没有变化，跳过写入)") + "。")
+
+def cmd_diff(args):
+    old, new = load_panel(args.old), load_panel(args.new)
+    result = diff_panels(old, new)
+    if args.json:
+        to_json = lambda changes: [{'path': path, 'old': None if a is MISSING else a, 'new': None if b is MISSING else b} for path, a, b in changes]
+        print(dump_json({**result, 'header': to_json(result['header']), 'changed': {k: to_json(v) for k, v in result['changed'].items()}}))
+    else:
+        name = lambda avatar_id: (new['avatars'].get(avatar_id) or old['avatars'].get(avatar_id) or {}).get('name')
+        for path, a, b in result['header']: print(f"~ {path}: {format_value(a)} -> {format_value(b)}")
+        for avatar_id in result['added']: print(f"+ {avatar_id} {name(avatar_id)}")
+        for avatar_id in result['removed']: print(f"- {avatar_id} {name(avatar_id)}")
+        for avatar_id, changes in result['changed'].items():
+            print(f"~ {avatar_id} {name(avatar_id)}")
+            for path, a, b in changes: print(f"    {path}: {format_value(a)} -> {format_value(b)}")
+        print(f"新增 {len(result['added'])} 个角色，删除 {len(result['removed'])} 个，修改 {len(result['changed'])} 个。", file=sys.stderr)
+    return not (result['header'] or result['added'] or result['removed'] or result['changed'])
+
+def cmd_merge(args):
+    local = load_panel(args.local)
+    merged, conflicts = merge_panels(load_panel(args.base), load_panel(args.upstream), local, args.prefer)
+    for path, base, upstream, local_value in conflicts:
+        print(f"冲突 {path}\n    原始: {format_value(base)}\n    上游: {format_value(upstream)}\n    本地: {format_value(local_value)}")
+    result = diff_panels(local, merged)
+    out = args.out or args.local
+    written = write_json_atomic(out, merged)
+    print(f"相对本地文件新增 {len(result['added'])} 个角色，删除 {len(result['removed'])} 个，更新 {len(result['changed'])} 个；"
+          f"冲突 {len(conflicts)} 处 (采用{'上游' if args.prefer == 'upstream' else '本地'}的值)。" + (f"已写入 {out}" if written else f"{out} 内容没有变化，跳过写入") + "。")
+    return not conflicts
+
+def cmd_model(args):
+    # 分别以原格式与对象模型加载，比较常驻内存，并检查转回的 JSON 与原文件完全一致
+    tracemalloc.start()
+    data = load_panel(args.file)
+    raw_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    model = Panel.from_json(data)
+    model_size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    same = dump_json(model.to_json()) == dump_json(data)
+    pieces = sum(len(a.artis) for a in model.avatars.values() if isinstance(a.artis, tuple))
+    print(f"{args.file}: {len(model.avatars)} 个角色，{pieces} 个部位；原格式占用 {raw_size / 1024:.0f} KiB，对象模型占用 {model_size / 1024:.0f} KiB ({model_size / raw_size:.0%})。")
+    print("与原格式往返转换一致。" if same else "错误: 往返转换后的内容与原文件不一致。")
+    return same
+
+def cmd_regen(args):
+    tasks = [(game, target_file) for game in args.game or list(GENERATOR_SCRIPTS) for target_file in load_generator(game).all_target_files()]
+    return regen_all(tasks, {'gs': args.gs_spec, 'sr': args.sr_spec}, args.dry_run, args.no_cache, args.jobs, args.verbose, args.compact)
+
+def cmd_watch(args):
+    try: watch_panels(args.game or list(GENERATOR_SCRIPTS), {'gs': args.gs_spec, 'sr': args.sr_spec}, args.interval, args.no_cache, args.jobs, args.verbose, args.compact)
+    except KeyboardInterrupt: print("\n已停止监听。")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="预设面板文件工具")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    p = subparsers.add_parser('shard', help="将面板文件 (或紧凑格式文件) 拆分为每个角色一个文件的分片目录")
+    p.add_argument('file'); p.add_argument('dir'); p.set_defaults(func=cmd_shard)
+    p = subparsers.add_parser('unshard', help="将分片目录合并回单个面板文件")
+    p.add_argument('dir'); p.add_argument('file'); p.set_defaults(func=cmd_unshard)
+    p = subparsers.add_parser('get', help="读取单个角色 (面板文件、紧凑格式文件或分片目录)")
+    p.add_argument('path'); p.add_argument('id'); p.set_defaults(func=cmd_get)
+    p = subparsers.add_parser('put', help="将单个角色的 JSON 写入分片目录")
+    p.add_argument('dir'); p.add_argument('avatar', help="角色 JSON 文件"); p.set_defaults(func=cmd_put)
+    p = subparsers.add_parser('pack', help="将面板文件转换为共享部位模板的紧凑格式")
+    p.add_argument('file'); p.add_argument('out'); p.set_defaults(func=cmd_pack)
+    p = subparsers.add_parser('unpack', help="将紧凑格式文件展开为原格式")
+    p.add_argument('pack'); p.add_argument('file'); p.set_defaults(func=cmd_unpack)
+    p = subparsers.add_parser('model', help="(实验) 以紧凑对象模型加载面板文件，检查往返转换是否一致并比较内存占用")
+    p.add_argument('file'); p.set_defaults(func=cmd_model)
+    p = subparsers.add_parser('diff', help="按角色与部位比较两个面板文件 (有差异时返回非零退出码)")
+    p.add_argument('old'); p.add_argument('new'); p.add_argument('--json', action='store_true', help="以 JSON 格式输出")
+    p.set_defaults(func=cmd_diff)
+    p = subparsers.add_parser('merge', help="以 base 为共同祖先，将上游面板文件的修改合并到本地文件 (存在冲突时返回非零退出码)")
+    p.add_argument('base', help="上次合并时的上游文件"); p.add_argument('upstream', help="新的上游文件"); p.add_argument('local', help="本地修改过的文件")
+    p.add_argument('-o', '--out', help="输出文件，默认覆盖本地文件")
+    p.add_argument('--prefer', choices=['local', 'upstream'], default='local', help="冲突时采用哪一侧的值，默认本地")
+    p.set_defaults(func=cmd_merge)
+    p = subparsers.add_parser('regen', help="并行重新生成原神与星铁的全部面板文件 (按批量配置生成并补全缺少的角色)")
+    p.add_argument('--game', action='append', choices=list(GENERATOR_SCRIPTS), help="只处理指定游戏，可重复")
+    p.add_argument('--gs-spec', help="原神批量配置文件，其中的角色按面板类型写入对应文件")
+    p.add_argument('--sr-spec', help="星铁批量配置文件")
+    p.add_argument('--dry-run', action='store_true', help="只生成不写入文件")
+    p.add_argument('--no-cache', action='store_true', help="不读写元数据快照缓存")
+    p.add_argument('--compact', action='store_true', help="面板文件写为无缩进的紧凑格式")
+    p.add_argument('--jobs', type=int, help="并行进程数，默认每个文件一个进程")
+    p.add_argument('-v', '--verbose', action='store_true', help="输出各文件的详细生成日志")
+    p.set_defaults(func=cmd_regen)
+    p = subparsers.add_parser('watch', help="监听元数据与面板文件，新增角色时自动补全，角色/套装变化时列出受影响的角色")
+    p.add_argument('--game', action='append', choices=list(GENERATOR_SCRIPTS), help="只监听指定游戏，可重复")
+    p.add_argument('--gs-spec', help="原神批量配置文件，修改后自动重新生成")
+    p.add_argument('--sr-spec', help="星铁批量配置文件，修改后自动重新生成")
+    p.add_argument('--interval', type=float, default=5.0, help="检查间隔 (秒)，默认 5")
+    p.add_argument('--no-cache', action='store_true', help="不读写元数据快照缓存")
+    p.add_argument('--compact', action='store_true', help="面板文件写为无缩进的紧凑格式")
+    p.add_argument('--jobs', type=int, help="并行进程数，默认每个文件一个进程")
+    p.add_argument('-v', '--verbose', action='store_true', help="输出各文件的详细生成日志")
+    p.set_defaults(func=cmd_watch)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    try: ok = args.func(args)
+    except (OSError, ValueError) as e: print(f"错误: {e}", file=sys.stderr); exit(1)
+    exit(0 if ok is not False else 1)
@@ -0,0 +1,571 @@
+import atexit
+import contextlib
+import cProfile
+import functools
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import pickle
+import re
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# 原神/星铁生成脚本与 panel-tools.py 共用的与游戏无关的部分 (面板文件读写、性能统计、名称索引、元数据快照、词条分配、常驻服务与批量配置)，需与这些脚本放在同一目录
+# 面板文件的字节偏移索引，列出角色ID或读取单个角色时不必解析整个文件；索引写在用户缓存目录下 (与生成脚本的元数据快照同一目录)，
+# 文件名取自面板文件绝对路径的 sha1，不在 resources/presetPanelData 中写入任何文件
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'presetPanel')
+PANEL_INDEX_SUFFIX = '.idx'
+PANEL_INDEX_VERSION = 2
+# 进程的 umask，新建的面板文件与 open() 创建的文件权限相同 (0666 去掉 umask)；os.umask 只能先设置再恢复，导入时读取一次
+UMASK = os.umask(0); os.umask(UMASK)
+
+def parse_json(content):
+    # 安装了 orjson 时优先使用，遇到其拒绝而标准库可以解析的内容 (如单独的代理字符、NaN) 时回退到标准库
+    if orjson is not None:
+        try: return orjson.loads(content)
+        except orjson.JSONDecodeError: pass
+    return json.loads(content)
+
+def dump_json(data, compact=False):
+    # 安装了 orjson 时优先使用 (缩进输出与标准库相同)，遇到其不支持的数据 (如超出 64 位的整数) 时回退到标准库
+    if orjson is not None:
+        try: return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError: pass
+    if compact: return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+def ordered(data, key_order):
+    return {**{key: data[key] for key in key_order if key in data}, **data}
+
+def canonical_panel(data, avatar_key_order, piece_key_order):
+    # 角色按ID、部位按序号排序，角色与部位字段按各游戏的固定顺序排列，同样的内容总是得到同样的输出
+    avatars = data.get('avatars') if isinstance(data, dict) else None
+    if not isinstance(avatars, dict): return data
+    result = {}
+    for avatar_id in sorted(avatars, key=int):
+        avatar = avatars[avatar_id]
+        if isinstance(avatar, dict):
+            artis = avatar.get('artis')
+            if isinstance(artis, dict):
+                avatar = {**avatar, 'artis': {idx: ordered(piece, piece_key_order) if isinstance(piece, dict) else piece for idx, piece in sorted(artis.items(), key=lambda item: (len(item[0]), item[0]))}}
+            avatar = ordered(avatar, avatar_key_order)
+        result[avatar_id] = avatar
+    return {**data, 'avatars': result}
+
+def write_text_atomic(filepath, content):
+    # 先写入同目录下的临时文件再原子替换，进程中途退出也不会留下损坏的文件；内容未变化时跳过写入，已有文件保留原权限
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            if f.read() == content: return False
+        mode = os.stat(filepath).st_mode & 0o777
+    except (OSError, UnicodeDecodeError): mode = 0o666 & ~UMASK
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)), prefix=f".{os.path.basename(filepath)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content); f.flush(); os.fsync(f.fileno())
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, filepath)
+    except BaseException:
+        if os.path.exists(tmp_file): os.remove(tmp_file)
+        raise
+    return True
+
+JSON_DECODER, JSON_WHITESPACE = json.JSONDecoder(), re.compile(r'\s*')
+
+def _scan_object(text, pos, expand=None):
+    # pos 指向 '{'，用标准库解码器 (C 实现) 跳过各成员的值，返回 {键: (值起始, 值结束)} 字符范围；键为 expand 的对象值改为返回其成员的范围
+    members, pos = {}, JSON_WHITESPACE.match(text, pos + 1).end()
+    while text[pos:pos + 1] != '}':
+        key, pos = JSON_DECODER.raw_decode(text, pos)
+        pos = JSON_WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != ':': raise ValueError(f"第 {pos} 个字符处应为 ':'")
+        start = JSON_WHITESPACE.match(text, pos + 1).end()
+        if key == expand and text[start:start + 1] == '{': members[key], end = _scan_object(text, start)
+        else: end = JSON_DECODER.raw_decode(text, start)[1]; members[key] = (start, end)
+        pos = JSON_WHITESPACE.match(text, end).end()
+        if text[pos:pos + 1] == ',': pos = JSON_WHITESPACE.match(text, pos + 1).end()
+        elif text[pos:pos + 1] != '}': raise ValueError(f"第 {pos} 个字符处应为 ',' 或 '}}'")
+    return members, pos + 1
+
+def scan_avatar_offsets(content):
+    # 返回顶层 avatars 对象中每个角色值的字节范围 (按文件中的顺序)；顶层有 format 键 (紧凑格式) 时返回 None
+    text = bytes(content).decode('utf-8')
+    pos = JSON_WHITESPACE.match(text).end()
+    if text[pos:pos + 1] != '{': raise ValueError("顶层不是 JSON 对象")
+    members = _scan_object(text, pos, 'avatars')[0]
+    if 'format' in members: return None
+    avatars = members.get('avatars') if isinstance(members.get('avatars'), dict) else {}
+    if len(text) == len(content): return avatars
+    # 含非 ASCII 字符时按顺序累加各段编码后的长度，把字符位置换算为字节位置
+    offsets, char_pos, byte_pos = {}, 0, 0
+    for avatar_id, (start, end) in sorted(avatars.items(), key=lambda item: item[1][0]):
+        start_byte = byte_pos + len(text[char_pos:start].encode('utf-8'))
+        char_pos, byte_pos = end, start_byte + len(text[start:end].encode('utf-8'))
+        offsets[avatar_id] = (start_byte, byte_pos)
+    return offsets
+
+def load_panel_index(filepath, content, stat, cache_dir=CACHE_DIR):
+    # 索引以面板文件路径为键，先按文件大小与修改时间校验，不一致时比较 sha1 (内容未变只更新时间)，内容变化时重新扫描；cache_dir 为 None 时每次扫描
+    if not cache_dir: return scan_avatar_offsets(content)
+    path = os.path.abspath(filepath)
+    index_file = os.path.join(cache_dir, hashlib.sha1(path.encode('utf-8')).hexdigest()[:16] + PANEL_INDEX_SUFFIX)
+    try:
+        with open(index_file, 'rb') as f: index = parse_json(f.read())
+        if index.get('version') != PANEL_INDEX_VERSION or index.get('path') != path: index = None
+    except (OSError, ValueError, AttributeError): index = None
+    if index and [index.get('size'), index.get('mtime_ns')] == [stat.st_size, stat.st_mtime_ns]:
+        return index['offsets']
+    sha1 = hashlib.sha1(content).hexdigest()
+    if not index or index.get('sha1') != sha1:
+        index = {'version': PANEL_INDEX_VERSION, 'path': path, 'sha1': sha1, 'offsets': scan_avatar_offsets(content)}
+    index.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    # 缓存目录只对当前用户可见；写入失败 (如只读的主目录) 时只是下次重新扫描
+    tmp_file = None
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f: f.write(dump_json(index, compact=True).encode('utf-8'))
+        os.replace(tmp_file, index_file)
+    except OSError:
+        if tmp_file and os.path.exists(tmp_file): os.remove(tmp_file)
+    return index['offsets']
+
+class PanelReader:
+    # 以 mmap 打开面板文件，按字节偏移索引只解码需要的角色，面板文件格式不变；无法建立索引 (如紧凑格式) 时 offsets 为 None
+    def __init__(self, filepath, cache_dir=CACHE_DIR):
+        with open(filepath, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        try: self.offsets = load_panel_index(filepath, self.content, stat, cache_dir)
+        except ValueError as e: self.close(); raise ValueError(f"无法解析面板文件 '{filepath}': {e}")
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    def close(self):
+        if isinstance(self.content, mmap.mmap): self.content.close()
+
+    def ids(self):
+        return list(self.offsets) if self.offsets is not None else list(parse_json(self.content[:]).get('avatars', {}))
+
+    def read(self, avatar_id):
+        if self.offsets is None: return parse_json(self.content[:]).get('avatars', {}).get(str(avatar_id))
+        span = self.offsets.get(str(avatar_id))
+        return None if span is None else parse_json(self.content[span[0]:span[1]])
+
+# 性能报告与 cProfile 输出文件，也可通过 --profile/--cprofile 参数指定；均未设置时不做任何统计
+PROFILE_ENV, CPROFILE_ENV = 'PANEL_PROFILE', 'PANEL_CPROFILE'
+
+class Profiler:
+    # 命名计时器累计调用次数与耗时 (嵌套的阶段各自包含子阶段的耗时)，计数器累计事件次数
+    def __init__(self):
+        self.started, self.timers, self.counters = time.perf_counter(), defaultdict(lambda: [0, 0.0]), defaultdict(int)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try: yield
+        finally:
+            entry = self.timers[name]
+            entry[0] += 1; entry[1] += time.perf_counter() - start
+
+    def report(self):
+        return {'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:], 'seconds': round(time.perf_counter() - self.started, 6),
+                'timers': {name: {'calls': n, 'seconds': round(seconds, 6)} for name, (n, seconds) in sorted(self.timers.items(), key=lambda item: -item[1][1])},
+                'counters': dict(sorted(self.counters.items()))}
+
+# 未开启统计时为 None，timer()/count()/timed 只多一次判断
+PROFILER = None
+NULL_TIMER = contextlib.nullcontext()
+
+def timer(name):
+    return NULL_TIMER if PROFILER is None else PROFILER.timer(name)
+
+def count(name, n=1):
+    if PROFILER is not None: PROFILER.counters[name] += n
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if PROFILER is None: return func(*args, **kwargs)
+            with PROFILER.timer(name): return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_profiling(report_file=None, cprofile_file=None):
+    # 进程退出时写出 JSON 报告 (及 cProfile 统计，可用 python -m pstats 或 snakeviz 查看)
+    global PROFILER
+    PROFILER, profile = Profiler(), None
+    if cprofile_file: profile = cProfile.Profile(); profile.enable()
+    def finish():
+        if profile: profile.disable(); profile.dump_stats(cprofile_file); print(f"cProfile 统计已写入 {cprofile_file}", file=sys.stderr)
+        if report_file:
+            with open(report_file, 'w', encoding='utf-8') as f: json.dump(PROFILER.report(), f, ensure_ascii=False, indent=2)
+            print(f"性能报告已写入 {report_file}", file=sys.stderr)
+    atexit.register(finish)
+
+# 名称索引: 规范化名称 (含别名) -> ID 的精确表，以及单字/二元组 -> 名称序号的倒排表，用于模糊匹配时只比较有共同字的名称
+NAME_SEPARATORS = set('·・.-_ ')
+
+def normalize_name(name):
+    return ''.join(ch for ch in str(name).lower() if ch not in NAME_SEPARATORS and not ch.isspace())
+
+def name_grams(key):
+    return set(key) | {key[i:i + 2] for i in range(len(key) - 1)}
+
+def build_name_index(names):
+    index = {'names': {}, 'keys': [], 'ids': [], 'sizes': [], 'exact': {}, 'grams': {}}
+    for name, item_id in names: add_name(index, name, item_id)
+    return index
+
+def add_name(index, name, item_id):
+    key = normalize_name(name) if name else ''
+    if not key or item_id in index['exact'].get(key, ()): return
+    index['names'].setdefault(item_id, name)
+    index['exact'].setdefault(key, []).append(item_id)
+    grams, pos = name_grams(key), len(index['keys'])
+    index['keys'].append(key); index['ids'].append(item_id); index['sizes'].append(len(grams))
+    for gram in grams: index['grams'].setdefault(gram, []).append(pos)
+
+def resolve_name(index, query, limit=5, accept=None):
+    # 返回按得分排序的 [(ID, 正式名称, 得分)]: 完全一致为 1，包含关系为 0.8-0.9，其余为单字/二元组的 Dice 系数 (不超过 0.75)，同一 ID 取最高分
+    key = normalize_name(query)
+    if not key: return []
+    grams, best = name_grams(key), {}
+    for pos, common in Counter(pos for gram in grams for pos in index['grams'].get(gram, ())).items():
+        item_id, name = index['ids'][pos], index['keys'][pos]
+        if accept and not accept(item_id): continue
+        if name == key: score = 1.0
+        elif key in name or name in key: score = 0.9 - 0.1 * abs(len(name) - len(key)) / max(len(name), len(key))
+        else: score = min(0.75, 2 * common / (len(grams) + index['sizes'][pos]))
+        if score > best.get(item_id, 0): best[item_id] = score
+    ranked = sorted(((item_id, index['names'][item_id], round(score, 3)) for item_id, score in best.items() if score >= 0.3), key=lambda c: (-c[2], str(c[0])))
+    return ranked[:limit]
+
+def match_name(index, query, kind, accept=None):
+    # 完全一致 (名称或别名) 或唯一的包含匹配时直接采用，否则报错并列出候选
+    candidates = resolve_name(index, query, accept=accept)
+    for threshold in (1.0, 0.8):
+        top = [c for c in candidates if c[2] >= threshold]
+        if len(top) == 1: return top[0][0]
+        if len(top) > 1: raise ValueError(f"'{query}' 对应多个{kind}: {', '.join(c[1] for c in top)}，请写出完整名称或ID。")
+    if candidates: raise ValueError(f"找不到{kind} '{query}'，你是不是要找: {', '.join(c[1] for c in candidates)}？")
+    raise ValueError(f"找不到{kind} '{query}'。")
+
+def load_aliases(filepath):
+    try:
+        with open(filepath, 'rb') as f: data = parse_json(f.read())
+        if not isinstance(data, dict): raise ValueError("顶层应为 {正式名称: [别名, ...]}")
+    except (OSError, ValueError) as e: print(f"警告: 无法读取别名文件 '{filepath}': {e}"); return {}
+    return {str(name): [str(alias) for alias in (aliases if isinstance(aliases, list) else [aliases])] for name, aliases in data.items()}
+
+class LazyIndex(dict):
+    # 索引项按来源文件懒加载：首次访问某一项时才加载并索引对应的数据文件
+    def __init__(self, parser, sources):
+        super().__init__()
+        self.parser, self.sources = parser, sources
+
+    def __missing__(self, key):
+        self.parser._source(self.sources[key])
+        return dict.__getitem__(self, key)
+
+
+class DataFileError(ValueError):
+    # 数据文件或目标文件无法读取/解析；命令行入口打印后退出，常驻服务返回错误响应
+    pass
+
+class PanelDataParser:
+    # 各游戏数据解析器的公共部分: files 为 {类型: 路径} (target 为目标面板文件)，indexers 为元数据类型 -> 索引函数，index_sources 为索引项 -> 来源类型
+    # 缺少的数据文件在 missing_ok 为真时视为空对象
+    missing_ok = False
+
+    def __init__(self, files, indexers, index_sources, cache_dir=None, alias_file=None, snapshot_version=0):
+        self.files, self.indexers = files, indexers
+        self.cache_dir, self.alias_file, self.snapshot_version = cache_dir, alias_file, snapshot_version
+        self._sources, self._stats, self._aliases, self._alias_stat = {}, {}, None, None
+        self.index = LazyIndex(self, index_sources)
+
+    target_data = property(lambda self: self._source('target'))
+
+    def _source(self, kind):
+        if kind not in self._sources:
+            self._stats[kind] = self._stat(self.files[kind])
+            # 只有只读的元数据使用快照，目标文件每次保存都会变化，直接读取
+            data, index = self._load_snapshot(self.files[kind], self.indexers[kind]) if kind in self.indexers else (self._load_json(self.files[kind]), {})
+            self._sources[kind] = data
+            self.index.update(index)
+            self._apply_aliases(index)
+        return self._sources[kind]
+
+    @property
+    def aliases(self):
+        if self._aliases is None:
+            self._alias_stat = self._stat(self.alias_file) if self.alias_file else None
+            self._aliases = load_aliases(self.alias_file) if self._alias_stat else {}
+        return self._aliases
+
+    def _apply_aliases(self, index):
+        # 别名不写入快照，数据文件加载后再补充到名称索引中，只对能完全匹配到正式名称的条目生效
+        for name_index in (value for key, value in index.items() if key.endswith('_names')):
+            for name, aliases in self.aliases.items():
+                for item_id in list(name_index['exact'].get(normalize_name(name), ())):
+                    for alias in aliases: add_name(name_index, alias, item_id)
+
+    def _stat(self, filepath):
+        try: stat = os.stat(filepath)
+        except OSError: return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def refresh(self):
+        # 常驻进程中使用: 已加载的数据文件若被修改，则丢弃并在下次访问时重新加载；别名文件变化时重新加载带名称索引的数据文件
+        aliases_changed = self._aliases is not None and self.alias_file and self._stat(self.alias_file) != self._alias_stat
+        if aliases_changed: self._aliases = None
+        for kind in [k for k in self._sources if self._stat(self.files[k]) != self._stats.get(k) or (aliases_changed and k in self.indexers)]:
+            del self._sources[kind]
+            for key in [k for k, source in self.index.sources.items() if source == kind]: self.index.pop(key, None)
+
+    def track_write(self, filepath, data):
+        # 本进程写入已加载的目标文件后同步更新数据与文件状态，常驻服务的 refresh() 不会再重新读取刚写入的文件
+        if filepath == self.files['target'] and 'target' in self._sources: self._sources['target'], self._stats['target'] = data, self._stat(filepath)
+
+    def target_avatar_ids(self, target_file=None):
+        # 目标文件已加载时直接取其角色ID，否则通过字节偏移索引读取，不解析整个文件
+        if target_file is None or target_file == self.files['target']:
+            if 'target' in self._sources: return list(self._sources['target'].get('avatars', {}))
+            target_file = self.files['target']
+        if not os.path.exists(target_file): return []
+        with timer('panel_index'), PanelReader(target_file, self.cache_dir) as reader: return reader.ids()
+
+    def target_avatar(self, avatar_id, target_file=None):
+        if target_file is None or target_file == self.files['target']:
+            if 'target' in self._sources: return self._sources['target'].get('avatars', {}).get(str(avatar_id))
+            target_file = self.files['target']
+        if not os.path.exists(target_file): return None
+        with timer('panel_index'), PanelReader(target_file, self.cache_dir) as reader: return reader.read(avatar_id)
+
+    def _load_snapshot(self, filepath, indexer):
+        # 快照以源文件路径、大小和修改时间为键，任一变化即重新解析
+        try: stat = os.stat(filepath)
+        except OSError: stat = None
+        if not self.cache_dir or stat is None:
+            data = self._load_json(filepath)
+            with timer('index'): return data, indexer(data)
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, self.snapshot_version)
+        snapshot_file = os.path.join(self.cache_dir, hashlib.sha1(key[0].encode('utf-8')).hexdigest()[:16] + '.pickle')
+        try:
+            with timer('snapshot_read'), open(snapshot_file, 'rb') as f:
+                # pickle 加载时会执行其中的代码，只读取当前用户创建且其他用户不可写的快照
+                owner = os.fstat(f.fileno())
+                if hasattr(os, 'getuid') and (owner.st_uid != os.getuid() or owner.st_mode & 0o022): raise ValueError(f"快照文件 '{snapshot_file}' 不属于当前用户")
+                snapshot = pickle.load(f)
+            if snapshot['key'] == key: count('snapshot_hit'); return snapshot['data'], snapshot['index']
+        except Exception: pass
+        count('snapshot_miss')
+        data = self._load_json(filepath)
+        with timer('index'): index = indexer(data)
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f: pickle.dump({'key': key, 'data': data, 'index': index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, snapshot_file)
+        except OSError as e: print(f"警告: 无法写入元数据快照 '{snapshot_file}': {e}")
+        return data, index
+
+    @timed('load_json')
+    def _load_json(self, filepath):
+        if self.missing_ok and not os.path.exists(filepath): return {}
+        try:
+            with open(filepath, 'rb') as f: return parse_json(f.read())
+        except (OSError, ValueError) as e: raise DataFileError(f"加载文件 '{filepath}' 时出错: {e}")
+
+@functools.lru_cache(maxsize=None)
+def roll_compositions(n_subs, upgrades=5, max_rolls=6):
+    # 一个部位上 upgrades 次强化分配给 n_subs 个副词条的全部合法方案 (每个副词条初始 1 次，最多 max_rolls 次)
+    if n_subs == 1: return ((1 + upgrades,),) if 1 + upgrades <= max_rolls else ()
+    return tuple((1 + c,) + rest for c in range(min(upgrades, max_rolls - 1) + 1) for rest in roll_compositions(n_subs - 1, upgrades - c, max_rolls))
+
+def priority_weights(priority):
+    # 按优先级生成字典序权重: 任何数量的低优先级词条都抵不过一次高优先级词条
+    ordered = list(dict.fromkeys(priority))
+    return {stat: 64 ** (len(ordered) - i) for i, stat in enumerate(ordered)}
+
+# 词条分配结果的缓存条目数，与生成脚本中的 PLAN_CACHE_SIZE 相同
+ROLL_STATES_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=ROLL_STATES_CACHE_SIZE)
+def roll_states(piece_subs, weights, crit_stat, upgrades, max_rolls):
+    # 穷举每个部位的全部合法分配并一次性打分，再按暴击词条总数对各部位做动态规划，返回 {暴击词条总数: (得分, 各部位分配)}
+    # 结果与暴击需求无关，只是已有暴击率不同的方案 (如参数扫描中的暴击率轴) 共用同一份结果
+    # 为保持脚本无第三方依赖，没有使用 numpy 批量打分，而是用 Python 循环逐个方案累加整数权重 (每个部位 4 个副词条时只有 56 种方案，权重为 64 的幂，不会溢出)
+    weights = dict(weights)
+    per_piece = []
+    for subs in piece_subs:
+        sub_weights = [0 if stat == crit_stat else weights.get(stat, 1) for stat in subs]
+        crit_idx = subs.index(crit_stat) if crit_stat in subs else None
+        best = {}
+        for counts in roll_compositions(len(subs), upgrades, max_rolls):
+            score = sum(w * c for w, c in zip(sub_weights, counts))
+            k = counts[crit_idx] if crit_idx is not None else 0
+            if k not in best or score > best[k][0]: best[k] = (score, counts)
+        per_piece.append(best)
+    states = {0: (0, ())}
+    for best in per_piece:
+        merged = {}
+        for k0, (s0, picks) in states.items():
+            for k1, (s1, counts) in best.items():
+                if k0 + k1 not in merged or s0 + s1 > merged[k0 + k1][0]: merged[k0 + k1] = (s0 + s1, picks + (counts,))
+        states = merged
+    return states
+
+@timed('allocate_rolls')
+def allocate_rolls(piece_subs, weights, crit_per_roll, crit_needed=None, crit_stat='cpct', upgrades=5, max_rolls=6):
+    # 先保证暴击率达标 (crit_needed 为 None 时不限制暴击)，再最大化加权得分，最后使溢出的暴击率最少；crit_per_roll 为各游戏单次满值暴击率副词条的数值
+    if crit_needed is None: crit_stat = None
+    states = roll_states(tuple(map(tuple, piece_subs)), tuple(sorted(weights.items())), crit_stat, upgrades, max_rolls)
+    def rank(k):
+        if crit_needed is None or k * crit_per_roll >= crit_needed - 1e-9: return (1, states[k][0], -k)
+        return (0, k, states[k][0])
+    k = max(states, key=rank)
+    score, picks = states[k]
+    return {'rolls': [dict(zip(subs, counts)) for subs, counts in zip(piece_subs, picks)], 'crit_rolls': k, 'score': score, 'feasible': rank(k)[0] == 1}
+
+class PanelService:
+    # 常驻进程: 元数据只加载一次，按 JSON-lines 协议逐行处理请求，每个请求返回一行 JSON 结果
+    # 子类实现 op_generate/op_validate/op_list_missing；RESOLVE_KINDS 为 resolve 可查询的名称类型 -> 名称索引
+    RESOLVE_KINDS = {'character': 'char_names', 'set': 'set_names'}
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.lock = threading.Lock()
+        self.ops = {'generate': self.op_generate, 'validate': self.op_validate, 'list-missing': self.op_list_missing, 'get': self.op_get, 'resolve': self.op_resolve, 'flush': self.op_flush, 'ping': lambda request: {'plan_cache': dict(self.generator.plan_stats, size=len(self.generator.plan_cache))}}
+
+    def _target_file(self, request):
+        return self.generator.target_file_path
+
+    def _spec(self, request):
+        spec = request.get('spec', {})
+        if not isinstance(spec, dict): raise ValueError("spec 必须是对象。")
+        return spec
+
+    def op_flush(self, request):
+        return {'written': [target_file for target_file, changed in self.generator.flush().items() if changed]}
+
+    def op_get(self, request):
+        # 读取目标文件中的单个角色 (avatar_id 或 name)，文件未加载时通过字节偏移索引只解码该角色
+        target_file = self._target_file(request)
+        avatar_id = str(request.get('avatar_id') or match_name(self.generator.parser.index['char_names'], request.get('name', ''), "角色"))
+        pending = self.generator.pending_writes.get(target_file) if self.generator.pending_writes else None
+        avatar = pending.get('avatars', {}).get(avatar_id) if pending is not None else self.generator.parser.target_avatar(avatar_id, target_file)
+        if avatar is None: raise ValueError(f"{target_file} 中没有角色 {avatar_id}。")
+        return {'avatar_id': avatar_id, 'avatar': avatar}
+
+    def op_resolve(self, request):
+        # 返回名称 (可为别名或部分名称) 的候选列表，按得分排序
+        kinds, limit = self.RESOLVE_KINDS, request.get('limit', 5)
+        if request.get('kind', 'character') not in kinds: raise ValueError(f"未知的名称类型 '{request.get('kind')}' (可选: {', '.join(kinds)})。")
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1: raise ValueError("limit 必须是正整数。")
+        candidates = resolve_name(self.generator.parser.index[kinds[request.get('kind', 'character')]], request.get('name', ''), limit=limit)
+        return {'candidates': [{'id': item_id, 'name': name, 'score': score} for item_id, name, score in candidates]}
+
+    def handle_line(self, line):
+        try: request = json.loads(line)
+        except ValueError as e: return json.dumps({'ok': False, 'error': f"请求不是有效的 JSON: {e}"}, ensure_ascii=False)
+        if not isinstance(request, dict): return json.dumps({'ok': False, 'error': "请求必须是 JSON 对象"}, ensure_ascii=False)
+        response = {'id': request.get('id')}
+        with self.lock:
+            try:
+                op = self.ops.get(request.get('op'))
+                if op is None: raise ValueError(f"未知的操作 '{request.get('op')}' (可选: {', '.join(self.ops)})。")
+                self.generator.parser.refresh()
+                response.update(op(request), ok=True)
+            except Exception as e: response.update(ok=False, error=str(e))
+        return json.dumps(response, ensure_ascii=False)
+
+    def serve_stdio(self, out):
+        for line in sys.stdin:
+            if not line.strip(): continue
+            out.write(self.handle_line(line) + '\n'); out.flush()
+
+    def serve_socket(self, socket_path):
+        service = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip(): continue
+                    self.wfile.write((service.handle_line(line.decode('utf-8')) + '\n').encode('utf-8'))
+        # 只替换上次运行遗留的套接字文件，路径上已有的其他文件不删除
+        try: existing = os.lstat(socket_path)
+        except FileNotFoundError: existing = None
+        if existing is not None:
+            if not stat.S_ISSOCK(existing.st_mode): raise ValueError(f"'{socket_path}' 已存在且不是套接字，请换一个路径。")
+            os.remove(socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+            print(f"面板生成服务已启动，监听 {socket_path}", file=sys.stderr)
+            try: server.serve_forever()
+            except KeyboardInterrupt: pass
+            finally: os.remove(socket_path)
+
+def read_spec_file(spec_file):
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        if spec_file.endswith(('.yaml', '.yml')):
+            if yaml is None: raise ValueError("读取 YAML 配置需要安装 PyYAML (pip install pyyaml)，或改用 JSON 格式。")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+# load_spec 把类型不对的角色条目保留为 {SPEC_ERROR_KEY: 原因}，生成时由 check_spec 抛出，与其他出错的条目一样跳过并报告
+SPEC_ERROR_KEY = '_invalid'
+
+def check_spec(spec):
+    if SPEC_ERROR_KEY in spec: raise ValueError(spec[SPEC_ERROR_KEY])
+
+def load_spec(spec_file):
+    # 配置为角色列表或 {defaults, characters}，角色条目也可以只写名称；类型不对的条目不中断整批生成
+    spec = read_spec_file(spec_file)
+    if isinstance(spec, list): spec = {"characters": spec}
+    if not isinstance(spec, dict): raise ValueError("配置应为角色列表，或包含 defaults/characters 的对象。")
+    defaults, characters = spec.get('defaults') or {}, spec.get('characters') or []
+    if not isinstance(defaults, dict): raise ValueError("defaults 应为 {字段: 值} 形式的对象。")
+    if not isinstance(characters, list): raise ValueError("characters 应为角色列表。")
+    entries = []
+    for n, entry in enumerate(characters, 1):
+        if isinstance(entry, str): entry = {'name': entry}
+        if not isinstance(entry, dict): entries.append({SPEC_ERROR_KEY: f"characters 第 {n} 项应为对象或角色名称，而不是 {type(entry).__name__}。"}); continue
+        entries.append({**defaults, **entry})
+    return entries
+
+def expand_grid(grid):
+    # 每个轴可以写取值列表、单个值或 {from, to, step} 数值范围，返回各轴取值的笛卡尔积 (靠前的轴变化最慢)
+    axes = {}
+    for key, values in grid.items():
+        if isinstance(values, dict):
+            try: start, stop, step = float(values['from']), float(values['to']), float(values.get('step', 1))
+            except (KeyError, TypeError, ValueError): raise ValueError(f"参数 '{key}' 的范围应写为 {{from, to, step}}。")
+            if step <= 0 or stop < start: raise ValueError(f"参数 '{key}' 的范围无效。")
+            values = [round(start + i * step, 6) for i in range(int((stop - start) / step + 1e-9) + 1)]
+        elif not isinstance(values, list): values = [values]
+        if not values: raise ValueError(f"参数 '{key}' 没有取值。")
+        axes[key] = values
+    return [dict(zip(axes, combo)) for combo in itertools.product(*axes.values())]
+
+def format_grid_value(value):
+    if isinstance(value, float): return f"{value:g}"
+    if isinstance(value, list): return '+'.join(map(str, value))
+    return str(value)
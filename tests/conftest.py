@@ -0,0 +1,13 @@
+import importlib.util
+import os
+import sys
+
+# 脚本不是包，测试直接从 python/ 目录导入 panel_common；文件名含连字符的脚本按路径加载
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python')
+sys.path.insert(0, SCRIPT_DIR)
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(os.path.splitext(filename)[0].replace('-', '_'), os.path.join(SCRIPT_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,29 @@
+import json
+import os
+
+from panel_common import PanelReader
+
+def write_panel(path, avatars):
+    path.write_text(json.dumps({'uid': '100000000', 'name': '极限面板', 'avatars': avatars}, ensure_ascii=False, indent=2), encoding='utf-8')
+
+def test_index_lives_in_cache_dir(tmp_path):
+    panel_dir, cache_dir = tmp_path / 'presetPanelData', tmp_path / 'cache'
+    panel_dir.mkdir()
+    panel = panel_dir / '100000000.json'
+    write_panel(panel, {'10000002': {'name': '神里绫华', 'id': 10000002}, '10000003': {'name': '琴', 'id': 10000003}})
+    with PanelReader(str(panel), str(cache_dir)) as reader:
+        assert reader.ids() == ['10000002', '10000003']
+        assert reader.read('10000003') == {'name': '琴', 'id': 10000003}
+    # 只读命令不在面板目录中留下任何文件
+    assert os.listdir(panel_dir) == ['100000000.json']
+    assert [name.endswith('.idx') for name in os.listdir(cache_dir)] == [True]
+    # 面板文件变化后索引按大小/修改时间失效并重建
+    write_panel(panel, {'10000005': {'name': '旅行者', 'id': 10000005}})
+    with PanelReader(str(panel), str(cache_dir)) as reader:
+        assert reader.ids() == ['10000005'] and reader.read('10000005')['name'] == '旅行者'
+
+def test_index_without_cache_dir(tmp_path):
+    panel = tmp_path / '100000000.json'
+    write_panel(panel, {'10000002': {'name': '神里绫华', 'id': 10000002}})
+    with PanelReader(str(panel), None) as reader: assert reader.read('10000002')['id'] == 10000002
+    assert os.listdir(tmp_path) == ['100000000.json']
@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+from conftest import load_script
+
+tools = load_script('panel-tools.py')
+
+def avatar(avatar_id, name):
+    return {'name': name, 'id': int(avatar_id), 'artis': {}}
+
+def write_panel(path, avatar_ids):
+    data = {'uid': os.path.basename(path).split('.')[0], 'name': '极限面板', 'avatars': {i: avatar(i, f"角色{i}") for i in avatar_ids}}
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    return data
+
+def test_shard_refuses_source_directory(tmp_path):
+    # 输出目录就是面板文件所在目录时，不能删除面板文件本身与同目录的其他面板
+    source, sibling = tmp_path / '100000000.json', tmp_path / '100000001.json'
+    write_panel(source, ['10000002', '10000003']); write_panel(sibling, ['10000005'])
+    with pytest.raises(ValueError, match=tools.MANIFEST_FILE):
+        tools.shard_panel_file(str(source), str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['100000000.json', '100000001.json']
+
+def test_reshard_removes_only_previous_shards(tmp_path):
+    source, shard_dir = tmp_path / '100000000.json', tmp_path / 'shards'
+    write_panel(source, ['10000002', '10000003'])
+    assert tools.shard_panel_file(str(source), str(shard_dir)) == (2, 2)
+    (shard_dir / 'notes.json').write_text('{}', encoding='utf-8')
+    data = write_panel(source, ['10000002'])
+    tools.shard_panel_file(str(source), str(shard_dir))
+    assert sorted(os.listdir(shard_dir)) == ['10000002.json', tools.MANIFEST_FILE, 'notes.json']
+    out = tmp_path / 'merged.json'
+    tools.unshard_panel_dir(str(shard_dir), str(out))
+    assert json.loads(out.read_text(encoding='utf-8')) == data
+
+def test_shard_into_empty_directory(tmp_path):
+    source, shard_dir = tmp_path / '100000000.json', tmp_path / 'shards'
+    write_panel(source, ['10000002'])
+    shard_dir.mkdir()
+    assert tools.shard_panel_file(str(source), str(shard_dir)) == (1, 1)
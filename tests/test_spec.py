@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from panel_common import SPEC_ERROR_KEY, check_spec, load_spec
+
+def write_spec(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding='utf-8')
+    return str(path)
+
+def test_non_dict_entry_is_reported_not_fatal(tmp_path):
+    spec_file = write_spec(tmp_path, 'spec.json', json.dumps({'defaults': {'mode': 'nuke'}, 'characters': [5, '甲', {'name': '乙'}, [1]]}, ensure_ascii=False))
+    entries = load_spec(spec_file)
+    assert len(entries) == 4
+    assert entries[1] == {'mode': 'nuke', 'name': '甲'} and entries[2] == {'mode': 'nuke', 'name': '乙'}
+    for n, entry in ((1, entries[0]), (4, entries[3])):
+        assert SPEC_ERROR_KEY in entry and 'name' not in entry
+        with pytest.raises(ValueError, match=f"第 {n} 项"): check_spec(entry)
+    check_spec(entries[1])
+
+def test_non_dict_entry_in_yaml(tmp_path):
+    pytest.importorskip('yaml')
+    entries = load_spec(write_spec(tmp_path, 'spec.yaml', "- 5\n- name: 甲\n"))
+    with pytest.raises(ValueError, match="int"): check_spec(entries[0])
+    assert entries[1] == {'name': '甲'}
+
+def test_invalid_top_level_still_rejected(tmp_path):
+    with pytest.raises(ValueError): load_spec(write_spec(tmp_path, 'spec.json', '{"characters": 5}'))